@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+import pytest
+
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage
+
+MESSAGES = 10000
+
+
+@pytest.mark.parametrize('flush_queue_size', [10, 100, 1000])
+def test_consumer_throughput(benchmark, flush_queue_size):
+    batches = []
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=lambda batch, stop_event: batches.append(len(batch)),
+        flush_queue_size=flush_queue_size,
+        flush_interval=timedelta(seconds=10),
+    )
+    consumer.start()
+    message = AsyncConsumerMessage('events', {'event_type': 'event'})
+
+    def enqueue_and_flush():
+        for _ in range(MESSAGES):
+            q.put(message)
+        consumer.flush()
+
+    try:
+        benchmark(enqueue_and_flush)
+    finally:
+        consumer.shutdown()
+
+    benchmark.extra_info['messages_per_round'] = MESSAGES
+    benchmark.extra_info['mean_batch_size'] = sum(batches) / len(batches)
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from itly_sdk.internal import ColumnarBatch
+
+EVENT_NAMES = ['Page Viewed', 'Button Clicked', 'Signed Up', 'Purchase Completed']
+
+
+def _events(count: int):
+    return [
+        {
+            "user_id": f"user-{i % 500}",
+            "event_type": EVENT_NAMES[i % len(EVENT_NAMES)],
+            "event_properties": {"index": i, "label": "value"},
+            "time": 1600000000000 + i,
+            "insert_id": f"insert-{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def _file_records(count: int):
+    """Records like FilePlugin writes them, of several types with different fields"""
+    records = []
+    for i in range(count):
+        if i % 10 == 0:
+            records.append({"type": "identify", "user_id": f"user-{i % 500}", "properties": {"plan": "pro"},
+                            "time": 1600000000000 + i})
+            continue
+        record = {"type": "track", "user_id": f"user-{i % 500}", "event_name": EVENT_NAMES[i % len(EVENT_NAMES)],
+                  "properties": {"index": i, "label": "value"}, "time": 1600000000000 + i}
+        if i % 3 == 0:
+            record["insert_id"] = f"insert-{i}"
+        records.append(record)
+    return records
+
+
+@pytest.mark.parametrize('events', [100, 10000])
+def test_encode_rows_ndjson(benchmark, events):
+    rows = _events(events)
+    benchmark(lambda: '\n'.join(json.dumps(row, separators=(',', ':')) for row in rows).encode('utf-8'))
+
+
+@pytest.mark.parametrize('events', [100, 10000])
+def test_encode_columnar_ndjson(benchmark, events):
+    rows = _events(events)
+
+    # Includes building the batch, compared with test_encode_rows_ndjson which encodes the rows as they are
+    def build_and_encode():
+        batch = ColumnarBatch()
+        batch.extend(rows)
+        return batch.to_ndjson()
+
+    benchmark(build_and_encode)
+
+
+@pytest.mark.parametrize('events', [100, 10000])
+def test_encode_columnar_arrow_ipc(benchmark, events):
+    pytest.importorskip('pyarrow')
+    batch = ColumnarBatch()
+    batch.extend(_events(events))
+    benchmark(batch.to_arrow_ipc)
+
+
+def test_rows_memory(benchmark, measure_memory):
+    rows = _events(10000)
+
+    # Memory of the batch structure only, event values are shared with `rows`
+    benchmark(lambda: [dict(row) for row in rows])
+    measure_memory(lambda: [dict(row) for row in rows])
+
+
+def test_columnar_memory(benchmark, measure_memory):
+    rows = _events(10000)
+
+    def columnar():
+        batch = ColumnarBatch()
+        batch.extend(rows)
+        return batch
+
+    benchmark(columnar)
+    measure_memory(columnar)
+
+
+@pytest.mark.parametrize('records', [100, 10000])
+def test_encode_file_records_rows_ndjson(benchmark, records):
+    rows = _file_records(records)
+    benchmark(lambda: ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows).encode('utf-8'))
+
+
+@pytest.mark.parametrize('records', [100, 10000])
+def test_encode_file_records_columnar_ndjson(benchmark, records):
+    rows = _file_records(records)
+
+    # Same as FileClient writing a batch
+    def build_and_encode():
+        batch = ColumnarBatch(dictionary_fields=('type', 'event_name'))
+        batch.extend(rows)
+        return batch.to_ndjson()
+
+    benchmark(build_and_encode)
@@ -0,0 +1,84 @@
+import enum
+
+import pytest
+
+from itly_sdk import Itly, Options, Plugin, Event, Properties, Environment
+
+
+class NoopPlugin(Plugin):
+    def __init__(self, index: int) -> None:
+        self._index = index
+
+    def id(self) -> str:
+        return f'noop-{self._index}'
+
+    def track(self, user_id: str, event: Event) -> None:
+        pass
+
+
+class SerializingPlugin(NoopPlugin):
+    def track(self, user_id: str, event: Event) -> None:
+        event.properties.to_json() if event.properties is not None else None
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+def _properties() -> Properties:
+    return Properties(string='value', number=42, boolean=True, array=['a', 'b'], color=Color.RED, missing=None)
+
+
+def _load(plugins: int, plugin_class: type = NoopPlugin, context: bool = True) -> Itly:
+    itly = Itly()
+    itly.load(
+        context=Properties(app_version='1.0.0', platform='server') if context else None,
+        options=Options(environment=Environment.PRODUCTION, plugins=[plugin_class(i) for i in range(plugins)]),
+    )
+    return itly
+
+
+@pytest.mark.parametrize('plugins', range(8))
+def test_track_dispatch(benchmark, measure_memory, plugins):
+    itly = _load(plugins)
+    event = Event('event', _properties())
+
+    benchmark(itly.track, 'user-id', event)
+    measure_memory(lambda: itly.track('user-id', event))
+
+
+@pytest.mark.parametrize('plugins', [1, 7])
+def test_track_dispatch_serializing_plugins(benchmark, measure_memory, plugins):
+    itly = _load(plugins, SerializingPlugin)
+    event = Event('event', _properties())
+
+    benchmark(itly.track, 'user-id', event)
+    measure_memory(lambda: itly.track('user-id', event))
+
+
+def test_track_without_context(benchmark, measure_memory):
+    itly = _load(1, context=False)
+    event = Event('event', _properties())
+
+    benchmark(itly.track, 'user-id', event)
+    measure_memory(lambda: itly.track('user-id', event))
+
+
+def test_properties_construction(benchmark, measure_memory):
+    benchmark(_properties)
+    measure_memory(_properties)
+
+
+def test_properties_concat(benchmark, measure_memory):
+    context = Properties(app_version='1.0.0', platform='server')
+    properties = _properties()
+
+    benchmark(Properties.concat, [context, properties])
+    measure_memory(lambda: Properties.concat([context, properties]))
+
+
+def test_properties_to_json(benchmark, measure_memory):
+    properties = _properties()
+
+    benchmark(properties.to_json)
+    measure_memory(properties.to_json)
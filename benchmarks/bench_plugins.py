@@ -0,0 +1,189 @@
+import tempfile
+import urllib.parse
+from unittest import mock
+from json import dumps
+from datetime import timedelta
+from typing import Any, Callable, Dict
+
+import pytest
+import requests
+
+from itly_sdk import Plugin, PluginLoadOptions, Environment, Logger, Event, Properties
+
+EVENTS_PER_ROUND = 100
+
+load_options = PluginLoadOptions(environment=Environment.PRODUCTION, logger=Logger.NONE)
+
+
+class StubResponse:
+    def __init__(self, status_code: int = 200, body: Any = None) -> None:
+        self.status_code = status_code
+        self._body = body if body is not None else {}
+        self.text = dumps(self._body)
+        self.content = self.text.encode('utf-8')
+
+    def json(self) -> Any:
+        return self._body
+
+
+class StubSession:
+    """Replaces requests.Session, serializing the payload like requests would but never hitting the network."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.bytes = 0
+
+    def post(self, url: str, json: Any = None, data: Any = None, **kwargs: Any) -> StubResponse:
+        if json is not None:
+            body = dumps(json)
+        else:
+            # Already encoded bodies are sent as is
+            body = data if isinstance(data, (bytes, str)) else urllib.parse.urlencode(data)
+        self.requests += 1
+        self.bytes += len(body)
+        return StubResponse()
+
+    def get(self, url: str, params: Any = None, **kwargs: Any) -> StubResponse:
+        self.requests += 1
+        self.bytes += len(urllib.parse.urlencode(params or {}))
+        return StubResponse()
+
+    def mount(self, prefix: str, adapter: Any) -> None:
+        pass
+
+
+class StubMixpanelSession(StubSession):
+    def post(self, url: str, json: Any = None, data: Any = None, **kwargs: Any) -> StubResponse:
+        super().post(url, json=json, data=data, **kwargs)
+        return StubResponse(body={'status': 1})
+
+
+class StubRequests(StubSession):
+    """Replaces the requests module used by Snowplow emitters, which send with requests.post and requests.get"""
+    RequestException = requests.RequestException
+
+
+def _load_with_stub_session(plugin: Plugin, session_class: Callable[[], StubSession] = StubSession) -> Plugin:
+    """Load a plugin, its HTTP transport creates a StubSession instead of a requests.Session"""
+    with mock.patch('requests.Session', session_class):
+        plugin.load(load_options)
+    return plugin
+
+
+def _amplitude() -> Plugin:
+    from itly_plugin_amplitude import AmplitudePlugin, AmplitudeOptions
+    return _load_with_stub_session(AmplitudePlugin('api-key', AmplitudeOptions(flush_interval=timedelta(seconds=10))))
+
+
+def _braze() -> Plugin:
+    from itly_plugin_braze import BrazePlugin, BrazeOptions
+    return _load_with_stub_session(
+        BrazePlugin('api-key', BrazeOptions(base_url='http://localhost', flush_interval=timedelta(seconds=10))))
+
+
+# Removed when the benchmark process exits
+_directories = []
+# Active until the benchmark process exits
+_patches = []
+
+
+def _file() -> Plugin:
+    from itly_plugin_file import FilePlugin, FileOptions
+    directory = tempfile.TemporaryDirectory()
+    _directories.append(directory)
+    plugin = FilePlugin(directory.name, FileOptions(flush_interval=timedelta(seconds=10)))
+    plugin.load(load_options)
+    return plugin
+
+
+def _iteratively() -> Plugin:
+    from itly_plugin_iteratively import IterativelyPlugin, IterativelyOptions
+    return _load_with_stub_session(
+        IterativelyPlugin('api-key', 'http://localhost',
+                          IterativelyOptions(disabled=False, flush_interval=timedelta(seconds=10))))
+
+
+def _mixpanel() -> Plugin:
+    from itly_plugin_mixpanel import MixpanelPlugin, MixpanelOptions
+    return _load_with_stub_session(MixpanelPlugin('api-key', MixpanelOptions(flush_queue_size=50)),
+                                   session_class=StubMixpanelSession)
+
+
+def _segment() -> Plugin:
+    from itly_plugin_segment import SegmentPlugin, SegmentOptions
+    plugin = SegmentPlugin('write-key', SegmentOptions(send=False))
+    plugin.load(load_options)
+    return plugin
+
+
+def _snowplow() -> Plugin:
+    from itly_plugin_snowplow import SnowplowPlugin, SnowplowOptions
+    plugin = SnowplowPlugin('com.example', SnowplowOptions(endpoint='localhost', buffer_size=EVENTS_PER_ROUND))
+    if not _patches:
+        _patches.append(mock.patch('snowplow_tracker.emitters.requests', StubRequests()))
+        _patches[0].start()
+    plugin.load(load_options)
+    return plugin
+
+
+PLUGINS: Dict[str, Callable[[], Plugin]] = {
+    'amplitude': _amplitude,
+    'braze': _braze,
+    'file': _file,
+    'iteratively': _iteratively,
+    'mixpanel': _mixpanel,
+    'segment': _segment,
+    'snowplow': _snowplow,
+}
+
+
+def _event(i: int) -> Event:
+    return Event('event', Properties(string='value', number=i, boolean=True, array=['a', 'b']),
+                 id_='event', version='1.0.0')
+
+
+@pytest.mark.parametrize('plugin_id', sorted(PLUGINS.keys()))
+def test_plugin_track(benchmark, measure_memory, plugin_id):
+    plugin = PLUGINS[plugin_id]()
+    event = _event(0)
+    try:
+        benchmark(plugin.track, 'user-id', event)
+        measure_memory(lambda: plugin.track('user-id', event))
+    finally:
+        plugin.shutdown()
+
+
+@pytest.mark.parametrize('plugin_id', sorted(PLUGINS.keys()))
+def test_plugin_track_and_upload(benchmark, plugin_id):
+    plugin = PLUGINS[plugin_id]()
+    events = [_event(i) for i in range(EVENTS_PER_ROUND)]
+
+    def track_and_flush():
+        for event in events:
+            plugin.track('user-id', event)
+        plugin.flush()
+
+    try:
+        benchmark(track_and_flush)
+    finally:
+        plugin.shutdown()
+
+    benchmark.extra_info['events_per_round'] = EVENTS_PER_ROUND
+
+
+@pytest.mark.parametrize('event_metadata', [False, True])
+def test_amplitude_track_with_metadata(benchmark, measure_memory, event_metadata):
+    from itly_plugin_amplitude import AmplitudePlugin, AmplitudeOptions, AmplitudeMetadata
+    metadata = AmplitudeMetadata(app_version='1.0.0', platform='server', os_name='linux', country='US',
+                                 language='en')
+    plugin = _load_with_stub_session(
+        AmplitudePlugin('api-key', AmplitudeOptions(flush_interval=timedelta(seconds=10), metadata=metadata)))
+    event = _event(0)
+    if event_metadata:
+        event = Event(event.name, event.properties, id_=event.id, version=event.version,
+                      metadata={'amplitude': AmplitudeMetadata(device_id='device-id')})
+    try:
+        benchmark(plugin.track, 'user-id', event)
+        measure_memory(lambda: plugin.track('user-id', event))
+    finally:
+        plugin.shutdown()
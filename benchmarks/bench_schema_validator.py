@@ -0,0 +1,42 @@
+import json
+
+from itly_plugin_schema_validator import SchemaValidatorPlugin
+from itly_sdk import Event, Properties, PluginLoadOptions, Environment, Logger
+
+SCHEMA = json.dumps({
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "properties": {
+        "string": {"type": "string"},
+        "number": {"type": "number", "maximum": 100},
+        "boolean": {"type": "boolean"},
+        "array": {"type": "array", "items": {"type": "string"}},
+        "color": {"enum": ["red", "green"]},
+    },
+    "additionalProperties": False,
+    "required": ["string", "number"],
+})
+
+SCHEMAS = {f'event-{i}': SCHEMA for i in range(500)}
+
+load_options = PluginLoadOptions(environment=Environment.PRODUCTION, logger=Logger.NONE)
+
+
+def test_validate(benchmark, measure_memory):
+    plugin = SchemaValidatorPlugin(SCHEMAS)
+    plugin.load(load_options)
+    event = Event('event-1', Properties(string='value', number=42, boolean=True, array=['a', 'b'], color='red'))
+
+    benchmark(plugin.validate, event)
+    measure_memory(lambda: plugin.validate(event))
+
+
+def test_load(benchmark):
+    benchmark(lambda: SchemaValidatorPlugin(SCHEMAS).load(load_options))
+
+
+def test_load_from_cache(benchmark, tmp_path):
+    cache_path = str(tmp_path / 'tracking-plan.json')
+    SchemaValidatorPlugin(SCHEMAS, cache_path=cache_path).load(load_options)
+
+    benchmark(lambda: SchemaValidatorPlugin(SCHEMAS, cache_path=cache_path).load(load_options))
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from itly_sdk import PluginLoadOptions, Environment, Logger, Event, Properties
+from itly_sdk.internal import HttpRequest, HttpResponse
+
+EVENTS_PER_ROUND = 1000
+# Simulated round trip of an upload request
+LATENCY = 0.02
+
+load_options = PluginLoadOptions(environment=Environment.PRODUCTION, logger=Logger.NONE)
+
+
+class SlowTransport:
+    def send(self, request: HttpRequest) -> HttpResponse:
+        time.sleep(LATENCY)
+        return HttpResponse(status_code=200, content=b'{}')
+
+
+class SlowAsyncTransport:
+    async def send(self, request: HttpRequest) -> HttpResponse:
+        await asyncio.sleep(LATENCY)
+        return HttpResponse(status_code=200, content=b'{}')
+
+    async def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def event_loop_thread():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def _run(benchmark, plugin):
+    event = Event('Event', Properties(count=1))
+
+    def track_and_flush():
+        for _ in range(EVENTS_PER_ROUND):
+            plugin.track('user-id', event)
+        plugin.flush()
+
+    try:
+        benchmark(track_and_flush)
+    finally:
+        plugin.shutdown()
+    benchmark.extra_info['events_per_round'] = EVENTS_PER_ROUND
+    benchmark.extra_info['latency'] = LATENCY
+
+
+@pytest.mark.parametrize('flush_queue_size', [10, 100])
+def test_amplitude_thread(benchmark, flush_queue_size):
+    from itly_plugin_amplitude import AmplitudePlugin, AmplitudeOptions
+    plugin = AmplitudePlugin('api-key', AmplitudeOptions(flush_queue_size=flush_queue_size,
+                                                         flush_interval=timedelta(seconds=10)))
+    plugin.load(load_options)
+    plugin._client._transport = SlowTransport()
+    _run(benchmark, plugin)
+
+
+@pytest.mark.parametrize('flush_queue_size', [10, 100])
+def test_amplitude_asyncio(benchmark, event_loop_thread, flush_queue_size):
+    pytest.importorskip('httpx')
+    from itly_plugin_amplitude import AmplitudePlugin, AmplitudeOptions
+    plugin = AmplitudePlugin('api-key', AmplitudeOptions(flush_queue_size=flush_queue_size,
+                                                         flush_interval=timedelta(seconds=10),
+                                                         event_loop=event_loop_thread))
+    plugin.load(load_options)
+    plugin._client._async_transport = SlowAsyncTransport()
+    _run(benchmark, plugin)
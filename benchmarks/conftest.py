@@ -0,0 +1,48 @@
+import tracemalloc
+from typing import Callable, Any, Dict
+
+import pytest
+
+
+def _memory_per_call(func: Callable[[], Any], rounds: int = 200) -> Dict[str, float]:
+    # Warm up caches (memoized plans, interned strings) so that they are not counted
+    for _ in range(10):
+        func()
+
+    tracemalloc.start()
+    try:
+        peak_bytes = 0
+        for _ in range(rounds):
+            tracemalloc.stop()
+            tracemalloc.start()
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+            peak_bytes += peak
+
+        before = tracemalloc.take_snapshot()
+        for _ in range(rounds):
+            func()
+        after = tracemalloc.take_snapshot()
+        retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'peak_bytes_per_call': peak_bytes / rounds,
+        'retained_blocks_per_call': retained_blocks / rounds,
+    }
+
+
+@pytest.fixture
+def measure_memory(benchmark: Any) -> Callable[[Callable[[], Any]], None]:
+    """
+    Store the memory used by a single call of `func` with the benchmark results.
+
+    `peak_bytes_per_call` is the peak of memory allocated during the call, i.e. the cost of temporary objects.
+    `retained_blocks_per_call` is the number of memory blocks still allocated after the call, e.g. queued messages.
+    """
+
+    def measure(func: Callable[[], Any]) -> None:
+        benchmark.extra_info.update(_memory_per_call(func))
+
+    return measure
@@ -9,6 +9,7 @@ from werkzeug.wrappers import Request
 sys.path.extend([
     './packages/plugin-amplitude',
     './packages/plugin-braze',
+    './packages/plugin-file',
     './packages/plugin-iteratively',
     './packages/plugin-mixpanel',
     './packages/plugin-schema-validator',
@@ -1,2 +1,3 @@
 from ._amplitude_plugin import AmplitudePlugin, AmplitudeOptions
 from ._amplitude_metadata import AmplitudeMetadata
+from ._amplitude_client import AmplitudeDeadLetter
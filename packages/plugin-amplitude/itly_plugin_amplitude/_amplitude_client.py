@@ -1,15 +1,29 @@
+import asyncio
 import atexit
 import json
 import queue
 import time
+from collections import deque
 from datetime import timedelta
-from threading import Event
-from typing import Dict, Callable, List, Optional, NamedTuple, Any
+from threading import Event, Lock
+from typing import Dict, Callable, List, Optional, NamedTuple, Any, Mapping, Deque, Set, Tuple
 
-from requests import Session
+from itly_sdk import Metrics, ShutdownResult
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, AsyncIOConsumer, Delay, HttpRequest, \
+    HttpResponse, HttpTransportError, HttpxTransport, KeyedTokenBucket, RequestsTransport, SharedUploaderClient, \
+    UploadSteps, backoff, register_after_fork, run_upload, run_upload_async, start_shared_uploader_process
 
-from itly_plugin_amplitude._amplitude_metadata import AmplitudeMetadata
-from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage
+# https://www.docs.developers.amplitude.com/analytics/apis/http-v2-api/#upload-limit
+HTTP_API_MAX_PAYLOAD_SIZE = 1024 * 1024
+# https://www.docs.developers.amplitude.com/analytics/apis/batch-event-upload-api/#upload-limit
+BATCH_API_MAX_PAYLOAD_SIZE = 20 * 1024 * 1024
+# Throttled requests are retried with increasing delays up to the 30 seconds pause recommended by Amplitude
+THROTTLE_MAX_RETRIES = 4
+THROTTLE_MAX_DELAY = 30.0
+# https://www.docs.developers.amplitude.com/analytics/apis/http-v2-api/#400-bad-request
+INVALID_EVENTS_FIELDS = ("events_with_invalid_fields", "events_with_missing_fields", "events_with_invalid_id_lengths")
+# Errors of 400 responses that apply to the whole request
+REQUEST_ERROR_MARKERS = ("invalid api key", "invalid api_key", "missing api key", "missing api_key")
 
 
 class Endpoint(NamedTuple):
@@ -17,10 +31,14 @@ class Endpoint(NamedTuple):
     is_json: bool
 
 
-class Request(NamedTuple):
-    url: str
-    is_json: bool
-    data: Any
+class EncodedEvent(NamedTuple):
+    data: Dict[str, Any]
+    json: str
+
+
+class AmplitudeDeadLetter(NamedTuple):
+    event: Dict[str, Any]
+    error: str
 
 
 class AmplitudeClient:
@@ -32,76 +50,375 @@ class AmplitudeClient:
                  request_timeout: timedelta,
                  min_id_length: Optional[int],
                  events_endpoint: Optional[str],
-                 identification_endpoint: Optional[str]) -> None:
+                 identification_endpoint: Optional[str],
+                 metrics: Metrics = Metrics.NONE,
+                 shared_uploader_socket: Optional[str] = None,
+                 event_loop: Optional[asyncio.AbstractEventLoop] = None,
+                 batch_mode: bool = False,
+                 identify_as_event: bool = False,
+                 max_dead_letters: int = 1000,
+                 max_events_per_user_per_second: Optional[float] = None,
+                 user_burst: Optional[float] = None,
+                 group_identification_endpoint: Optional[str] = None) -> None:
         self._api_key = api_key
         self._request_timeout = request_timeout
         self._min_id_length = min_id_length
         self._on_error = on_error
-        self._queue: queue.Queue = AsyncConsumer.create_queue()
+        self._metrics = metrics
+        self._flush_queue_size = flush_queue_size
+        self._flush_interval = flush_interval
+        self._identify_as_event = identify_as_event
+        self._dead_letters: Deque[AmplitudeDeadLetter] = deque(maxlen=max_dead_letters)
+        self._dead_letters_lock = Lock()
+        self._user_buckets: Optional[KeyedTokenBucket] = None
+        if max_events_per_user_per_second is not None:
+            self._user_buckets = KeyedTokenBucket(
+                rate=max_events_per_user_per_second,
+                capacity=user_burst if user_burst is not None else max_events_per_user_per_second)
+        default_events_endpoint = "https://api2.amplitude.com/batch" if batch_mode else "https://api.amplitude.com/2/httpapi"
+        self._max_payload_size = BATCH_API_MAX_PAYLOAD_SIZE if batch_mode else HTTP_API_MAX_PAYLOAD_SIZE
+        options = f', "options": {json.dumps({"min_id_length": min_id_length})}' if min_id_length is not None else ''
+        self._events_body_prefix = f'{{"api_key": {json.dumps(api_key)}, "events": ['
+        self._events_body_suffix = f']{options}}}'
         self._endpoints = {
-            "events": Endpoint(url=events_endpoint or "https://api.amplitude.com/2/httpapi", is_json=True),
+            "events": Endpoint(url=events_endpoint or default_events_endpoint, is_json=True),
             "identification": Endpoint(url=identification_endpoint or "https://api.amplitude.com/identify",
                                        is_json=False),
+            "group_identification": Endpoint(
+                url=group_identification_endpoint or "https://api.amplitude.com/groupidentify", is_json=False),
         }
-        self._session = Session()
-        self._consumer = AsyncConsumer(message_queue=self._queue,
-                                       do_upload=self._upload_batch,
-                                       flush_queue_size=flush_queue_size,
-                                       flush_interval=flush_interval)
+        self._shared_uploader: Optional[SharedUploaderClient] = None
+        self._consumer: Optional[AsyncConsumer] = None
+        self._asyncio_consumer: Optional[AsyncIOConsumer] = None
+        if shared_uploader_socket is not None:
+            # Events are batched and uploaded by a separate process shared with other workers
+            _check_shared_uploader_options(metrics, event_loop)
+            config = {
+                "api_key": api_key,
+                "flush_queue_size": flush_queue_size,
+                "flush_interval": flush_interval.total_seconds(),
+                "request_timeout": request_timeout.total_seconds(),
+                "min_id_length": min_id_length,
+                "events_endpoint": events_endpoint,
+                "identification_endpoint": identification_endpoint,
+                "batch_mode": batch_mode,
+                "max_events_per_user_per_second": max_events_per_user_per_second,
+                "user_burst": user_burst,
+                "group_identification_endpoint": group_identification_endpoint,
+                "max_dead_letters": max_dead_letters,
+            }
+            socket_path = shared_uploader_socket
+            self._shared_uploader = SharedUploaderClient(
+                socket_path=socket_path,
+                start_server=lambda: start_shared_uploader_process(
+                    "itly_plugin_amplitude._shared_uploader", socket_path, config),
+                on_error=on_error)
+            return
+
+        if event_loop is not None:
+            # Batches are uploaded by tasks on the application's event loop, sharing one connection pool
+            self._async_transport = HttpxTransport(request_timeout)
+            self._asyncio_consumer = AsyncIOConsumer(loop=event_loop,
+                                                     do_upload=self._upload_batch_async,
+                                                     flush_queue_size=flush_queue_size,
+                                                     flush_interval=flush_interval,
+                                                     metrics=metrics)
+            atexit.register(self.shutdown)
+            self._asyncio_consumer.start()
+            return
+
+        self._queue: queue.Queue = AsyncConsumer.create_queue()
+        self._transport = RequestsTransport(request_timeout)
+        self._consumer = self._create_consumer()
         atexit.register(self.shutdown)
+        register_after_fork(self._reset_after_fork)
+        self._consumer.start()
+
+    def _create_consumer(self) -> AsyncConsumer:
+        return AsyncConsumer(message_queue=self._queue,
+                             do_upload=self._upload_batch,
+                             flush_queue_size=self._flush_queue_size,
+                             flush_interval=self._flush_interval,
+                             metrics=self._metrics)
+
+    def _reset_after_fork(self) -> None:
+        # The consumer thread doesn't exist in the child and queued messages are uploaded by the parent
+        self._queue = AsyncConsumer.create_queue()
+        self._transport = RequestsTransport(self._request_timeout)
+        self._consumer = self._create_consumer()
         self._consumer.start()
 
-    def track(self, user_id: str, event_name: str, properties: Optional[Dict[str, Any]], metadata: Optional[AmplitudeMetadata]) -> None:
-        data = {k: v for (k, v) in vars(metadata).items() if v is not None} if metadata is not None else {}
+    def track(self, user_id: str, event_name: str, properties: Optional[Dict[str, Any]], metadata: Mapping[str, Any],
+              insert_id: Optional[str] = None) -> None:
+        data = dict(metadata)
         data["user_id"] = user_id
         data["event_type"] = event_name
         data["event_properties"] = properties if properties is not None else {}
+        if insert_id is not None:
+            data["insert_id"] = insert_id
         if "time" not in data:
             data["time"] = int(time.time() * 1000)
         self._enqueue(AsyncConsumerMessage("events", data))
 
-    def identify(self, user_id: str, properties: Optional[Dict[str, Any]], metadata: Optional[AmplitudeMetadata]) -> None:
-        data = {k: v for (k, v) in vars(metadata).items() if v is not None} if metadata is not None else {}
+    def identify(self, user_id: str, properties: Optional[Dict[str, Any]], metadata: Mapping[str, Any]) -> None:
+        data = dict(metadata)
         data["user_id"] = user_id
+        if self._identify_as_event:
+            # Sent in the events batch, so that identifies don't cut batches of tracks short
+            data["event_type"] = "$identify"
+            data["user_properties"] = {"$set": properties} if properties else {}
+            if "time" not in data:
+                data["time"] = int(time.time() * 1000)
+            self._enqueue(AsyncConsumerMessage("events", data))
+            return
         data["user_properties"] = properties if properties is not None else {}
         self._enqueue(AsyncConsumerMessage("identification", data))
 
-    def _upload_batch(self, batch: List[AsyncConsumerMessage], stop_event: Event) -> None:
-        message_type = batch[0].message_type
-        endpoint_url, is_json = self._endpoints[message_type]
+    def group_identify(self, group_type: str, group_value: str, properties: Optional[Dict[str, Any]]) -> None:
+        data = {
+            "group_type": group_type,
+            "group_value": group_value,
+            "group_properties": properties if properties is not None else {},
+        }
+        self._enqueue(AsyncConsumerMessage("group_identification", data))
+
+    def _upload_batch(self, batch: List[AsyncConsumerMessage], stop_event: Event) -> int:
         try:
-            if message_type == "events":
-                data = {
-                    "events": [message.data for message in batch],
-                    "api_key": self._api_key,
-                }
-                if self._min_id_length is not None:
-                    data["options"] = {"min_id_length": self._min_id_length}
-            else:
-                data = {
-                    "identification": json.dumps([message.data for message in batch]),
-                    "api_key": self._api_key
-                }
-            self._send_request(Request(url=endpoint_url, is_json=is_json, data=data))
+            # None when the upload was abandoned on shutdown
+            return run_upload(self._upload_steps(batch), self._transport, stop_event, self._metrics) or 0
+        except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
+            self._on_error(str(e))
+            return 0
+
+    async def _upload_batch_async(self, batch: List[AsyncConsumerMessage]) -> int:
+        try:
+            return await run_upload_async(self._upload_steps(batch), self._async_transport, self._metrics) or 0
         except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
             self._on_error(str(e))
+            return 0
 
-    def _send_request(self, request: Request) -> None:
-        if request.is_json:
-            response = self._session.post(request.url, json=request.data, timeout=self._request_timeout.total_seconds())
+    def _upload_steps(self, batch: List[AsyncConsumerMessage]) -> UploadSteps[int]:
+        """Upload a batch and return the number of delivered messages"""
+        if batch[0].message_type in ("events", "deferred_events"):
+            # Deferred events already waited for their user's rate, and are never deferred again
+            if batch[0].message_type == "events" and self._user_buckets is not None:
+                batch = self._defer_hot_users(batch)
+                if len(batch) == 0:
+                    return 0
+            return (yield from self._upload_events([EncodedEvent(message.data, json.dumps(message.data))
+                                                    for message in batch]))
+
+        message_type = batch[0].message_type
+        endpoint_url = self._endpoints[message_type].url
+        if message_type == "group_identification":
+            identifications = self._coalesce_group_identifications(batch)
         else:
-            response = self._session.post(request.url, data=request.data, timeout=self._request_timeout.total_seconds())
+            identifications = [message.data for message in batch]
+        data = {
+            "identification": json.dumps(identifications),
+            "api_key": self._api_key
+        }
+        response = yield HttpRequest(url=endpoint_url, data=data)
+        assert response is not None
         if response.status_code >= 300:
-            self._on_error(f'Unexpected status code for {request.url}: {response.status_code}')
+            self._metrics.increment('itly.client.dropped_events', len(batch))
+            self._on_error(f'Unexpected status code for {endpoint_url}: {response.status_code}')
+            return 0
+        return len(batch)
+
+    @staticmethod
+    def _coalesce_group_identifications(batch: List[AsyncConsumerMessage]) -> List[Dict[str, Any]]:
+        """Merge updates of the same group within a batch into one, later properties win"""
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for message in batch:
+            key = (message.data["group_type"], message.data["group_value"])
+            group = groups.get(key)
+            if group is None:
+                groups[key] = {**message.data, "group_properties": dict(message.data["group_properties"])}
+            else:
+                group["group_properties"].update(message.data["group_properties"])
+        return list(groups.values())
+
+    def _defer_hot_users(self, batch: List[AsyncConsumerMessage]) -> List[AsyncConsumerMessage]:
+        """Return events of users within their rate, and hold the others until their user's bucket refilled"""
+        assert self._user_buckets is not None
+        allowed: List[AsyncConsumerMessage] = []
+        deferred = 0
+        for message in batch:
+            key = message.data.get("user_id") or message.data.get("device_id")
+            delay = self._user_buckets.reserve(key)
+            if delay == 0:
+                allowed.append(message)
+                continue
+            deferred += 1
+            deferred_message = AsyncConsumerMessage("deferred_events", message.data)
+            if self._asyncio_consumer is not None:
+                self._asyncio_consumer.defer(deferred_message, delay)
+            else:
+                assert self._consumer is not None
+                self._consumer.defer(deferred_message, delay)
+        if deferred > 0:
+            self._metrics.increment('itly.client.deferred_events', deferred)
+        return allowed
+
+    def _upload_events(self, events: List[EncodedEvent]) -> UploadSteps[int]:
+        endpoint_url = self._endpoints["events"].url
+        delivered = 0
+        throttle_delays = backoff(start=1.0, stop=THROTTLE_MAX_DELAY, count=THROTTLE_MAX_RETRIES)
+        # Events are encoded once, requests over the payload limit are split by joining fewer of them
+        chunks = [events]
+        while len(chunks) > 0:
+            chunk = chunks.pop(0)
+            body = (self._events_body_prefix + ', '.join(event.json for event in chunk) + self._events_body_suffix).encode()
+            if len(body) > self._max_payload_size and len(chunk) > 1:
+                chunks[0:0] = _split(chunk)
+                continue
+
+            try:
+                response = yield HttpRequest(url=endpoint_url, content=body,
+                                             headers={'Content-Type': 'application/json'})
+            except HttpTransportError as e:
+                self._metrics.increment('itly.client.dropped_events', len(chunk) + sum(len(c) for c in chunks))
+                self._on_error(str(e))
+                return delivered
+            assert response is not None
+            if response.status_code < 300:
+                delivered += len(chunk)
+                continue
+            if response.status_code == 413:
+                # Payload too large
+                if len(chunk) > 1:
+                    chunks[0:0] = _split(chunk)
+                else:
+                    self._add_dead_letters(chunk, f'Payload too large ({len(body)} bytes)')
+                continue
+            if response.status_code == 400:
+                chunks[0:0] = self._without_invalid_events(chunk, response)
+                continue
+            if response.status_code == 429:
+                chunk = self._without_exceeded_daily_quota(chunk, response)
+                delay = next(throttle_delays, None)
+                if len(chunk) == 0:
+                    continue
+                if delay is not None:
+                    self._metrics.increment('itly.client.retries')
+                    yield Delay(delay)
+                    chunks.insert(0, chunk)
+                    continue
+            self._metrics.increment('itly.client.dropped_events', len(chunk))
+            self._on_error(f'Unexpected status code for {endpoint_url}: {response.status_code}')
+        return delivered
+
+    def _without_invalid_events(self, events: List[EncodedEvent], response: HttpResponse) -> List[List[EncodedEvent]]:
+        """Move events rejected with 400 to the dead letters, and return the events to resend"""
+        try:
+            data = response.json()
+            error = str(data.get("error", "Bad request"))
+            invalid: Set[int] = set()
+            for field in INVALID_EVENTS_FIELDS:
+                for indices in (data.get(field) or {}).values():
+                    invalid.update(index for index in indices if 0 <= index < len(events))
+            request_error = _is_request_error(data, error)
+        except (ValueError, AttributeError, TypeError):
+            error, invalid, request_error = "Bad request", set(), False
+
+        if len(invalid) > 0:
+            self._add_dead_letters([events[index] for index in sorted(invalid)], error)
+            valid = [event for index, event in enumerate(events) if index not in invalid]
+            return [valid] if len(valid) > 0 else []
+        if len(events) > 1 and not request_error:
+            # The invalid events are unknown, halves that still fail are split until single events are left,
+            # at most log2(len(events)) times
+            return _split(events)
+        self._add_dead_letters(events, error)
+        return []
+
+    def _add_dead_letters(self, events: List[EncodedEvent], error: str) -> None:
+        with self._dead_letters_lock:
+            self._dead_letters.extend(AmplitudeDeadLetter(event.data, error) for event in events)
+        self._metrics.increment('itly.client.dropped_events', len(events))
+        self._metrics.increment('itly.client.dead_letters', len(events))
+        self._on_error(f'{len(events)} invalid events moved to dead letters: {error}')
 
-    def shutdown(self) -> None:
-        self._consumer.shutdown()
+    def dead_letters(self) -> List[AmplitudeDeadLetter]:
+        if self._shared_uploader is not None:
+            # Events are rejected in the shared uploader process
+            letters = self._shared_uploader.query("dead_letters") or []
+            return [AmplitudeDeadLetter(event=event, error=error) for event, error in letters]
+        with self._dead_letters_lock:
+            return list(self._dead_letters)
+
+    def _without_exceeded_daily_quota(self, events: List[EncodedEvent], response: HttpResponse) -> List[EncodedEvent]:
+        # Events of users and devices over their daily quota are rejected until the next day, only throttled ones are retried
+        try:
+            data = response.json()
+            users = set(data.get("exceeded_daily_quota_users") or {})
+            devices = set(data.get("exceeded_daily_quota_devices") or {})
+        except (ValueError, AttributeError):
+            return events
+        if len(users) == 0 and len(devices) == 0:
+            return events
+        remaining = [event for event in events
+                     if event.data.get("user_id") not in users and event.data.get("device_id") not in devices]
+        dropped = len(events) - len(remaining)
+        if dropped > 0:
+            self._metrics.increment('itly.client.dropped_events', dropped)
+            self._on_error(f'Daily quota exceeded, dropped {dropped} events')
+        return remaining
+
+    def shutdown(self, timeout: Optional[timedelta] = None) -> ShutdownResult:
+        if self._shared_uploader is not None:
+            # Queued events are delivered by the shared uploader process
+            self._shared_uploader.flush()
+            self._shared_uploader.close()
+            return ShutdownResult()
+        if self._asyncio_consumer is not None:
+            result = self._asyncio_consumer.shutdown_threadsafe(timeout)
+            self._asyncio_consumer.run_threadsafe(self._async_transport.close(), timeout)
+            return result
+        assert self._consumer is not None
+        return self._consumer.shutdown(timeout)
 
     def _enqueue(self, message: AsyncConsumerMessage) -> None:
+        if self._shared_uploader is not None:
+            self._shared_uploader.put(message)
+            return
         try:
-            self._queue.put(message)
+            if self._asyncio_consumer is not None:
+                self._asyncio_consumer.put(message)
+            else:
+                self._queue.put(message)
         except queue.Full:
+            self._metrics.increment('itly.client.dropped_events')
             self._on_error("async queue is full")
 
     def flush(self) -> None:
+        if self._shared_uploader is not None:
+            self._shared_uploader.flush()
+            return
+        if self._asyncio_consumer is not None:
+            self._asyncio_consumer.flush_threadsafe()
+            return
+        assert self._consumer is not None
         self._consumer.flush()
+
+
+def _check_shared_uploader_options(metrics: Metrics, event_loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    if event_loop is not None:
+        raise ValueError("event_loop can't be combined with shared_uploader_socket, "
+                         "events are uploaded by the shared uploader process.")
+    if metrics is not Metrics.NONE:
+        raise ValueError("metrics can't be combined with shared_uploader_socket, "
+                         "events are uploaded by the shared uploader process.")
+
+
+def _is_request_error(data: Dict[str, Any], error: str) -> bool:
+    """Whether a 400 response rejects the request itself, e.g. a missing or invalid API key, rather than some events"""
+    return "missing_field" in data or any(marker in error.lower() for marker in REQUEST_ERROR_MARKERS)
+
+
+def _split(events: List[EncodedEvent]) -> List[List[EncodedEvent]]:
+    middle = len(events) // 2
+    return [events[:middle], events[middle:]]
@@ -20,6 +20,7 @@ class AmplitudeMetadata(EventMetadata):
                  city: Optional[str] = None,
                  dma: Optional[str] = None,
                  language: Optional[str] = None,
+                 time: Optional[int] = None,
                  ):
         self.device_id = device_id
         self.groups = groups
@@ -36,12 +37,8 @@ class AmplitudeMetadata(EventMetadata):
         self.city = city
         self.dma = dma
         self.language = language
+        # Milliseconds since the epoch, e.g. of replayed events. Defaults to the time of the track() call.
+        self.time = time
 
-    @staticmethod
-    def merge(first: Optional["AmplitudeMetadata"], second: Optional["AmplitudeMetadata"]) -> Optional["AmplitudeMetadata"]:
-        if first is None and second is None:
-            return None
-
-        first_data = {k: v for (k, v) in vars(first).items() if v is not None} if first is not None else {}
-        second_data = {k: v for (k, v) in vars(second).items() if v is not None} if second is not None else {}
-        return AmplitudeMetadata(**{**first_data, **second_data})
+    def to_json(self) -> Dict[str, Any]:
+        return {k: v for (k, v) in vars(self).items() if v is not None}
@@ -1,27 +1,58 @@
+import asyncio
 from datetime import timedelta
-from typing import Optional, NamedTuple, cast
+from types import MappingProxyType
+from typing import Optional, NamedTuple, Mapping, Any, List, cast
 
-from itly_sdk import Plugin, PluginLoadOptions, Properties, Event, Logger
-from ._amplitude_client import AmplitudeClient
+from itly_sdk import Plugin, PluginLoadOptions, Properties, Event, Logger, ShutdownResult
+from ._amplitude_client import AmplitudeClient, AmplitudeDeadLetter
 from itly_plugin_amplitude._amplitude_metadata import AmplitudeMetadata
 
 
+# https://www.docs.developers.amplitude.com/analytics/apis/batch-event-upload-api/#upload-limit
+MAX_QUEUE_SIZE = 2000
+DEFAULT_FLUSH_QUEUE_SIZE = 10
+BATCH_MODE_FLUSH_QUEUE_SIZE = 1000
+
+
 class AmplitudeOptions(NamedTuple):
-    flush_queue_size: int = 10
+    # Defaults to 10, or 1000 in batch mode
+    flush_queue_size: Optional[int] = None
     flush_interval: timedelta = timedelta(seconds=1)
     events_endpoint: Optional[str] = None
     identification_endpoint: Optional[str] = None
+    group_identification_endpoint: Optional[str] = None
     request_timeout: timedelta = timedelta(seconds=15)
     min_id_length: Optional[int] = None
     metadata: Optional[AmplitudeMetadata] = None
+    # Batch and upload events in one process shared by all processes using this socket path, e.g. pre-fork
+    # workers. Can't be combined with event_loop or with the Itly metrics option.
+    shared_uploader_socket: Optional[str] = None
+    event_loop: Optional[asyncio.AbstractEventLoop] = None
+    # Upload events to the Batch API (/batch) built for high volumes instead of the HTTP API (/2/httpapi)
+    batch_mode: bool = False
+    # Send identify calls as $identify events in the events batch instead of to the identification endpoint
+    identify_as_event: bool = False
+    # Number of events rejected as invalid by Amplitude that are kept for inspection
+    max_dead_letters: int = 1000
+    # Events of a user (or device without user) over this rate are delayed to later batches, to avoid Amplitude's
+    # per-user throttling of whole requests. Up to `user_burst` events are sent at once, defaults to the rate.
+    max_events_per_user_per_second: Optional[float] = None
+    user_burst: Optional[float] = None
+    # Amplitude group type of the groups passed to group()
+    group_type: str = 'group'
 
 
 class AmplitudePlugin(Plugin):
     def __init__(self, api_key: str, options: Optional[AmplitudeOptions] = None) -> None:
         self._api_key: str = api_key
         self._options: AmplitudeOptions = options if options is not None else AmplitudeOptions()
+        if self._options.flush_queue_size is None:
+            self._flush_queue_size = BATCH_MODE_FLUSH_QUEUE_SIZE if self._options.batch_mode else DEFAULT_FLUSH_QUEUE_SIZE
+        else:
+            self._flush_queue_size = min(self._options.flush_queue_size, MAX_QUEUE_SIZE)
         self._client: Optional[AmplitudeClient] = None
         self._logger: Logger = Logger.NONE
+        self._metadata: Mapping[str, Any] = MappingProxyType({})
 
     def id(self) -> str:
         return 'amplitude'
@@ -29,36 +60,60 @@ class AmplitudePlugin(Plugin):
     def load(self, options: PluginLoadOptions) -> None:
         self._client = AmplitudeClient(api_key=self._api_key,
                                        on_error=self._on_error,
-                                       flush_queue_size=self._options.flush_queue_size,
+                                       flush_queue_size=self._flush_queue_size,
                                        flush_interval=self._options.flush_interval,
                                        request_timeout=self._options.request_timeout,
                                        min_id_length=self._options.min_id_length,
                                        events_endpoint=self._options.events_endpoint,
-                                       identification_endpoint=self._options.identification_endpoint)
+                                       identification_endpoint=self._options.identification_endpoint,
+                                       metrics=options.metrics,
+                                       shared_uploader_socket=self._options.shared_uploader_socket,
+                                       event_loop=self._options.event_loop,
+                                       batch_mode=self._options.batch_mode,
+                                       identify_as_event=self._options.identify_as_event,
+                                       max_dead_letters=self._options.max_dead_letters,
+                                       max_events_per_user_per_second=self._options.max_events_per_user_per_second,
+                                       user_burst=self._options.user_burst,
+                                       group_identification_endpoint=self._options.group_identification_endpoint)
         self._logger = options.logger
+        # Plugin-level metadata doesn't change, so it's converted to request fields only once
+        metadata = self._options.metadata.to_json() if self._options.metadata is not None else {}
+        self._metadata = MappingProxyType(metadata)
 
     def identify(self, user_id: str, properties: Optional[Properties]) -> None:
         assert self._client is not None
         self._client.identify(user_id=user_id,
                               properties=properties.to_json() if properties is not None else None,
-                              metadata=self._options.metadata)
+                              metadata=self._metadata)
+
+    def group(self, user_id: str, group_id: str, properties: Optional[Properties]) -> None:
+        assert self._client is not None
+        self._client.group_identify(group_type=self._options.group_type,
+                                    group_value=group_id,
+                                    properties=properties.to_json() if properties is not None else None)
 
     def track(self, user_id: str, event: Event) -> None:
         assert self._client is not None
         event_metadata = cast(Optional[AmplitudeMetadata], event.metadata.get(self.id()))
-        metadata = AmplitudeMetadata.merge(self._options.metadata, event_metadata)
+        metadata = {**self._metadata, **event_metadata.to_json()} if event_metadata is not None else self._metadata
         self._client.track(user_id=user_id,
                            event_name=event.name,
                            properties=event.properties.to_json() if event.properties is not None else None,
-                           metadata=metadata)
+                           metadata=metadata,
+                           insert_id=event.insert_id)
 
     def flush(self) -> None:
         assert self._client is not None
         self._client.flush()
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
+        assert self._client is not None
+        return self._client.shutdown(timeout)
+
+    def dead_letters(self) -> List[AmplitudeDeadLetter]:
+        """Return the most recent events rejected by Amplitude as invalid, which are not retried"""
         assert self._client is not None
-        self._client.shutdown()
+        return self._client.dead_letters()
 
     def _on_error(self, err: str) -> None:
         self._logger.error(f"Error. {err}")
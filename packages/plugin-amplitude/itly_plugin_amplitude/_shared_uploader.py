@@ -0,0 +1,38 @@
+import json
+import sys
+from datetime import timedelta
+
+from itly_sdk.internal import SharedUploaderServer
+from ._amplitude_client import AmplitudeClient
+
+
+def _print_error(err: str) -> None:
+    print(f"[itly-amplitude-uploader] Error. {err}", file=sys.stderr)
+
+
+def main() -> None:
+    """Upload events sent by AmplitudeClient instances configured with the same `shared_uploader_socket`."""
+    socket_path = sys.argv[1]
+    config = json.load(sys.stdin)
+    client = AmplitudeClient(api_key=config["api_key"],
+                             on_error=_print_error,
+                             flush_queue_size=config["flush_queue_size"],
+                             flush_interval=timedelta(seconds=config["flush_interval"]),
+                             request_timeout=timedelta(seconds=config["request_timeout"]),
+                             min_id_length=config["min_id_length"],
+                             events_endpoint=config["events_endpoint"],
+                             identification_endpoint=config["identification_endpoint"],
+                             batch_mode=config.get("batch_mode", False),
+                             max_events_per_user_per_second=config.get("max_events_per_user_per_second"),
+                             user_burst=config.get("user_burst"),
+                             group_identification_endpoint=config.get("group_identification_endpoint"),
+                             max_dead_letters=config.get("max_dead_letters", 1000))
+    try:
+        SharedUploaderServer(socket_path, enqueue=client._enqueue, flush=client.flush,
+                             queries={"dead_letters": client.dead_letters}).serve_forever()
+    finally:
+        client.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,20 @@
+import asyncio
 import json
+import os
 import re
+import sys
+import threading
 import time
 from datetime import timedelta
 from typing import List, Any
 import urllib.parse
 
+import pytest
 from pytest_httpserver import HTTPServer
+from werkzeug import Request, Response
 
 from itly_plugin_amplitude import AmplitudePlugin, AmplitudeOptions, AmplitudeMetadata
-from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger
+from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger, InMemoryMetrics, ShutdownResult
 
 
 def test_amplitude(httpserver: HTTPServer):
@@ -158,6 +164,7 @@ def test_amplitude_metadata(httpserver: HTTPServer):
             "amplitude": AmplitudeMetadata(os_name="win", os_version="987.45")
         }
         p.track("user-1", Event('event-2', Properties(item1='value2', item2=2), metadata=metadata))
+        p.track("user-3", Event('event-3'))
 
         p.flush()
         time.sleep(0.1)
@@ -171,7 +178,8 @@ def test_amplitude_metadata(httpserver: HTTPServer):
                 'api_key': 'My-Key',
                 'events': [
                     {'user_id': 'user-2', 'event_type': 'event-1', 'event_properties': {'item1': 'value1', 'item2': 1}, 'city': 'York', 'platform': 'LinUx', 'os_name': 'ubuntu', 'os_version': "123.45"},
-                    {'user_id': 'user-1', 'event_type': 'event-2', 'event_properties': {'item1': 'value2', 'item2': 2}, 'city': 'York', 'os_name': 'win', 'os_version': "987.45"}
+                    {'user_id': 'user-1', 'event_type': 'event-2', 'event_properties': {'item1': 'value2', 'item2': 2}, 'city': 'York', 'os_name': 'win', 'os_version': "987.45"},
+                    {'user_id': 'user-3', 'event_type': 'event-3', 'event_properties': {}, 'city': 'York', 'os_name': 'ubuntu', 'os_version': '111.0'}
                 ],
             },
         ]
@@ -182,6 +190,485 @@ def test_amplitude_metadata(httpserver: HTTPServer):
         httpserver.stop()
 
 
+def test_amplitude_insert_id(httpserver: HTTPServer):
+    httpserver.expect_request(re.compile('/(events|identify)')).respond_with_data()
+
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        identification_endpoint=httpserver.url_for('/identify'),
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        p.track("user-1", Event('event-1', Properties(item1='value1'), insert_id='insert-1'))
+        p.track("user-1", Event('event-2', Properties(item1='value2')))
+
+        p.flush()
+        time.sleep(0.1)
+
+        requests = _get_cleaned_requests(httpserver)
+        assert requests == [
+            {
+                'api_key': 'My-Key',
+                'events': [
+                    {'user_id': 'user-1', 'event_type': 'event-1', 'event_properties': {'item1': 'value1'}, 'insert_id': 'insert-1'},
+                    {'user_id': 'user-1', 'event_type': 'event-2', 'event_properties': {'item1': 'value2'}},
+                ],
+            },
+        ]
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_metrics(httpserver: HTTPServer):
+    httpserver.expect_request(re.compile('/events')).respond_with_data(status=500)
+
+    metrics = InMemoryMetrics()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        identification_endpoint=httpserver.url_for('/identify'),
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+
+        p.track("user-1", Event('event-1', Properties(item1='value1')))
+        p.track("user-1", Event('event-2', Properties(item1='value2')))
+        p.flush()
+
+        assert metrics.histogram('itly.consumer.batch_size') == [2]
+        assert metrics.counter('itly.client.responses', tags={'status': '500'}) == 1
+        assert metrics.counter('itly.client.dropped_events') == 2
+        assert len(metrics.histogram('itly.client.request_duration')) == 1
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_identify_as_event(httpserver: HTTPServer):
+    httpserver.expect_request(re.compile('/(events|identify)')).respond_with_data()
+
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        identification_endpoint=httpserver.url_for('/identify'),
+        identify_as_event=True,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        p.track("user-1", Event('event-1', Properties(item1='value1')))
+        p.identify("user-1", Properties(item1='value1', item2=2))
+        p.track("user-1", Event('event-2', Properties(item1='value2')))
+        p.flush()
+
+        requests = _get_cleaned_requests(httpserver)
+        assert requests == [
+            {
+                'api_key': 'My-Key',
+                'events': [
+                    {'user_id': 'user-1', 'event_type': 'event-1', 'event_properties': {'item1': 'value1'}},
+                    {'user_id': 'user-1', 'event_type': '$identify', 'user_properties': {'$set': {'item1': 'value1', 'item2': 2}}},
+                    {'user_id': 'user-1', 'event_type': 'event-2', 'event_properties': {'item1': 'value2'}},
+                ],
+            },
+        ]
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_group(httpserver: HTTPServer):
+    httpserver.expect_request('/groupidentify').respond_with_data()
+
+    options = AmplitudeOptions(
+        group_identification_endpoint=httpserver.url_for('/groupidentify'),
+        group_type='org',
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        p.group("user-1", "org-1", Properties(plan='free', seats=1))
+        p.group("user-2", "org-2", Properties(plan='free'))
+        p.group("user-1", "org-1", Properties(seats=2))
+        p.flush()
+
+        requests = _get_cleaned_requests(httpserver)
+        assert requests == [
+            [
+                {'group_type': 'org', 'group_value': 'org-1', 'group_properties': {'plan': 'free', 'seats': 2}},
+                {'group_type': 'org', 'group_value': 'org-2', 'group_properties': {'plan': 'free'}},
+            ],
+        ]
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_batch_mode(httpserver: HTTPServer):
+    httpserver.expect_oneshot_request('/batch').respond_with_data(status=413)
+    httpserver.expect_oneshot_request('/batch').respond_with_json(
+        {'code': 429, 'exceeded_daily_quota_users': {'user-1': 500001}}, status=429)
+    httpserver.expect_request('/batch').respond_with_json({'code': 200})
+
+    metrics = InMemoryMetrics()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/batch'),
+        batch_mode=True,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+
+        for i in range(4):
+            p.track(f"user-{i}", Event(f'event-{i}'))
+        p.flush()
+
+        requests = _get_cleaned_requests(httpserver)
+        assert [[event['user_id'] for event in request['events']] for request in requests] == [
+            ['user-0', 'user-1', 'user-2', 'user-3'],
+            ['user-0', 'user-1'],
+            ['user-0'],
+            ['user-2', 'user-3'],
+        ]
+        assert metrics.counter('itly.client.dropped_events') == 1
+        assert metrics.counter('itly.client.retries') == 1
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_invalid_events(httpserver: HTTPServer):
+    def handler(request: Request) -> Response:
+        user_ids = [event['user_id'] for event in json.loads(request.data)['events']]
+        if 'user-1' in user_ids:
+            body = {
+                'code': 400,
+                'error': 'Invalid field values on some events',
+                'events_with_invalid_fields': {'time': [user_ids.index('user-1')]},
+            }
+            return Response(json.dumps(body), status=400)
+        if 'user-3' in user_ids:
+            return Response('Bad request', status=400)
+        return Response(json.dumps({'code': 200}))
+
+    httpserver.expect_request('/events').respond_with_handler(handler)
+
+    metrics = InMemoryMetrics()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        max_dead_letters=10,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+
+        for i in range(5):
+            p.track(f"user-{i}", Event(f'event-{i}'))
+        p.flush()
+
+        requests = _get_cleaned_requests(httpserver)
+        assert [[event['user_id'] for event in request['events']] for request in requests] == [
+            ['user-0', 'user-1', 'user-2', 'user-3', 'user-4'],
+            ['user-0', 'user-2', 'user-3', 'user-4'],
+            ['user-0', 'user-2'],
+            ['user-3', 'user-4'],
+            ['user-3'],
+            ['user-4'],
+        ]
+        assert [(letter.event['user_id'], letter.error) for letter in p.dead_letters()] == [
+            ('user-1', 'Invalid field values on some events'),
+            ('user-3', 'Bad request'),
+        ]
+        assert metrics.counter('itly.client.dropped_events') == 2
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_request_rejected(httpserver: HTTPServer):
+    httpserver.expect_request('/events').respond_with_json({'code': 400, 'error': 'Invalid API key'}, status=400)
+
+    metrics = InMemoryMetrics()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        max_dead_letters=10,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+
+        for i in range(8):
+            p.track(f"user-{i}", Event(f'event-{i}'))
+        p.flush()
+
+        # The error applies to the whole request, so the batch isn't bisected
+        requests = _get_cleaned_requests(httpserver)
+        assert [len(request['events']) for request in requests] == [8]
+        assert [letter.error for letter in p.dead_letters()] == ['Invalid API key'] * 8
+        assert metrics.counter('itly.client.dropped_events') == 8
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_invalid_events_in_both_halves(httpserver: HTTPServer):
+    def handler(request: Request) -> Response:
+        user_ids = [event['user_id'] for event in json.loads(request.data)['events']]
+        if 'user-1' in user_ids or 'user-6' in user_ids:
+            return Response(json.dumps({'code': 400, 'error': 'Invalid event'}), status=400)
+        return Response(json.dumps({'code': 200}))
+
+    httpserver.expect_request('/events').respond_with_handler(handler)
+
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        max_dead_letters=10,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        for i in range(8):
+            p.track(f"user-{i}", Event(f'event-{i}'))
+        p.flush()
+
+        # Halves rejected with the same error are bisected independently, only the invalid events are dead letters
+        requests = _get_cleaned_requests(httpserver)
+        assert [len(request['events']) for request in requests] == [8, 4, 2, 1, 1, 2, 4, 2, 2, 1, 1]
+        assert [(letter.event['user_id'], letter.error) for letter in p.dead_letters()] == [
+            ('user-1', 'Invalid event'),
+            ('user-6', 'Invalid event'),
+        ]
+        assert p.shutdown() == ShutdownResult()
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_user_rate(httpserver: HTTPServer):
+    httpserver.expect_request('/events').respond_with_json({'code': 200})
+
+    metrics = InMemoryMetrics()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        flush_queue_size=20,
+        flush_interval=timedelta(seconds=0.1),
+        max_events_per_user_per_second=5,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+
+        for i in range(10):
+            p.track("bot", Event(f'event-{i}'))
+        p.track("user-1", Event('event-1'))
+
+        # Deferred events are sent in later batches, once the user's bucket refilled
+        time.sleep(1.5)
+        requests = _get_cleaned_requests(httpserver)
+        assert [[event['user_id'] for event in request['events']] for request in requests][0] == \
+            ['bot'] * 5 + ['user-1']
+        assert [event['event_type'] for request in requests[1:] for event in request['events']] == \
+            [f'event-{i}' for i in range(5, 10)]
+        assert metrics.counter('itly.client.deferred_events') == 5
+        assert p.shutdown() == ShutdownResult()
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_user_rate_flush(httpserver: HTTPServer):
+    httpserver.expect_request('/events').respond_with_json({'code': 200})
+
+    metrics = InMemoryMetrics()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10),
+        max_events_per_user_per_second=1,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+
+        for i in range(100):
+            p.track("bot", Event(f'event-{i}'))
+        # Flush sends the deferred events without waiting for the user's bucket
+        p.flush()
+
+        requests = _get_cleaned_requests(httpserver)
+        assert sorted(event['event_type'] for request in requests for event in request['events']) == \
+            sorted(f'event-{i}' for i in range(100))
+        # Every event is deferred at most once
+        assert metrics.counter('itly.client.deferred_events') == 99
+        assert p.shutdown() == ShutdownResult()
+    finally:
+        p.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_shutdown_result(httpserver: HTTPServer):
+    def handler(request: Request) -> Response:
+        # Slow enough to finish after shutdown() started
+        time.sleep(0.2)
+        return Response(status=200 if request.path == '/events' else 500)
+
+    httpserver.expect_request(re.compile('/(events|identify)')).respond_with_handler(handler)
+
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        identification_endpoint=httpserver.url_for('/identify'),
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10),
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        p.track("user-1", Event('event-1'))
+        p.track("user-1", Event('event-2'))
+        p.identify("user-1", Properties(item1='value1'))
+
+        # Rejected identifies are dropped, not delivered
+        assert p.shutdown(timedelta(seconds=5)) == ShutdownResult(delivered=2, dropped=1)
+    finally:
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_event_loop(httpserver: HTTPServer):
+    pytest.importorskip('httpx')
+    httpserver.expect_request('/events').respond_with_json({'code': 200})
+
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10),
+        event_loop=loop,
+    )
+    p = AmplitudePlugin('My-Key', options)
+
+    try:
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        p.track("user-1", Event('event-1'))
+        p.track("user-2", Event('event-2'))
+        p.flush()
+        requests = _get_cleaned_requests(httpserver)
+        assert [[event['user_id'] for event in request['events']] for request in requests] == [['user-1', 'user-2']]
+
+        p.track("user-3", Event('event-3'))
+        assert p.shutdown(timedelta(seconds=5)) == ShutdownResult(delivered=1)
+        assert len(_get_cleaned_requests(httpserver)) == 2
+        # The connection pool is closed on the application's loop
+        assert p._client._async_transport._client.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+        httpserver.stop()
+
+
+def test_amplitude_shared_uploader(httpserver: HTTPServer, tmp_path, monkeypatch):
+    def handler(request: Request) -> Response:
+        user_ids = [event['user_id'] for event in json.loads(request.data)['events']]
+        if 'user-1' in user_ids:
+            return Response('Bad request', status=400)
+        return Response(json.dumps({'code': 200}))
+
+    httpserver.expect_request('/events').respond_with_handler(handler)
+    # The uploader process imports the plugin from the same paths as the tests
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(os.path.abspath(path) for path in sys.path))
+
+    options = AmplitudeOptions(
+        events_endpoint=httpserver.url_for('/events'),
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10),
+        max_dead_letters=10,
+        shared_uploader_socket=str(tmp_path / 'amplitude.sock'),
+    )
+    first = AmplitudePlugin('My-Key', options)
+    second = AmplitudePlugin('My-Key', options)
+
+    try:
+        first.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+        second.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+        first.track("user-0", Event('event-0'))
+        second.track("user-1", Event('event-1'))
+        second.flush()
+
+        requests = _get_cleaned_requests(httpserver)
+        assert [[event['user_id'] for event in request['events']] for request in requests] == [
+            ['user-0', 'user-1'],
+            ['user-0'],
+            ['user-1'],
+        ]
+        # Dead letters are kept by the uploader process
+        assert [(letter.event['user_id'], letter.error) for letter in first.dead_letters()] == [
+            ('user-1', 'Bad request'),
+        ]
+    finally:
+        first.shutdown()
+        second.shutdown()
+
+        time.sleep(0.1)
+        httpserver.stop()
+
+
+def test_amplitude_shared_uploader_rejects_unsupported_options(tmp_path):
+    loop = asyncio.new_event_loop()
+    try:
+        p = AmplitudePlugin('My-Key', AmplitudeOptions(shared_uploader_socket=str(tmp_path / 'amplitude.sock'),
+                                                       event_loop=loop))
+        with pytest.raises(ValueError, match='event_loop'):
+            p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+    finally:
+        loop.close()
+
+    p = AmplitudePlugin('My-Key', AmplitudeOptions(shared_uploader_socket=str(tmp_path / 'amplitude.sock')))
+    with pytest.raises(ValueError, match='metrics'):
+        p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=InMemoryMetrics()))
+
+
 identification_re = re.compile(br'^identification=([^&]+)&')
 
 
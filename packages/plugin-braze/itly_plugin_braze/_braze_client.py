@@ -1,14 +1,20 @@
+import asyncio
 import atexit
 import json
 import queue
 from datetime import timedelta, datetime
 from threading import Event
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 
-from requests import Session
+from itly_sdk import Logger, Metrics, ShutdownResult
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, AsyncIOConsumer, Delay, FileTokenBucket, \
+    HttpRequest, HttpTransportError, HttpxTransport, RequestsTransport, TokenBucket, UploadSteps, backoff, \
+    register_after_fork, run_upload, run_upload_async
 
-from itly_sdk import Logger
-from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage
+# https://www.braze.com/docs/api/endpoints/user_data/post_user_track/#rate-limit
+MAX_OBJECTS_PER_TYPE = 75
+# Requests rejected with 429 are retried after increasing delays
+RATE_LIMITED_MAX_RETRIES = 3
 
 
 class BrazeClient:
@@ -19,19 +25,52 @@ class BrazeClient:
                  flush_interval: timedelta,
                  request_timeout: timedelta,
                  logger: Logger,
+                 metrics: Metrics = Metrics.NONE,
+                 event_loop: Optional[asyncio.AbstractEventLoop] = None,
+                 rate_limiter: Optional[Union[TokenBucket, FileTokenBucket]] = None,
                  ) -> None:
         self._api_key = api_key
         self._request_timeout = request_timeout
-        self._queue: queue.Queue = AsyncConsumer.create_queue()
         base_url = base_url.rstrip("/")
         self._user_track_url = f'{base_url}/users/track'
-        self._session = Session()
         self._logger = logger
-        self._consumer = AsyncConsumer(message_queue=self._queue,
-                                       do_upload=self._upload_batch,
-                                       flush_queue_size=flush_queue_size,
-                                       flush_interval=flush_interval)
+        self._metrics = metrics
+        self._flush_queue_size = flush_queue_size
+        self._flush_interval = flush_interval
+        self._rate_limiter = rate_limiter
+        self._consumer: Optional[AsyncConsumer] = None
+        self._asyncio_consumer: Optional[AsyncIOConsumer] = None
+        if event_loop is not None:
+            # Batches are uploaded by tasks on the application's event loop, sharing one connection pool
+            self._async_transport = HttpxTransport(request_timeout)
+            self._asyncio_consumer = AsyncIOConsumer(loop=event_loop,
+                                                     do_upload=self._upload_batch_async,
+                                                     flush_queue_size=flush_queue_size,
+                                                     flush_interval=flush_interval,
+                                                     metrics=metrics)
+            atexit.register(self.shutdown)
+            self._asyncio_consumer.start()
+            return
+
+        self._queue: queue.Queue = AsyncConsumer.create_queue()
+        self._transport = RequestsTransport(request_timeout)
+        self._consumer = self._create_consumer()
         atexit.register(self.shutdown)
+        register_after_fork(self._reset_after_fork)
+        self._consumer.start()
+
+    def _create_consumer(self) -> AsyncConsumer:
+        return AsyncConsumer(message_queue=self._queue,
+                             do_upload=self._upload_batch,
+                             flush_queue_size=self._flush_queue_size,
+                             flush_interval=self._flush_interval,
+                             metrics=self._metrics)
+
+    def _reset_after_fork(self) -> None:
+        # The consumer thread doesn't exist in the child and queued messages are uploaded by the parent
+        self._queue = AsyncConsumer.create_queue()
+        self._transport = RequestsTransport(self._request_timeout)
+        self._consumer = self._create_consumer()
         self._consumer.start()
 
     def identify(self, user_id: str, properties: Optional[Dict[str, Any]]) -> None:
@@ -48,41 +87,113 @@ class BrazeClient:
         }
         self._enqueue(AsyncConsumerMessage("", {"events": data}))
 
-    def _upload_batch(self, batch: List[AsyncConsumerMessage], stop_event: Event) -> None:
-        body = {}
-        count = 0
-        for event in batch:
-            for key, value in event.data.items():
-                if key not in body:
-                    body[key] = []
-                count += 1
-                body[key].append(value)
+    def _upload_batch(self, batch: List[AsyncConsumerMessage], stop_event: Event) -> int:
+        try:
+            # None when the upload was abandoned on shutdown
+            return run_upload(self._upload_steps(batch), self._transport, stop_event, self._metrics) or 0
+        except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
+            self._logger.error(str(e))
+            return 0
 
-        self._logger.info(f"uploading {count} items")
+    async def _upload_batch_async(self, batch: List[AsyncConsumerMessage]) -> int:
         try:
-            response = self._session.post(
-                self._user_track_url,
-                headers={'Authorization': f'Bearer {self._api_key}'},
-                json=body,
-                timeout=self._request_timeout.total_seconds(),
-            )
-            if response.status_code >= 300:
-                self._logger.error(f'unexpected response status: {response.status_code}')
-            else:
-                self._logger.info(f'response status: {response.status_code}')
+            return await run_upload_async(self._upload_steps(batch), self._async_transport, self._metrics) or 0
         except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
             self._logger.error(str(e))
+            return 0
+
+    def _upload_steps(self, batch: List[AsyncConsumerMessage]) -> UploadSteps[int]:
+        """Upload a batch and return the number of delivered messages"""
+        objects: Dict[str, List[Any]] = {}
+        # Number of messages merged into each object
+        message_counts: Dict[str, List[int]] = {}
+        # Attributes of the same user within the batch are merged into one object, later values win
+        attributes_by_user: Dict[str, int] = {}
+        for event in batch:
+            for key, value in event.data.items():
+                if key not in objects:
+                    objects[key] = []
+                    message_counts[key] = []
+                if key == "attributes":
+                    index = attributes_by_user.get(value["external_id"])
+                    if index is not None:
+                        objects[key][index].update(value)
+                        message_counts[key][index] += 1
+                        continue
+                    attributes_by_user[value["external_id"]] = len(objects[key])
+                    value = dict(value)
+                objects[key].append(value)
+                message_counts[key].append(1)
+
+        delivered = 0
+        # Each request carries up to 75 objects of every type
+        requests = max((len(values) + MAX_OBJECTS_PER_TYPE - 1) // MAX_OBJECTS_PER_TYPE for values in objects.values())
+        for i in range(requests):
+            start = i * MAX_OBJECTS_PER_TYPE
+            end = start + MAX_OBJECTS_PER_TYPE
+            body = {key: values[start:end] for key, values in objects.items() if len(values) > start}
+            count = sum(len(values) for values in body.values())
+            messages = sum(sum(counts[start:end]) for counts in message_counts.values())
+
+            self._logger.info(f"uploading {count} items")
+            try:
+                status_code = yield from self._send(body)
+            except HttpTransportError as e:
+                self._metrics.increment('itly.client.dropped_events', count)
+                self._logger.error(str(e))
+                continue
+            if status_code >= 300:
+                self._metrics.increment('itly.client.dropped_events', count)
+                self._logger.error(f'unexpected response status: {status_code}')
+            else:
+                delivered += messages
+                self._logger.info(f'response status: {status_code}')
+        return delivered
+
+    def _send(self, body: Dict[str, List[Any]]) -> UploadSteps[int]:
+        retry_delays = backoff(start=1.0, stop=10.0, count=RATE_LIMITED_MAX_RETRIES)
+        while True:
+            if self._rate_limiter is not None:
+                # Wait for the quota instead of sending a request that would be rejected
+                wait = self._rate_limiter.reserve()
+                if wait > 0:
+                    self._metrics.increment('itly.client.rate_limited')
+                    yield Delay(wait)
+            response = yield HttpRequest(url=self._user_track_url,
+                                         json=body,
+                                         headers={'Authorization': f'Bearer {self._api_key}'})
+            assert response is not None
+            delay = next(retry_delays, None) if response.status_code == 429 else None
+            if delay is None:
+                return response.status_code
+            self._metrics.increment('itly.client.retries')
+            yield Delay(delay)
 
     def flush(self) -> None:
+        if self._asyncio_consumer is not None:
+            self._asyncio_consumer.flush_threadsafe()
+            return
+        assert self._consumer is not None
         self._consumer.flush()
 
-    def shutdown(self) -> None:
-        self._consumer.shutdown()
+    def shutdown(self, timeout: Optional[timedelta] = None) -> ShutdownResult:
+        if self._asyncio_consumer is not None:
+            result = self._asyncio_consumer.shutdown_threadsafe(timeout)
+            self._asyncio_consumer.run_threadsafe(self._async_transport.close(), timeout)
+            return result
+        assert self._consumer is not None
+        return self._consumer.shutdown(timeout)
 
     def _enqueue(self, message: AsyncConsumerMessage) -> None:
         try:
-            self._queue.put(message)
+            if self._asyncio_consumer is not None:
+                self._asyncio_consumer.put(message)
+            else:
+                self._queue.put(message)
         except queue.Full:
+            self._metrics.increment('itly.client.dropped_events')
             self._logger.error("async queue is full")
 
     @staticmethod
@@ -1,11 +1,13 @@
+import asyncio
 from datetime import timedelta
-from typing import NamedTuple, Optional
+from typing import NamedTuple, Optional, Union
 
-from itly_sdk import Plugin, Properties, Event, PluginLoadOptions, Logger
-from ._braze_client import BrazeClient
+from itly_sdk import Plugin, Properties, Event, PluginLoadOptions, Logger, ShutdownResult
+from itly_sdk.internal import FileTokenBucket, TokenBucket
+from ._braze_client import BrazeClient, MAX_OBJECTS_PER_TYPE
 
-# https://www.braze.com/docs/api/basics/#api-limits
-MAX_QUEUE_SIZE = 75
+# Requests are packed with up to 75 attributes and 75 events each
+MAX_QUEUE_SIZE = 2 * MAX_OBJECTS_PER_TYPE
 
 
 class BrazeOptions(NamedTuple):
@@ -13,6 +15,13 @@ class BrazeOptions(NamedTuple):
     flush_queue_size: int = 25
     flush_interval: timedelta = timedelta(seconds=1)
     request_timeout: timedelta = timedelta(seconds=15)
+    event_loop: Optional[asyncio.AbstractEventLoop] = None
+    # Client-side limit of /users/track requests, e.g. 1000 per second for Braze's default of 3000 per 3 seconds.
+    # Batches over the limit wait for it. Up to `rate_limit_burst` requests are sent at once, defaults to the rate.
+    max_requests_per_second: Optional[float] = None
+    rate_limit_burst: Optional[float] = None
+    # Share the limit with all processes on the host using the same file, e.g. workers of a pre-fork server
+    rate_limit_file: Optional[str] = None
 
 
 class BrazePlugin(Plugin):
@@ -36,9 +45,21 @@ class BrazePlugin(Plugin):
             flush_interval=self._options.flush_interval,
             request_timeout=self._options.request_timeout,
             logger=options.logger,
+            metrics=options.metrics,
+            event_loop=self._options.event_loop,
+            rate_limiter=self._create_rate_limiter(),
         )
         self._logger = options.logger
 
+    def _create_rate_limiter(self) -> Optional[Union[TokenBucket, FileTokenBucket]]:
+        rate = self._options.max_requests_per_second
+        if rate is None:
+            return None
+        capacity = self._options.rate_limit_burst if self._options.rate_limit_burst is not None else rate
+        if self._options.rate_limit_file is not None:
+            return FileTokenBucket(self._options.rate_limit_file, rate=rate, capacity=capacity)
+        return TokenBucket(rate=rate, capacity=capacity)
+
     def identify(self, user_id: str, properties: Optional[Properties]) -> None:
         assert self._client is not None
         identify_properties = properties.to_json() if properties is not None else None
@@ -63,7 +84,7 @@ class BrazePlugin(Plugin):
         assert self._client is not None
         self._client.flush()
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
         assert self._client is not None
-        self._client.shutdown()
+        return self._client.shutdown(timeout)
 
@@ -1,13 +1,16 @@
+import asyncio
 import json
 import re
+import threading
 import time
 from datetime import timedelta
 from typing import List, Any
 
+import pytest
 from pytest_httpserver import HTTPServer
 
 from itly_plugin_braze import BrazePlugin, BrazeOptions
-from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger
+from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger, InMemoryMetrics, ShutdownResult
 
 time_short = 0.1
 timedelta_max = timedelta(seconds=999)
@@ -269,6 +272,106 @@ def test_TrackAndIdentify_ObjectAndArrayProperties_Stringified(httpserver: HTTPS
     p.shutdown()
 
 
+def test_TrackAndIdentify_MoreThan75Objects_PackedPerType(httpserver: HTTPServer):
+    httpserver.expect_request(re.compile('/users/track')).respond_with_data()
+    p = BrazePlugin('My-Key',
+                    BrazeOptions(base_url=httpserver.url_for(''), flush_queue_size=150, flush_interval=timedelta_max))
+    p.load(plugin_load_options)
+    for i in range(100):
+        p.track(f"user-{i}", event_1)
+        if i % 2 == 1:
+            p.identify(f"user-{i}", identify_properties)
+    p.flush()
+    requests = _get_cleaned_requests(httpserver)
+    assert [{key: len(objects) for key, objects in request.items()} for request in requests] == [
+        {'events': 75, 'attributes': 50},
+        {'events': 25},
+    ]
+    assert requests[1]['events'][0]['external_id'] == 'user-75'
+    p.shutdown()
+
+
+def test_Identify_SameUser_AttributesMerged(httpserver: HTTPServer):
+    httpserver.expect_request(re.compile('/users/track')).respond_with_data()
+    p = BrazePlugin('My-Key',
+                    BrazeOptions(base_url=httpserver.url_for(''), flush_queue_size=100, flush_interval=timedelta_max))
+    p.load(plugin_load_options)
+    p.identify("user-1", Properties(item1='identify', item2=2))
+    p.identify("user-2", identify_properties)
+    p.identify("user-1", Properties(item2=3, item3=True))
+    p.flush()
+    requests = _get_cleaned_requests(httpserver)
+    assert requests == [
+        {
+            'attributes': [
+                {'external_id': 'user-1', 'item1': 'identify', 'item2': 3, 'item3': True},
+                {'external_id': 'user-2', 'item1': 'identify', 'item2': 2},
+            ],
+        },
+    ]
+    p.shutdown()
+
+
+def test_Track_RateLimited_Delayed(httpserver: HTTPServer, tmp_path: Any):
+    httpserver.expect_request(re.compile('/users/track')).respond_with_data()
+    p = BrazePlugin('My-Key',
+                    BrazeOptions(base_url=httpserver.url_for(''), flush_queue_size=1, flush_interval=timedelta_max,
+                                 max_requests_per_second=10, rate_limit_burst=1,
+                                 rate_limit_file=str(tmp_path / 'braze-rate-limit')))
+    p.load(plugin_load_options)
+    start = time.monotonic()
+    p.track("user-1", event_1)
+    p.track("user-2", event_1)
+    p.track("user-3", event_1)
+    p.flush()
+    assert time.monotonic() - start >= 0.19
+    assert len(_get_cleaned_requests(httpserver)) == 3
+    p.shutdown()
+
+
+def test_Track_Status429_Retried(httpserver: HTTPServer):
+    httpserver.expect_oneshot_request(re.compile('/users/track')).respond_with_data(status=429)
+    httpserver.expect_request(re.compile('/users/track')).respond_with_data()
+    metrics = InMemoryMetrics()
+    p = BrazePlugin('My-Key',
+                    BrazeOptions(base_url=httpserver.url_for(''), flush_queue_size=100, flush_interval=timedelta_max))
+    p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE, metrics=metrics))
+    p.track("user-1", event_1)
+    p.flush()
+    assert len(_get_cleaned_requests(httpserver)) == 2
+    assert metrics.counter('itly.client.retries') == 1
+    assert metrics.counter('itly.client.dropped_events') == 0
+    p.shutdown()
+
+
+def test_TrackAndIdentify_EventLoop_Uploaded(httpserver: HTTPServer):
+    pytest.importorskip('httpx')
+    httpserver.expect_request(re.compile('/users/track')).respond_with_data()
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    p = BrazePlugin('My-Key',
+                    BrazeOptions(base_url=httpserver.url_for(''), flush_queue_size=100, flush_interval=timedelta_max,
+                                 event_loop=loop))
+    try:
+        p.load(plugin_load_options)
+        p.track("user-1", event_1)
+        p.identify("user-2", identify_properties)
+        p.flush()
+        requests = _get_cleaned_requests(httpserver)
+        assert [sorted(request) for request in requests] == [['attributes', 'events']]
+
+        p.track("user-1", event_2)
+        assert p.shutdown(timedelta(seconds=5)) == ShutdownResult(delivered=1)
+        assert len(_get_cleaned_requests(httpserver)) == 2
+        # The connection pool is closed on the application's loop
+        assert p._client._async_transport._client.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+
+
 def _get_cleaned_requests(httpserver: Any) -> List[Any]:
     requests = []
     for data in httpserver.collected_data:
@@ -0,0 +1,2 @@
+from ._file_plugin import FilePlugin, FileOptions
+from ._file_replayer import FileReplayer
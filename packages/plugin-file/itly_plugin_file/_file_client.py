@@ -0,0 +1,74 @@
+import atexit
+import queue
+import time
+from datetime import timedelta
+from threading import Event
+from typing import Dict, List, Any, Optional
+
+from itly_sdk import Logger, Metrics, ShutdownResult
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, ColumnarBatch, register_after_fork
+from ._segment_writer import SegmentWriter
+
+
+class FileClient:
+    def __init__(self,
+                 writer: SegmentWriter,
+                 flush_queue_size: int,
+                 flush_interval: timedelta,
+                 logger: Logger,
+                 metrics: Metrics = Metrics.NONE) -> None:
+        self._writer = writer
+        self._flush_queue_size = flush_queue_size
+        self._flush_interval = flush_interval
+        self._logger = logger
+        self._metrics = metrics
+        self._queue: queue.Queue = AsyncConsumer.create_queue()
+        self._consumer = self._create_consumer()
+        atexit.register(self.shutdown)
+        register_after_fork(self._reset_after_fork)
+        self._consumer.start()
+
+    def _create_consumer(self) -> AsyncConsumer:
+        return AsyncConsumer(message_queue=self._queue,
+                             do_upload=self._write_batch,
+                             flush_queue_size=self._flush_queue_size,
+                             flush_interval=self._flush_interval,
+                             metrics=self._metrics)
+
+    def _reset_after_fork(self) -> None:
+        # The consumer thread doesn't exist in the child and queued records are written by the parent
+        self._writer.reset_after_fork()
+        self._queue = AsyncConsumer.create_queue()
+        self._consumer = self._create_consumer()
+        self._consumer.start()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if "time" not in record:
+            record["time"] = int(time.time() * 1000)
+        try:
+            self._queue.put(AsyncConsumerMessage("records", record))
+        except queue.Full:
+            self._metrics.increment('itly.client.dropped_events')
+            self._logger.error("async queue is full")
+
+    def _write_batch(self, batch: List[AsyncConsumerMessage], stop_event: Event) -> int:
+        # Building and encoding a columnar batch is faster than json.dumps() per record,
+        # see benchmarks/bench_columnar_batch.py
+        records = ColumnarBatch(dictionary_fields=('type', 'event_name'))
+        records.extend(message.data for message in batch)
+        try:
+            self._writer.write(records.to_ndjson())
+        except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
+            self._logger.error(f'Unable to write {len(batch)} records. {e}')
+            return 0
+        return len(batch)
+
+    def flush(self) -> None:
+        self._consumer.flush()
+        self._writer.rotate_if_due()
+
+    def shutdown(self, timeout: Optional[timedelta] = None) -> ShutdownResult:
+        result = self._consumer.shutdown(timeout)
+        self._writer.close()
+        return result
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from typing import Optional, NamedTuple, Dict, Any
+
+from itly_sdk import Plugin, PluginLoadOptions, Properties, Event, Logger, ShutdownResult
+from ._file_client import FileClient
+from ._segment_writer import SegmentWriter
+
+
+class FileOptions(NamedTuple):
+    """
+    File Options
+
+    :param compress:         Write gzip compressed segments (`.ndjson.gz`) instead of plain NDJSON (`.ndjson`)
+    :param max_segment_size: Size in bytes after which the current segment is closed and a new one is started
+    :param max_segment_age:  Age after which the current segment is closed on the next write or flush
+    :param flush_queue_size: The maximum number of records written at once
+    :param flush_interval:   The maximum time records are buffered before they are written
+    :param file_prefix:      Prefix of segment file names
+    """
+
+    compress: bool = False
+    max_segment_size: int = 64 * 1024 * 1024
+    max_segment_age: timedelta = timedelta(hours=1)
+    flush_queue_size: int = 1000
+    flush_interval: timedelta = timedelta(seconds=1)
+    file_prefix: str = 'itly'
+
+
+class FilePlugin(Plugin):
+    def __init__(self, directory: str, options: Optional[FileOptions] = None) -> None:
+        self._directory = directory
+        self._options: FileOptions = options if options is not None else FileOptions()
+        self._client: Optional[FileClient] = None
+        self._logger: Logger = Logger.NONE
+
+    def id(self) -> str:
+        return 'file'
+
+    def load(self, options: PluginLoadOptions) -> None:
+        writer = SegmentWriter(directory=self._directory,
+                               file_prefix=self._options.file_prefix,
+                               compress=self._options.compress,
+                               max_segment_size=self._options.max_segment_size,
+                               max_segment_age=self._options.max_segment_age)
+        self._client = FileClient(writer=writer,
+                                  flush_queue_size=self._options.flush_queue_size,
+                                  flush_interval=self._options.flush_interval,
+                                  logger=options.logger,
+                                  metrics=options.metrics)
+        self._logger = options.logger
+
+    def alias(self, user_id: str, previous_id: str) -> None:
+        self._write({"type": "alias", "user_id": user_id, "previous_id": previous_id})
+
+    def identify(self, user_id: str, properties: Optional[Properties]) -> None:
+        self._write({"type": "identify", "user_id": user_id, "properties": self._to_json(properties)})
+
+    def group(self, user_id: str, group_id: str, properties: Optional[Properties]) -> None:
+        self._write({"type": "group", "user_id": user_id, "group_id": group_id, "properties": self._to_json(properties)})
+
+    def page(self, user_id: str, category: Optional[str], name: Optional[str], properties: Optional[Properties]) -> None:
+        self._write({
+            "type": "page",
+            "user_id": user_id,
+            "category": category,
+            "name": name,
+            "properties": self._to_json(properties),
+        })
+
+    def track(self, user_id: str, event: Event) -> None:
+        record = {
+            "type": "track",
+            "user_id": user_id,
+            "event_name": event.name,
+            "properties": self._to_json(event.properties),
+        }
+        if event.id is not None:
+            record["event_id"] = event.id
+        if event.version is not None:
+            record["event_version"] = event.version
+        if event.insert_id is not None:
+            record["insert_id"] = event.insert_id
+        self._write(record)
+
+    def flush(self) -> None:
+        assert self._client is not None
+        self._client.flush()
+
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
+        assert self._client is not None
+        return self._client.shutdown(timeout)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        assert self._client is not None
+        self._client.write(record)
+
+    @staticmethod
+    def _to_json(properties: Optional[Properties]) -> Optional[Dict[str, Any]]:
+        return properties.to_json() if properties is not None else None
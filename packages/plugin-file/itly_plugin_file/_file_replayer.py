@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+from typing import Dict, Any, Iterator, List, Optional, Union, IO
+
+from itly_sdk import Itly, Plugin, Properties, Event, EventMetadata
+from ._segment_writer import OPEN_SUFFIX, recover_abandoned_segments
+
+try:
+    from itly_plugin_amplitude import AmplitudeMetadata
+except ImportError:  # pragma: no cover
+    AmplitudeMetadata = None  # type: ignore
+
+Target = Union[Itly, Plugin]
+
+
+class FileReplayer:
+    """
+    Replays segments written by FilePlugin through Itly or a loaded plugin
+
+    Only closed segments are read, in the order they were written. Targets batch records in their own queues,
+    so call `flush()` on the target after replaying. Tracked events keep their original `time` in Amplitude,
+    as AmplitudeMetadata when itly_plugin_amplitude is installed. Event has no timestamp, so other destinations
+    and other record types use the replay time.
+
+    With `recover_abandoned`, segments left open by a process that is no longer running, e.g. after a crash,
+    are closed and replayed too.
+    """
+
+    def __init__(self, directory: str, recover_abandoned: bool = False) -> None:
+        self._directory = directory
+        self._recover_abandoned = recover_abandoned
+
+    def segments(self) -> List[str]:
+        if self._recover_abandoned:
+            recover_abandoned_segments(self._directory)
+        names = [name for name in os.listdir(self._directory)
+                 if (name.endswith('.ndjson') or name.endswith('.ndjson.gz')) and not name.endswith(OPEN_SUFFIX)]
+        # Names start with the prefix and the segment start time
+        return [os.path.join(self._directory, name) for name in sorted(names)]
+
+    def records(self, path: str) -> Iterator[Dict[str, Any]]:
+        with self._open(path) as lines:
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+    def replay(self, target: Target, remove: bool = False) -> int:
+        """
+        Replay all closed segments and return the number of records.
+
+        :param target: Itly instance or loaded plugin
+        :param remove: Remove each segment after its records were passed to the target
+        """
+        count = 0
+        for path in self.segments():
+            for record in self.records(path):
+                replay_record(target, record)
+                count += 1
+            if remove:
+                os.remove(path)
+        return count
+
+    @staticmethod
+    def _open(path: str) -> IO[bytes]:
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        return open(path, 'rb')
+
+
+def replay_record(target: Target, record: Dict[str, Any]) -> None:
+    record_type = record["type"]
+    user_id = record["user_id"]
+    json_properties = record.get("properties")
+    properties = Properties(**json_properties) if json_properties is not None else None
+    if record_type == "track":
+        event = Event(record["event_name"],
+                      properties,
+                      id_=record.get("event_id"),
+                      version=record.get("event_version"),
+                      metadata=_recorded_time_metadata(record),
+                      insert_id=record.get("insert_id"))
+        target.track(user_id, event)
+    elif record_type == "identify":
+        target.identify(user_id, properties)
+    elif record_type == "group":
+        target.group(user_id, record["group_id"], properties)
+    elif record_type == "page":
+        target.page(user_id, record.get("category"), record.get("name"), properties)
+    elif record_type == "alias":
+        target.alias(user_id, record["previous_id"])
+    else:
+        raise ValueError(f"Unknown record type '{record_type}'.")
+
+
+def _recorded_time_metadata(record: Dict[str, Any]) -> Optional[Dict[str, EventMetadata]]:
+    """Metadata passing the recorded time to destinations that accept one"""
+    recorded_time = record.get("time")
+    if recorded_time is None or AmplitudeMetadata is None:
+        return None
+    return {"amplitude": AmplitudeMetadata(time=recorded_time)}
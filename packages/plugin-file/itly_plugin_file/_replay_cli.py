@@ -0,0 +1,170 @@
+import argparse
+import gzip
+import importlib
+import json
+import multiprocessing
+import queue
+import re
+import sys
+import time
+import zlib
+from typing import List, Iterator, Iterable, Optional, Any, IO, Tuple
+
+from itly_sdk import Itly, Options, Plugin, Environment
+from ._file_replayer import replay_record
+
+# Matches the user id of a record without parsing the whole line
+_USER_ID = re.compile(rb'"user_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+_PROGRESS_EVERY = 1000
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Replay NDJSON records written by FilePlugin through Itly.
+
+    Example: python -m itly_plugin_file --target myapp.analytics:create_itly --processes 4 segments/*.ndjson.gz
+    """
+    parser = argparse.ArgumentParser(prog='itly-replay', description='Replay NDJSON records through Itly.')
+    parser.add_argument('inputs', nargs='+', help="NDJSON files, optionally gzip compressed (.gz), or '-' for stdin")
+    parser.add_argument('--target', required=True,
+                        help="'module:callable' returning a loaded Itly instance or a list of plugins")
+    parser.add_argument('--environment', default=Environment.PRODUCTION.value,
+                        choices=[environment.value for environment in Environment],
+                        help='Environment used to load plugins returned by the target')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of processes, records are sharded across them by user id. '
+                             'Records without a user id are replayed by the first process')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='Seconds between progress reports')
+    args = parser.parse_args(argv)
+
+    if args.processes > 1 and '-' in args.inputs:
+        parser.error("stdin can't be read by multiple processes")
+
+    start = time.monotonic()
+    if args.processes <= 1:
+        total, without_user_id = _replay_shard(args.inputs, args.target, args.environment, 0, 1, None,
+                                               args.progress_interval, start)
+    else:
+        total, without_user_id = _replay_in_processes(args, start)
+    elapsed = time.monotonic() - start
+    _report(total, elapsed, final=True, without_user_id=without_user_id)
+    return 0
+
+
+def _replay_in_processes(args: argparse.Namespace, start: float) -> Tuple[int, int]:
+    progress: Any = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_replay_shard,
+                                args=(args.inputs, args.target, args.environment, shard, args.processes, progress,
+                                      args.progress_interval, start))
+        for shard in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    counts = [0] * args.processes
+    without_user_id = 0
+    finished = 0
+    last_report = start
+    while finished < len(workers):
+        try:
+            shard, count, shard_without_user_id, done = progress.get(timeout=args.progress_interval)
+            counts[shard] = count
+            if done:
+                without_user_id += shard_without_user_id
+                finished += 1
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+        if time.monotonic() - last_report >= args.progress_interval:
+            last_report = time.monotonic()
+            _report(sum(counts), last_report - start)
+
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            raise SystemExit(f'Replay process failed with exit code {worker.exitcode}')
+    return sum(counts), without_user_id
+
+
+def _replay_shard(inputs: List[str], target_name: str, environment: str, shard: int, shards: int,
+                  progress: Any, progress_interval: float, start: float) -> Tuple[int, int]:
+    """Replay the shard's records, return the number of records and of lines without a user id"""
+    itly = _create_itly(target_name, Environment(environment))
+    count = 0
+    without_user_id = [0]
+    last_report = time.monotonic()
+    try:
+        for record in _records(_shard(_lines(inputs), shard, shards, without_user_id)):
+            replay_record(itly, record)
+            count += 1
+            if count % _PROGRESS_EVERY == 0 and time.monotonic() - last_report >= progress_interval:
+                last_report = time.monotonic()
+                if progress is not None:
+                    progress.put((shard, count, without_user_id[0], False))
+                else:
+                    _report(count, last_report - start)
+        itly.flush()
+    finally:
+        itly.shutdown()
+
+    if progress is not None:
+        progress.put((shard, count, without_user_id[0], True))
+    return count, without_user_id[0]
+
+
+def _create_itly(target_name: str, environment: Environment) -> Itly:
+    module_name, _, attribute = target_name.partition(':')
+    target = getattr(importlib.import_module(module_name), attribute)()
+    if isinstance(target, Itly):
+        return target
+
+    plugins: List[Plugin] = target if isinstance(target, list) else [target]
+    itly = Itly()
+    itly.load(options=Options(environment=environment, plugins=plugins))
+    return itly
+
+
+def _lines(inputs: Iterable[str]) -> Iterator[bytes]:
+    for path in inputs:
+        with _open(path) as lines:
+            yield from lines
+
+
+def _shard(lines: Iterable[bytes], shard: int, shards: int, without_user_id: List[int]) -> Iterator[bytes]:
+    """Yield the shard's lines, and count the lines without a user id in `without_user_id[0]`"""
+    if shards <= 1:
+        yield from lines
+        return
+    for line in lines:
+        match = _USER_ID.search(line)
+        if match is None:
+            # E.g. a null user id. Every process sees the line, only the first one replays it
+            if shard == 0 and line.strip():
+                without_user_id[0] += 1
+                yield line
+        elif zlib.crc32(match.group(1)) % shards == shard:
+            yield line
+
+
+def _records(lines: Iterable[bytes]) -> Iterator[Any]:
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _open(path: str) -> IO[bytes]:
+    if path == '-':
+        return sys.stdin.buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _report(count: int, elapsed: float, final: bool = False, without_user_id: int = 0) -> None:
+    throughput = count / elapsed if elapsed > 0 else 0.0
+    prefix = 'replayed' if final else 'replaying:'
+    suffix = f', {without_user_id} records without a user id replayed by the first process' \
+        if without_user_id > 0 else ''
+    print(f'{prefix} {count} records in {elapsed:.1f}s ({throughput:.0f} records/s){suffix}', file=sys.stderr)
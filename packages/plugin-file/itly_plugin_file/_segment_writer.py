@@ -0,0 +1,127 @@
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Optional, BinaryIO, List
+
+OPEN_SUFFIX = '.open'
+
+
+class SegmentWriter:
+    """
+    Appends NDJSON data to segment files in a directory
+
+    The current segment has an `.open` suffix, which is removed when the segment is rotated or closed.
+    Segments left open by a crashed process with the same prefix are closed when the writer is created.
+    Compressed data is written as one gzip member per write, so a segment stays readable if the process crashes.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 file_prefix: str,
+                 compress: bool,
+                 max_segment_size: int,
+                 max_segment_age: timedelta) -> None:
+        self._directory = directory
+        self._file_prefix = file_prefix
+        self._compress = compress
+        self._max_segment_size = max_segment_size
+        self._max_segment_age = max_segment_age
+        self._file: Optional[BinaryIO] = None
+        self._path = ''
+        self._opened_at = 0.0
+        self._size = 0
+        self._sequence = 0
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        recover_abandoned_segments(directory, file_prefix)
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            assert self._file is not None
+            if self._compress:
+                data = gzip.compress(data)
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self._rotate_if_due()
+
+    def rotate_if_due(self) -> None:
+        with self._lock:
+            self._rotate_if_due()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    def reset_after_fork(self) -> None:
+        # The file belongs to the parent process, which closes and renames it
+        self._file = None
+        self._lock = Lock()
+
+    def _rotate_if_due(self) -> None:
+        if self._file is None:
+            return
+        if self._size >= self._max_segment_size or \
+                time.monotonic() - self._opened_at >= self._max_segment_age.total_seconds():
+            self._close_segment()
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        extension = '.ndjson.gz' if self._compress else '.ndjson'
+        name = f'{self._file_prefix}-{timestamp}-{os.getpid()}-{self._sequence:06d}{extension}'
+        self._path = os.path.join(self._directory, name)
+        self._file = open(self._path + OPEN_SUFFIX, 'ab')
+        self._opened_at = time.monotonic()
+        self._size = 0
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.replace(self._path + OPEN_SUFFIX, self._path)
+
+
+def recover_abandoned_segments(directory: str, file_prefix: Optional[str] = None) -> List[str]:
+    """
+    Close segments left open by processes that are no longer running, and return their paths.
+
+    Names end with the pid of the writing process, segments of running processes are left open.
+    """
+    recovered: List[str] = []
+    for name in os.listdir(directory):
+        if not name.endswith(OPEN_SUFFIX) or (file_prefix is not None and not name.startswith(file_prefix + '-')):
+            continue
+        path = os.path.join(directory, name[:-len(OPEN_SUFFIX)])
+        # {prefix}-{timestamp}-{pid}-{sequence}{extension}
+        parts = os.path.basename(path).split('.', 1)[0].rsplit('-', 2)
+        if len(parts) != 3 or not parts[1].isdigit() or _is_running(int(parts[1])):
+            continue
+        try:
+            os.replace(path + OPEN_SUFFIX, path)
+        except FileNotFoundError:
+            # Recovered by another process
+            continue
+        recovered.append(path)
+    return recovered
+
+
+def _is_running(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':
+        # os.kill() terminates the process on Windows, leave its segments open
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    return True
@@ -0,0 +1,158 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+from datetime import timedelta
+from typing import List, Any, Optional
+
+import pytest
+
+from itly_plugin_file import FilePlugin, FileOptions, FileReplayer
+from itly_sdk import Itly, Options, PluginLoadOptions, Environment, Properties, Event, Logger, Plugin
+
+plugin_load_options = PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE)
+
+
+def test_file(tmp_path):
+    p = FilePlugin(str(tmp_path))
+
+    assert p.id() == 'file'
+    p.load(plugin_load_options)
+
+    p.identify("user-1", Properties(item1='value1', item2=2))
+    p.alias("user-1", "prev-user-1")
+    p.track("user-2", Event('event-1', Properties(item1='value1', item2=1), id_='id-1', version='1.0.0'))
+    p.group("user-2", "group-2", Properties(item1='value2', item2=2))
+    p.page("user-2", "category-2", "page-3", None)
+    p.flush()
+
+    # Segment is closed on shutdown
+    assert os.listdir(str(tmp_path))[0].endswith('.ndjson.open')
+    p.shutdown()
+
+    files = os.listdir(str(tmp_path))
+    assert len(files) == 1 and files[0].endswith('.ndjson')
+    with open(os.path.join(str(tmp_path), files[0])) as f:
+        records = [json.loads(line) for line in f]
+    assert _without_time(records) == [
+        {'type': 'identify', 'user_id': 'user-1', 'properties': {'item1': 'value1', 'item2': 2}},
+        {'type': 'alias', 'user_id': 'user-1', 'previous_id': 'prev-user-1'},
+        {'type': 'track', 'user_id': 'user-2', 'event_name': 'event-1', 'properties': {'item1': 'value1', 'item2': 1},
+         'event_id': 'id-1', 'event_version': '1.0.0'},
+        {'type': 'group', 'user_id': 'user-2', 'group_id': 'group-2', 'properties': {'item1': 'value2', 'item2': 2}},
+        {'type': 'page', 'user_id': 'user-2', 'category': 'category-2', 'name': 'page-3', 'properties': None},
+    ]
+
+
+def test_file_rotation(tmp_path):
+    p = FilePlugin(str(tmp_path), FileOptions(compress=True, max_segment_size=1, flush_queue_size=2,
+                                              flush_interval=timedelta(seconds=10)))
+    p.load(plugin_load_options)
+
+    for i in range(5):
+        p.track("user-1", Event(f'event-{i}'))
+    p.flush()
+    p.shutdown()
+
+    files = sorted(os.listdir(str(tmp_path)))
+    assert len(files) == 3
+    assert all(name.endswith('.ndjson.gz') for name in files)
+    with gzip.open(os.path.join(str(tmp_path), files[0])) as f:
+        assert [json.loads(line)['event_name'] for line in f] == ['event-0', 'event-1']
+
+
+def test_file_replay(tmp_path):
+    p = FilePlugin(str(tmp_path), FileOptions(compress=True, max_segment_size=1, flush_queue_size=2))
+    p.load(plugin_load_options)
+    p.identify("user-1", Properties(item1='value1'))
+    p.track("user-1", Event('event-1', Properties(item1='value1'), insert_id='insert-1'))
+    p.track("user-2", Event('event-2'))
+    p.flush()
+    p.shutdown()
+
+    target = RecordingPlugin()
+    replayer = FileReplayer(str(tmp_path))
+    assert replayer.replay(target, remove=True) == 3
+    assert target.calls == [
+        ('identify', 'user-1', {'item1': 'value1'}),
+        ('track', 'user-1', 'event-1', {'item1': 'value1'}, 'insert-1'),
+        ('track', 'user-2', 'event-2', None, None),
+    ]
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_file_replay_abandoned_segment(tmp_path):
+    # Segment left open by a crashed process, and the open segment of a running process
+    dead_pid = subprocess.Popen([sys.executable, '-c', '']).pid
+    os.waitpid(dead_pid, 0)
+    abandoned = os.path.join(str(tmp_path), f'itly-20200101T000000-{dead_pid}-000001.ndjson.open')
+    running = os.path.join(str(tmp_path), f'itly-20200101T000000-{os.getpid()}-000001.ndjson.open')
+    for path in (abandoned, running):
+        with open(path, 'w') as f:
+            f.write(json.dumps({'type': 'track', 'user_id': 'user-1', 'event_name': 'event-1'}) + '\n')
+
+    target = RecordingPlugin()
+    assert FileReplayer(str(tmp_path)).replay(target) == 0
+    assert FileReplayer(str(tmp_path), recover_abandoned=True).replay(target, remove=True) == 1
+    assert target.calls == [('track', 'user-1', 'event-1', None, None)]
+    assert os.listdir(str(tmp_path)) == [os.path.basename(running)]
+
+    # A new writer closes abandoned segments with its prefix on startup
+    os.replace(running, abandoned)
+    p = FilePlugin(str(tmp_path))
+    p.load(plugin_load_options)
+    assert os.listdir(str(tmp_path)) == [os.path.basename(abandoned)[:-len('.open')]]
+    p.shutdown()
+
+
+def test_file_replay_keeps_recorded_time(tmp_path, httpserver):
+    pytest.importorskip('itly_plugin_amplitude')
+    from itly_plugin_amplitude import AmplitudePlugin, AmplitudeOptions
+    httpserver.expect_request('/events').respond_with_json({'code': 200})
+
+    records = [
+        {'type': 'track', 'user_id': 'user-1', 'event_name': 'event-1', 'time': 1600000000000},
+        {'type': 'identify', 'user_id': 'user-1', 'properties': {'item1': 'value1'}, 'time': 1600000001000},
+    ]
+    with open(os.path.join(str(tmp_path), 'itly-20200101T000000-1-000001.ndjson'), 'w') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+
+    amplitude = AmplitudePlugin('My-Key', AmplitudeOptions(events_endpoint=httpserver.url_for('/events'),
+                                                           identify_as_event=True))
+    itly = Itly()
+    itly.load(context=Properties(app='replay'),
+              options=Options(plugins=[amplitude], environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+    try:
+        assert FileReplayer(str(tmp_path)).replay(itly) == 2
+        itly.flush()
+
+        events = [event for data in httpserver.collected_data for event in json.loads(data)['events']]
+        assert [event['event_type'] for event in events] == ['event-1', '$identify']
+        # Tracked events keep their recorded time, Itly.identify() has no metadata so identify uses the replay time
+        assert events[0]['time'] == 1600000000000
+        assert events[1]['time'] > 1600000001000
+    finally:
+        itly.shutdown()
+        httpserver.stop()
+
+
+class RecordingPlugin(Plugin):
+    def __init__(self) -> None:
+        self.calls: List[Any] = []
+
+    def id(self) -> str:
+        return 'recording'
+
+    def identify(self, user_id: str, properties: Optional[Properties]) -> None:
+        self.calls.append(('identify', user_id, properties.to_json() if properties is not None else None))
+
+    def track(self, user_id: str, event: Event) -> None:
+        self.calls.append(('track', user_id, event.name,
+                           event.properties.to_json() if event.properties is not None else None, event.insert_id))
+
+
+def _without_time(records: List[Any]) -> List[Any]:
+    for record in records:
+        assert isinstance(record.pop('time'), int)
+    return records
@@ -0,0 +1,46 @@
+import json
+import os
+from typing import Any, List
+
+import pytest
+
+from itly_plugin_file import FilePlugin, FileReplayer
+from itly_plugin_file._replay_cli import main
+
+RECORDS = [
+    {"type": "identify", "user_id": f"user-{i}", "properties": {"index": i}} if i % 10 == 0 else
+    {"type": "track", "user_id": f"user-{i % 7}", "event_name": f"event-{i % 3}", "properties": {"index": i}}
+    for i in range(100)
+] + [
+    # Anonymous records aren't sharded by user id
+    {"type": "track", "user_id": None, "event_name": "event-anonymous", "properties": {"index": i}}
+    for i in range(100, 103)
+]
+
+
+def create_file_plugin() -> List[FilePlugin]:
+    return [FilePlugin(os.environ['ITLY_REPLAY_TEST_OUTPUT'])]
+
+
+@pytest.mark.parametrize('processes', [1, 3])
+def test_replay_cli(tmp_path, monkeypatch, capsys, processes):
+    input_path = tmp_path / 'input.ndjson'
+    input_path.write_text(''.join(json.dumps(record) + '\n' for record in RECORDS))
+    output = tmp_path / 'output'
+    monkeypatch.setenv('ITLY_REPLAY_TEST_OUTPUT', str(output))
+
+    assert main([str(input_path), '--target', 'test_replay_cli:create_file_plugin',
+                 '--processes', str(processes)]) == 0
+
+    replayer = FileReplayer(str(output))
+    assert len(replayer.segments()) == processes
+    replayed = [_without_time(record) for path in replayer.segments() for record in replayer.records(path)]
+    assert sorted(replayed, key=lambda record: record['properties']['index']) == RECORDS
+    err = capsys.readouterr().err
+    assert 'replayed 103 records' in err
+    assert ('3 records without a user id replayed by the first process' in err) == (processes > 1)
+
+
+def _without_time(record: Any) -> Any:
+    record.pop('time')
+    return record
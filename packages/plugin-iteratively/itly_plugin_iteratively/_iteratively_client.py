@@ -1,3 +1,4 @@
+import asyncio
 import atexit
 import enum
 import queue
@@ -5,11 +6,10 @@ import threading
 from datetime import datetime, timedelta
 from typing import Callable, List, Optional, Any
 
-import requests
-from requests import Session
-
-from itly_sdk import Event, Properties, ValidationResponse
-from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, backoff
+from itly_sdk import Event, Properties, ValidationResponse, Metrics, ShutdownResult
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, AsyncIOConsumer, Delay, HttpRequest, \
+    HttpTransportError, HttpxTransport, RequestsTransport, SharedUploaderClient, UploadSteps, backoff, \
+    register_after_fork, run_upload, run_upload_async, start_shared_uploader_process
 from ._retry_options import IterativelyRetryOptions
 
 
@@ -28,20 +28,80 @@ class IterativelyClient:
                  flush_interval: timedelta,
                  request_timeout: timedelta,
                  omit_values: bool, retry_options: IterativelyRetryOptions,
-                 on_error: Callable[[str], None]) -> None:
+                 on_error: Callable[[str], None],
+                 metrics: Metrics = Metrics.NONE,
+                 shared_uploader_socket: Optional[str] = None,
+                 event_loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
         self._api_endpoint = api_endpoint
         self._api_key = api_key
         self._request_timeout = request_timeout
         self._omit_values = omit_values
         self._retry_options = retry_options
         self._on_error = on_error
+        self._metrics = metrics
+        self._flush_queue_size = flush_queue_size
+        self._flush_interval = flush_interval
+        self._shared_uploader: Optional[SharedUploaderClient] = None
+        self._consumer: Optional[AsyncConsumer] = None
+        self._asyncio_consumer: Optional[AsyncIOConsumer] = None
+        if shared_uploader_socket is not None:
+            # Events are batched and uploaded by a separate process shared with other workers
+            if event_loop is not None:
+                raise ValueError("event_loop can't be combined with shared_uploader_socket, "
+                                 "events are uploaded by the shared uploader process.")
+            if metrics is not Metrics.NONE:
+                raise ValueError("metrics can't be combined with shared_uploader_socket, "
+                                 "events are uploaded by the shared uploader process.")
+            config = {
+                "api_endpoint": api_endpoint,
+                "api_key": api_key,
+                "flush_queue_size": flush_queue_size,
+                "flush_interval": flush_interval.total_seconds(),
+                "request_timeout": request_timeout.total_seconds(),
+                "omit_values": omit_values,
+                "max_retries": retry_options.max_retries,
+                "delay_initial": retry_options.delay_initial.total_seconds(),
+                "delay_maximum": retry_options.delay_maximum.total_seconds(),
+            }
+            socket_path = shared_uploader_socket
+            self._shared_uploader = SharedUploaderClient(
+                socket_path=socket_path,
+                start_server=lambda: start_shared_uploader_process(
+                    "itly_plugin_iteratively._shared_uploader", socket_path, config),
+                on_error=on_error)
+            return
+
+        if event_loop is not None:
+            # Batches are uploaded by tasks on the application's event loop, sharing one connection pool
+            self._async_transport = HttpxTransport(request_timeout)
+            self._asyncio_consumer = AsyncIOConsumer(loop=event_loop,
+                                                     do_upload=self._upload_batch_async,
+                                                     flush_queue_size=flush_queue_size,
+                                                     flush_interval=flush_interval,
+                                                     metrics=metrics)
+            atexit.register(self.shutdown)
+            self._asyncio_consumer.start()
+            return
+
         self._queue: queue.Queue = AsyncConsumer.create_queue()
-        self._session = Session()
-        self._consumer = AsyncConsumer(self._queue,
-                                       do_upload=self._upload_batch,
-                                       flush_queue_size=flush_queue_size,
-                                       flush_interval=flush_interval)
+        self._transport = RequestsTransport(request_timeout)
+        self._consumer = self._create_consumer()
         atexit.register(self.shutdown)
+        register_after_fork(self._reset_after_fork)
+        self._consumer.start()
+
+    def _create_consumer(self) -> AsyncConsumer:
+        return AsyncConsumer(self._queue,
+                             do_upload=self._upload_batch,
+                             flush_queue_size=self._flush_queue_size,
+                             flush_interval=self._flush_interval,
+                             metrics=self._metrics)
+
+    def _reset_after_fork(self) -> None:
+        # The consumer thread doesn't exist in the child and queued messages are uploaded by the parent
+        self._queue = AsyncConsumer.create_queue()
+        self._transport = RequestsTransport(self._request_timeout)
+        self._consumer = self._create_consumer()
         self._consumer.start()
 
     def track(self, track_type: TrackType, event: Optional[Event] = None, properties: Optional[Properties] = None,
@@ -77,45 +137,53 @@ class IterativelyClient:
 
         self._enqueue(AsyncConsumerMessage("events", model))
 
-    def _upload_batch(self, batch: List[AsyncConsumerMessage], stop_event: threading.Event) -> None:
-        data = {
-            'objects': [message.data for message in batch],
-        }
+    def _upload_batch(self, batch: List[AsyncConsumerMessage], stop_event: threading.Event) -> int:
+        try:
+            # None when the upload was abandoned on shutdown
+            return run_upload(self._upload_steps(batch), self._transport, stop_event, self._metrics) or 0
+        except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
+            self._on_error(str(e))
+            return 0
+
+    async def _upload_batch_async(self, batch: List[AsyncConsumerMessage]) -> int:
         try:
-            self._send_request(data, stop_event)
+            return await run_upload_async(self._upload_steps(batch), self._async_transport, self._metrics) or 0
         except Exception as e:
+            self._metrics.increment('itly.client.dropped_events', len(batch))
             self._on_error(str(e))
+            return 0
 
-    def _send_request(self, data: Any, stop_event: threading.Event) -> None:
-        need_retry = self._post_request(data)
+    def _upload_steps(self, batch: List[AsyncConsumerMessage]) -> UploadSteps[int]:
+        """Upload a batch and return the number of delivered messages"""
+        data = {
+            'objects': [message.data for message in batch],
+        }
+        need_retry = yield from self._post_request(data)
         if not need_retry:
-            return
+            return len(batch)
         for delay in backoff(start=self._retry_options.delay_initial.total_seconds(),
                              stop=self._retry_options.delay_maximum.total_seconds(),
                              count=self._retry_options.max_retries - 1,
                              factor=2.0,
                              jitter=1.0):
-            if stop_event.wait(delay):
-                return
+            yield Delay(delay)
 
-            need_retry = self._post_request(data)
+            self._metrics.increment('itly.client.retries')
+            need_retry = yield from self._post_request(data)
             if not need_retry:
-                return
+                return len(batch)
         raise Exception("Failed to upload events. Maximum attempts exceeded.")
 
-    def _post_request(self, data: Any) -> bool:
+    def _post_request(self, data: Any) -> UploadSteps[bool]:
         try:
-            response = self._session.post(self._api_endpoint,
-                                          json=data,
-                                          headers={'Authorization': 'Bearer ' + self._api_key},
-                                          timeout=self._request_timeout.total_seconds())
-        except requests.ConnectionError:
+            response = yield HttpRequest(url=self._api_endpoint,
+                                         json=data,
+                                         headers={'Authorization': 'Bearer ' + self._api_key})
+        except HttpTransportError:
             return True
-        except requests.Timeout:
-            return True
-        except Exception as e:
-            raise Exception(f"A unhandled exception occurred. ({e}).")
 
+        assert response is not None
         if 200 <= response.status_code < 300:
             return False
         if 500 <= response.status_code < 600:
@@ -124,14 +192,38 @@ class IterativelyClient:
             return True
         raise Exception(f"Upload failed due to unhandled HTTP error ({response.status_code}).")
 
-    def shutdown(self) -> None:
-        self._consumer.shutdown()
+    def shutdown(self, timeout: Optional[timedelta] = None) -> ShutdownResult:
+        if self._shared_uploader is not None:
+            # Queued events are delivered by the shared uploader process
+            self._shared_uploader.flush()
+            self._shared_uploader.close()
+            return ShutdownResult()
+        if self._asyncio_consumer is not None:
+            result = self._asyncio_consumer.shutdown_threadsafe(timeout)
+            self._asyncio_consumer.run_threadsafe(self._async_transport.close(), timeout)
+            return result
+        assert self._consumer is not None
+        return self._consumer.shutdown(timeout)
 
     def _enqueue(self, message: AsyncConsumerMessage) -> None:
+        if self._shared_uploader is not None:
+            self._shared_uploader.put(message)
+            return
         try:
-            self._queue.put(message)
+            if self._asyncio_consumer is not None:
+                self._asyncio_consumer.put(message)
+            else:
+                self._queue.put(message)
         except queue.Full:
+            self._metrics.increment('itly.client.dropped_events')
             self._on_error("async queue is full")
 
     def flush(self) -> None:
+        if self._shared_uploader is not None:
+            self._shared_uploader.flush()
+            return
+        if self._asyncio_consumer is not None:
+            self._asyncio_consumer.flush_threadsafe()
+            return
+        assert self._consumer is not None
         self._consumer.flush()
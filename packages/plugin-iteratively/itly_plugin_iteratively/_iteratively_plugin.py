@@ -1,7 +1,9 @@
+import asyncio
 from datetime import timedelta
 from typing import Optional, NamedTuple, List
 
-from itly_sdk import Plugin, PluginLoadOptions, Properties, Event, Environment, ValidationResponse, Logger
+from itly_sdk import Plugin, PluginLoadOptions, Properties, Event, Environment, ValidationResponse, Logger, \
+    ShutdownResult
 from ._iteratively_client import IterativelyClient, TrackType
 from ._retry_options import IterativelyRetryOptions
 
@@ -13,6 +15,10 @@ class IterativelyOptions(NamedTuple):
     disabled: Optional[bool] = None
     retry_options: IterativelyRetryOptions = IterativelyRetryOptions()
     request_timeout: timedelta = timedelta(seconds=15)
+    # Batch and upload events in one process shared by all processes using this socket path, e.g. pre-fork
+    # workers. Can't be combined with event_loop or with the Itly metrics option.
+    shared_uploader_socket: Optional[str] = None
+    event_loop: Optional[asyncio.AbstractEventLoop] = None
 
 
 class IterativelyPlugin(Plugin):
@@ -42,7 +48,10 @@ class IterativelyPlugin(Plugin):
                                          request_timeout=self._options.request_timeout,
                                          retry_options=self._options.retry_options,
                                          omit_values=self._options.omit_values,
-                                         on_error=self._on_error)
+                                         on_error=self._on_error,
+                                         metrics=options.metrics,
+                                         shared_uploader_socket=self._options.shared_uploader_socket,
+                                         event_loop=self._options.event_loop)
         self._logger = options.logger
 
     def post_identify(self,
@@ -101,12 +110,12 @@ class IterativelyPlugin(Plugin):
         assert self._client is not None
         self._client.flush()
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
         if self._disabled:
-            return
+            return None
 
         assert self._client is not None
-        self._client.shutdown()
+        return self._client.shutdown(timeout)
 
     def _on_error(self, err: str) -> None:
         self._logger.error(f"Error. {err}")
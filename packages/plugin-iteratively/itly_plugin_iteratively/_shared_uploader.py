@@ -0,0 +1,36 @@
+import json
+import sys
+from datetime import timedelta
+
+from itly_sdk.internal import SharedUploaderServer
+from ._iteratively_client import IterativelyClient
+from ._retry_options import IterativelyRetryOptions
+
+
+def _print_error(err: str) -> None:
+    print(f"[itly-iteratively-uploader] Error. {err}", file=sys.stderr)
+
+
+def main() -> None:
+    """Upload events sent by IterativelyClient instances configured with the same `shared_uploader_socket`."""
+    socket_path = sys.argv[1]
+    config = json.load(sys.stdin)
+    client = IterativelyClient(api_endpoint=config["api_endpoint"],
+                               api_key=config["api_key"],
+                               flush_queue_size=config["flush_queue_size"],
+                               flush_interval=timedelta(seconds=config["flush_interval"]),
+                               request_timeout=timedelta(seconds=config["request_timeout"]),
+                               omit_values=config["omit_values"],
+                               retry_options=IterativelyRetryOptions(
+                                   max_retries=config["max_retries"],
+                                   delay_initial=timedelta(seconds=config["delay_initial"]),
+                                   delay_maximum=timedelta(seconds=config["delay_maximum"])),
+                               on_error=_print_error)
+    try:
+        SharedUploaderServer(socket_path, enqueue=client._enqueue, flush=client.flush).serve_forever()
+    finally:
+        client.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,18 @@
+import asyncio
 import json
+import os
 import re
+import threading
 import time
 from copy import deepcopy
 from datetime import timedelta
 from typing import List, Any
 
+import pytest
 from pytest_httpserver import HTTPServer
 
 from itly_plugin_iteratively import IterativelyPlugin, IterativelyOptions, IterativelyRetryOptions
-from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger, ValidationResponse
+from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger, ValidationResponse, ShutdownResult
 
 # Test Fixtures
 user_id = "test-user-id"
@@ -385,6 +389,92 @@ def test_iteratively_retry(httpserver: HTTPServer):
         httpserver.stop()
 
 
+def test_event_loop(httpserver: HTTPServer):
+    pytest.importorskip('httpx')
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    p = configure_plugin_and_server(httpserver, IterativelyOptions(
+        flush_queue_size=3,
+        flush_interval=timedelta(seconds=10),
+        event_loop=loop,
+    ))
+
+    try:
+        p.load(PLUGIN_OPTIONS_DEV_NO_LOGGER)
+
+        p.post_identify(*post_identify_1_args)
+        p.post_track(*post_track_2_args)
+        p.flush()
+        requests = _get_cleaned_requests(httpserver)
+        assert requests == [{'objects': [post_identify_1_expected_request, post_track_2_expected_request]}]
+
+        p.post_page(*post_page_args)
+        assert p.shutdown(timedelta(seconds=5)) == ShutdownResult(delivered=1)
+        requests = _get_cleaned_requests(httpserver)
+        assert requests[1:] == [{'objects': [post_page_expected_request]}]
+        # The connection pool is closed on the application's loop
+        assert p._client._async_transport._client.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+        httpserver.stop()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or not hasattr(os, 'register_at_fork'), reason='requires os.fork')
+def test_fork(httpserver: HTTPServer):
+    p = configure_plugin_and_server(httpserver, IterativelyOptions(
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10),
+    ))
+
+    try:
+        p.load(PLUGIN_OPTIONS_DEV_NO_LOGGER)
+        p.post_identify(*post_identify_2_args)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                p.post_track(*post_track_2_args)
+                flush = threading.Thread(target=p.flush, daemon=True)
+                flush.start()
+                flush.join(timeout=5)
+                os.write(write_fd, b'flushed' if not flush.is_alive() else b'timed out')
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as child_output:
+            assert child_output.read() == 'flushed'
+        os.waitpid(pid, 0)
+
+        # The child uploads its own events, messages queued before the fork are uploaded by the parent only
+        requests = _get_cleaned_requests(httpserver)
+        assert requests == [{'objects': [post_track_2_expected_request]}]
+        p.flush()
+        requests = _get_cleaned_requests(httpserver)
+        assert requests[1:] == [{'objects': [post_identify_2_expected_request]}]
+    finally:
+        p.shutdown()
+        httpserver.stop()
+
+
+def test_shared_uploader_rejects_event_loop(tmp_path):
+    loop = asyncio.new_event_loop()
+    try:
+        p = IterativelyPlugin('My-Key', 'http://localhost/track', IterativelyOptions(
+            shared_uploader_socket=str(tmp_path / 'iteratively.sock'),
+            event_loop=loop,
+        ))
+        with pytest.raises(ValueError, match='event_loop'):
+            p.load(PLUGIN_OPTIONS_DEV_NO_LOGGER)
+    finally:
+        loop.close()
+
+
 def _get_cleaned_requests(httpserver: Any) -> List[Any]:
     requests = [json.loads(data) for data in httpserver.collected_data]
     for request in requests:
@@ -60,7 +60,7 @@ class MixpanelPlugin(Plugin):
         assert self._consumer is not None
         self._consumer.flush()
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> None:
         assert self._consumer is not None
         self._consumer.flush()
 
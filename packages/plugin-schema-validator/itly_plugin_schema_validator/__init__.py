@@ -1 +1,2 @@
 from ._schema_validator import SchemaValidatorPlugin
+from ._tracking_plan_cache import build_tracking_plan_cache
@@ -1,24 +1,35 @@
-import json
-from typing import Dict, Optional
+from typing import Dict, Optional, Any
 
 import jsonschema
 
 from itly_sdk import Plugin, Event, ValidationResponse, PluginLoadOptions
+from ._tracking_plan_cache import build_tracking_plan_cache, load_tracking_plan_cache, compile_tracking_plan
 
 
 class SchemaValidatorPlugin(Plugin):
-    def __init__(self, schemas: Dict[str, str]):
+    def __init__(self, schemas: Dict[str, str], cache_path: Optional[str] = None):
         self._schemas: Dict[str, str] = schemas
+        self._cache_path: Optional[str] = cache_path
+        self._parsed_schemas: Dict[str, Any] = {}
         self._validators: Dict[str, jsonschema.Draft7Validator] = {}
 
     def id(self) -> str:
         return 'schema-validator'
 
     def load(self, options: PluginLoadOptions) -> None:
-        for schema_key, raw_schema in self._schemas.items():
-            schema = json.loads(raw_schema)
-            jsonschema.Draft7Validator.check_schema(schema)
-            self._validators[schema_key] = jsonschema.Draft7Validator(schema)
+        if self._cache_path is None:
+            self._parsed_schemas = compile_tracking_plan(self._schemas)
+            return
+
+        parsed_schemas = load_tracking_plan_cache(self._cache_path, self._schemas)
+        if parsed_schemas is None:
+            options.logger.info(f'Tracking plan cache {self._cache_path} is missing or stale. Rebuilding.')
+            try:
+                parsed_schemas = build_tracking_plan_cache(self._schemas, self._cache_path)
+            except OSError as e:
+                options.logger.warn(f'Unable to write tracking plan cache {self._cache_path}. {e}')
+                parsed_schemas = compile_tracking_plan(self._schemas)
+        self._parsed_schemas = parsed_schemas
 
     def validate(self, event: Event) -> Optional[ValidationResponse]:
         schema_key = event.name
@@ -26,9 +37,15 @@ class SchemaValidatorPlugin(Plugin):
         if schema_key not in self._schemas:
             raise ValueError(f"Event '{event.name}' not found in tracking plan.")
 
+        validator = self._validators.get(schema_key)
+        if validator is None:
+            # Validators are created on first use so that load() time doesn't depend on the tracking plan size
+            validator = jsonschema.Draft7Validator(self._parsed_schemas[schema_key])
+            self._validators[schema_key] = validator
+
         event_properties = event.properties.to_json() if event.properties is not None else {}
         try:
-            self._validators[schema_key].validate(instance=event_properties)
+            validator.validate(instance=event_properties)
         except jsonschema.ValidationError as ex:
             return self._create_invalid_response(
                 message=f"Passed in {event.name} properties did not validate against your tracking plan. {ex}"
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Any, Optional
+
+import jsonschema
+
+# Increase whenever the layout of the cache file changes
+CACHE_FORMAT_VERSION = 1
+
+
+def build_tracking_plan_cache(schemas: Dict[str, str], path: str) -> Dict[str, Any]:
+    """
+    Parse and check the tracking plan schemas and write them to a cache file.
+
+    The cache is keyed by the format version, the jsonschema version and a digest of the raw schemas,
+    so a stale file is rebuilt instead of being used.
+
+    :param schemas: Raw JSON schemas by event name, as passed to SchemaValidatorPlugin
+    :param path:    Location of the cache file
+    :return: Parsed schemas by event name
+    """
+    parsed_schemas = compile_tracking_plan(schemas)
+    cache = {
+        "version": CACHE_FORMAT_VERSION,
+        "jsonschema": jsonschema.__version__,
+        "digest": tracking_plan_digest(schemas),
+        "schemas": parsed_schemas,
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.itly-tracking-plan-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f, separators=(',', ':'))
+        # Atomic rename so that concurrently starting processes never read a partial file
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return parsed_schemas
+
+
+def load_tracking_plan_cache(path: str, schemas: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Read parsed schemas from a cache file written by build_tracking_plan_cache.
+
+    :return: Parsed schemas by event name, or None if the file is missing or doesn't match the given schemas
+    """
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cache, dict) \
+            or cache.get("version") != CACHE_FORMAT_VERSION \
+            or cache.get("jsonschema") != jsonschema.__version__ \
+            or cache.get("digest") != tracking_plan_digest(schemas):
+        return None
+    return cache["schemas"]
+
+
+def compile_tracking_plan(schemas: Dict[str, str]) -> Dict[str, Any]:
+    parsed_schemas: Dict[str, Any] = {}
+    for schema_key, raw_schema in schemas.items():
+        schema = json.loads(raw_schema)
+        jsonschema.Draft7Validator.check_schema(schema)
+        parsed_schemas[schema_key] = schema
+    return parsed_schemas
+
+
+def tracking_plan_digest(schemas: Dict[str, str]) -> str:
+    digest = hashlib.sha256()
+    for schema_key in sorted(schemas):
+        digest.update(schema_key.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(schemas[schema_key].encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
@@ -1,10 +1,11 @@
 # flake8: noqa E501
 import enum
+import json
 from typing import Optional, List
 
 import pytest
 
-from itly_plugin_schema_validator import SchemaValidatorPlugin
+from itly_plugin_schema_validator import SchemaValidatorPlugin, build_tracking_plan_cache
 from itly_sdk import PluginLoadOptions, Environment, Properties, Event, Logger
 
 DEFAULT_SCHEMAS = {
@@ -181,3 +182,25 @@ def test_validate_unknown_event_exception():
     with pytest.raises(ValueError) as ctx:
         plugin.validate(Event('unknown'))
     assert str(ctx.value) == "Event 'unknown' not found in tracking plan."
+
+
+def test_validate_with_tracking_plan_cache(tmp_path):
+    cache_path = str(tmp_path / 'tracking-plan.json')
+    build_tracking_plan_cache(DEFAULT_SCHEMAS, cache_path)
+
+    plugin = SchemaValidatorPlugin(DEFAULT_SCHEMAS, cache_path=cache_path)
+    plugin.load(PluginLoadOptions(environment=Environment.PRODUCTION, logger=Logger.NONE))
+    assert plugin.validate(EventWithConstTypes()) is None
+    assert plugin.validate(EventMaxIntForTest(int_max_10=20)).valid is False
+
+
+def test_validate_with_stale_tracking_plan_cache_rebuilds(tmp_path):
+    cache_path = str(tmp_path / 'tracking-plan.json')
+    build_tracking_plan_cache({'EventMaxIntForTest': '{"type":"object"}'}, cache_path)
+
+    plugin = SchemaValidatorPlugin(DEFAULT_SCHEMAS, cache_path=cache_path)
+    plugin.load(PluginLoadOptions(environment=Environment.PRODUCTION, logger=Logger.NONE))
+    assert plugin.validate(EventMaxIntForTest(int_max_10=20)).valid is False
+
+    with open(cache_path) as f:
+        assert set(json.load(f)['schemas'].keys()) == set(DEFAULT_SCHEMAS.keys())
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from typing import Optional, NamedTuple, Any
 
 import analytics
@@ -75,7 +76,7 @@ class SegmentPlugin(Plugin):
         assert self._client is not None
         self._client.flush()
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> None:
         assert self._client is not None
         self._client.join()
 
@@ -1,4 +1,6 @@
-from typing import Optional, NamedTuple, Any, Callable
+import threading
+from datetime import timedelta
+from typing import Optional, NamedTuple, Any, Callable, Dict, Tuple
 
 from snowplow_tracker import Subject, Tracker, AsyncEmitter, SelfDescribingJson
 
@@ -44,6 +46,10 @@ class SnowplowPlugin(Plugin):
             options = options._replace(on_failure=self._on_failure)
         self._options: SnowplowOptions = options
         self._tracker: Optional[Tracker] = None
+        self._emitter: Optional[AsyncEmitter] = None
+        # Trackers of tracking threads, each with its own subject, sharing the emitter
+        self._thread_trackers = threading.local()
+        self._schemas: Dict[Tuple[Optional[str], Optional[str]], str] = {}
         self._logger: Logger = Logger.NONE
 
     def id(self) -> str:
@@ -51,42 +57,37 @@ class SnowplowPlugin(Plugin):
 
     def load(self, options: PluginLoadOptions) -> None:
         self._logger = options.logger
-        emitter = AsyncEmitter(
+        self._emitter = AsyncEmitter(
             **self._options._asdict(),
         )
-        self._tracker = Tracker(emitter)
+        self._tracker = Tracker(self._emitter)
+        self._thread_trackers = threading.local()
 
     def page(self, user_id: str, category: Optional[str], name: Optional[str], properties: Optional[Properties]) -> None:
-        assert self._tracker is not None
-        subject = Subject()
-        subject.set_user_id(user_id)
-        prev_subject = self._tracker.subject
-        try:
-            self._tracker.set_subject(subject)
-            self._tracker.track_screen_view(name=name)
-        finally:
-            self._tracker.set_subject(prev_subject)
+        self._get_tracker(user_id).track_screen_view(name=name)
 
     def track(self, user_id: str, event: Event) -> None:
-        assert self._tracker is not None
-        subject = Subject()
-        subject.set_user_id(user_id)
-        prev_subject = self._tracker.subject
-        try:
-            self._tracker.set_subject(subject)
+        key = (event.id, event.version)
+        schema = self._schemas.get(key)
+        if schema is None:
             schema_version = event.version.replace(".", "-")
-            self._tracker.track_self_describing_event(SelfDescribingJson(
-                f'iglu:{self._vendor}/{event.id}/jsonschema/{schema_version}',
-                event.properties.to_json()
-            ))
-        finally:
-            self._tracker.set_subject(prev_subject)
+            schema = self._schemas[key] = f'iglu:{self._vendor}/{event.id}/jsonschema/{schema_version}'
+        self._get_tracker(user_id).track_self_describing_event(SelfDescribingJson(schema, event.properties.to_json()))
+
+    def _get_tracker(self, user_id: str) -> Tracker:
+        """Return the tracker of the current thread with its subject set to the user"""
+        tracker = getattr(self._thread_trackers, 'tracker', None)
+        if tracker is None:
+            assert self._emitter is not None
+            tracker = self._thread_trackers.tracker = Tracker(self._emitter, subject=Subject())
+        tracker.subject.set_user_id(user_id)
+        return tracker
 
     def flush(self) -> None:
         assert self._tracker is not None
         self._tracker.flush()
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> None:
         self.flush()
 
     def _on_failure(self, sent_count: int, unsent: Any) -> None:
@@ -1,5 +1,6 @@
 import base64
 import json
+import threading
 import time
 from typing import Any, List
 
@@ -88,6 +89,34 @@ def test_snowplow(httpserver: HTTPServer):
     ]
 
 
+def test_snowplow_concurrent_tracking(httpserver: HTTPServer):
+    httpserver.expect_request('/v1/batch').respond_with_data()
+
+    endpoint = httpserver.url_for("").replace("http://", "")
+    p = SnowplowPlugin("ly.iterative.test", SnowplowOptions(endpoint, buffer_size=100))
+    p.load(PluginLoadOptions(environment=Environment.DEVELOPMENT, logger=Logger.NONE))
+
+    def track(user_id: str) -> None:
+        for i in range(10):
+            p.track(user_id, Event('event-1', Properties(user=user_id, index=i), id_="event-1", version="0.0.1"))
+
+    threads = [threading.Thread(target=track, args=(f'user-{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    p.flush()
+    p.shutdown()
+    time.sleep(0.1)
+    httpserver.stop()
+
+    events = [event for batch in _get_cleaned_requests(httpserver) for event in batch]
+    assert len(events) == 40
+    for event in events:
+        assert event['uid'] == event['properties']['data']['data']['user']
+
+
 def _get_cleaned_requests(httpserver: Any) -> List[Any]:
     batches = [json.loads(data) for data in httpserver.collected_data]
     return [_clean_batch(batch) for batch in batches]
@@ -2,10 +2,16 @@ from ._environment import Environment
 from ._options import Options
 from ._plugin_options import PluginLoadOptions
 from ._validation_options import ValidationOptions
+from ._sampling_rule import SamplingRule
+from ._plugin_route import PluginRoute
+from ._deduplication_options import DeduplicationOptions
 from ._validation_response import ValidationResponse
+from ._shutdown_result import ShutdownResult
 from ._properties import Properties
 from ._event import Event, EventMetadata
 from ._logger import Logger
+from ._metrics import Metrics, InMemoryMetrics, StatsdMetrics, PrometheusMetrics
+from ._tracer import Tracer, StageTimingAggregator, OpenTelemetryTracer
 from ._plugin import Plugin
 
 from ._itly import Itly
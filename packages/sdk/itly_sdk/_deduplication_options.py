@@ -0,0 +1,19 @@
+from datetime import timedelta
+from typing import NamedTuple, Optional, Callable
+
+from ._event import Event
+
+
+class DeduplicationOptions(NamedTuple):
+    """
+    Client-side deduplication of track() calls by insert id
+
+    :param window:            How long an insert id is remembered
+    :param max_size:          Maximum number of remembered insert ids. The oldest ones are forgotten first.
+    :param compute_insert_id: Computes an insert id for events created without one, e.g. from an upstream job id.
+                              Gets passed the user id and the event. Events without an insert id are never dropped.
+    """
+
+    window: timedelta = timedelta(hours=1)
+    max_size: int = 100000
+    compute_insert_id: Optional[Callable[[str, Event], Optional[str]]] = None
@@ -0,0 +1,31 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from ._deduplication_options import DeduplicationOptions
+
+
+class Deduplicator:
+    def __init__(self, options: DeduplicationOptions) -> None:
+        self._window: float = options.window.total_seconds()
+        self._max_size: int = options.max_size
+        # insert id -> expiration time, ordered by expiration time since the window is constant
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = Lock()
+
+    def is_duplicate(self, insert_id: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while len(self._seen) > 0:
+                oldest_insert_id, expires_at = next(iter(self._seen.items()))
+                if expires_at > now:
+                    break
+                del self._seen[oldest_insert_id]
+
+            if insert_id in self._seen:
+                return True
+
+            self._seen[insert_id] = now + self._window
+            if len(self._seen) > self._max_size:
+                self._seen.popitem(last=False)
+            return False
@@ -14,12 +14,14 @@ class Event:
                  properties: Optional[Properties] = None,
                  id_: Optional[str] = None,
                  version: Optional[str] = None,
-                 metadata: Optional[Dict[str, EventMetadata]] = None):
+                 metadata: Optional[Dict[str, EventMetadata]] = None,
+                 insert_id: Optional[str] = None):
         self._name: str = name
         self._properties: Optional[Properties] = properties
         self._id: Optional[str] = id_
         self._version: Optional[str] = version
         self._metadata: Dict[str, EventMetadata] = metadata if metadata is not None else {}
+        self._insert_id: Optional[str] = insert_id
 
     @property
     def name(self) -> str:
@@ -40,3 +42,7 @@ class Event:
     @property
     def metadata(self) -> Dict[str, EventMetadata]:
         return self._metadata
+
+    @property
+    def insert_id(self) -> Optional[str]:
+        return self._insert_id
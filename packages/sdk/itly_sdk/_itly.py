@@ -1,11 +1,21 @@
-from typing import Optional, List, Callable
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from threading import Thread
+from typing import Optional, List, Callable, Any, Dict, Tuple
 
+from ._deduplicator import Deduplicator
 from ._event import Event
 from ._logger import Logger, LoggerPrefixSafeDecorator
+from ._metrics import Metrics, MetricsTagsSafeDecorator
 from ._options import Options
-from ._plugin import Plugin, PluginSafeDecorator
+from ._plugin import Plugin, PluginSafeDecorator, PluginTracingDecorator
 from ._plugin_options import PluginLoadOptions
 from ._properties import Properties
+from ._router import Router
+from ._sampler import Sampler
+from ._shutdown_result import ShutdownResult
+from ._tracer import Tracer, TracerSafeDecorator, NONE_SPAN
 from ._validation_response import ValidationResponse
 
 LOG_PREFIX = '[itly-core] '
@@ -18,6 +28,10 @@ class Itly:
         self._logger: Logger = Logger.NONE
         self._is_shutdown: bool = False
         self._context: Optional[Event] = None
+        self._router: Optional[Router] = None
+        self._sampler: Optional[Sampler] = None
+        self._deduplicator: Optional[Deduplicator] = None
+        self._tracer: Optional[Tracer] = None
 
     def load(self, context: Optional[Properties] = None, options: Optional[Options] = Options()) -> None:
         if self._options is not None:
@@ -32,6 +46,9 @@ class Itly:
 
         self._logger.info('load()')
 
+        if self._options.tracer is not None:
+            self._tracer = TracerSafeDecorator(self._options.tracer, self._logger)
+
         if context is not None:
             self._context = Event(
                 name='context',
@@ -41,17 +58,32 @@ class Itly:
         for plugin in self._options.plugins:
             plugin_logger = LoggerPrefixSafeDecorator(self._options.logger, f'[plugin-{plugin.id()}] ')
             plugin = PluginSafeDecorator(plugin, plugin_logger)
+            if self._tracer is not None:
+                plugin = PluginTracingDecorator(plugin, self._tracer)
             self._plugins.append(plugin)
-            plugin_options = PluginLoadOptions(environment=self._options.environment, logger=plugin_logger)
+            plugin_metrics = Metrics.NONE if self._options.metrics is Metrics.NONE else MetricsTagsSafeDecorator(
+                self._options.metrics, {'plugin': plugin.id()}, plugin_logger
+            )
+            plugin_options = PluginLoadOptions(environment=self._options.environment,
+                                               logger=plugin_logger,
+                                               metrics=plugin_metrics)
             plugin.load(plugin_options)
 
+        if len(self._options.routing) > 0:
+            self._router = Router(self._options.routing, self._plugins)
+        if len(self._options.sampling) > 0:
+            self._sampler = Sampler(self._options.sampling)
+        if self._options.deduplication is not None:
+            self._deduplicator = Deduplicator(self._options.deduplication)
+
     def alias(self, user_id: str, previous_id: str) -> None:
         if self._disabled():
             return
 
         self._logger.info(f'alias(user_id={user_id}, previous_id={previous_id})')
-        self._run_on_all_plugins(lambda plugin: plugin.alias(user_id=user_id, previous_id=previous_id))
-        self._run_on_all_plugins(lambda plugin: plugin.post_alias(user_id=user_id, previous_id=previous_id))
+        plugins = self._routed_plugins('alias')
+        self._run_on_all_plugins(lambda plugin: plugin.alias(user_id=user_id, previous_id=previous_id), plugins)
+        self._run_on_all_plugins(lambda plugin: plugin.post_alias(user_id=user_id, previous_id=previous_id), plugins)
 
     def identify(self, user_id: str, identify_properties: Optional[Properties] = None) -> None:
         if self._disabled():
@@ -66,6 +98,7 @@ class Itly:
             lambda plugin, event, validation_results: plugin.post_identify(user_id,
                                                                            event.properties,
                                                                            validation_results),
+            self._routed_plugins('identify'),
         )
 
     def group(self, user_id: str, group_id: str, group_properties: Optional[Properties] = None) -> None:
@@ -82,6 +115,7 @@ class Itly:
                                                                         group_id,
                                                                         event.properties,
                                                                         validation_results),
+            self._routed_plugins('group'),
         )
 
     def page(self,
@@ -105,6 +139,7 @@ class Itly:
                                                                        name,
                                                                        event.properties,
                                                                        validation_results),
+            self._routed_plugins('page'),
         )
 
     def track(self, user_id: str, event: Event) -> None:
@@ -112,27 +147,88 @@ class Itly:
             return
 
         self._logger.info(f'track(user_id={user_id}, event={event.name}, properties={event.properties})')
+
+        if self._deduplicator is not None:
+            deduplicated_event = self._deduplicate(user_id, event)
+            if deduplicated_event is None:
+                self._logger.info(f'track() skipped duplicate event (insert_id={event.insert_id})')
+                return
+            event = deduplicated_event
+
+        plugins = self._router.track_plugins(event.name) if self._router is not None else self._plugins
+        if self._sampler is not None:
+            plugins = self._sampler.sample(user_id, event.name, plugins)
+
+        if len(plugins) == 0:
+            # Dropped events skip merging context and dispatching, validation only runs to raise on invalid events
+            self._raise_if_invalid(event)
+            return
+
         self._validate_and_run_on_all_plugins(
             event,
             True,
             lambda plugin, ev: plugin.track(user_id, ev),
             lambda plugin, ev, validation_results: plugin.post_track(user_id, ev, validation_results),
+            plugins,
         )
 
-    def flush(self) -> None:
+    def flush(self, timeout: Optional[timedelta] = None) -> Dict[str, bool]:
+        """
+        Flush all plugins concurrently.
+
+        :param timeout: Maximum time to wait for all plugins. Plugins that haven't finished keep flushing in the background.
+        :return: Whether each plugin, by id, finished flushing within the timeout
+        """
         if self._disabled():
-            return
+            return {}
 
         self._logger.info('flush()')
-        self._run_on_all_plugins(lambda plugin: plugin.flush())
+        return self._flush_all_plugins(timeout)
 
-    def shutdown(self) -> None:
+    def flush_async(self, timeout: Optional[timedelta] = None) -> "Future[Dict[str, bool]]":
+        """Start flushing all plugins and return a future with the result of `flush(timeout)`."""
         if self._disabled():
-            return
+            future: "Future[Dict[str, bool]]" = Future()
+            future.set_result({})
+            return future
+
+        self._logger.info('flush_async()')
+        return self._run_in_background(lambda: self._flush_all_plugins(timeout))
+
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Dict[str, ShutdownResult]:
+        """
+        Drain and stop all plugins concurrently.
+
+        :param timeout: Deadline for all plugins, events still queued when it passes are dropped
+        :return:        Delivered, spilled and dropped event counts of each plugin, by id. Plugins that don't
+                        track them have zero counts.
+        """
+        if self._disabled():
+            return {}
 
         self._logger.info('shutdown()')
         self._is_shutdown = True
-        self._run_on_all_plugins(lambda plugin: plugin.shutdown())
+        deadline = time.monotonic() + timeout.total_seconds() if timeout is not None else None
+
+        def shutdown_plugin(plugin: Plugin) -> Optional[ShutdownResult]:
+            remaining = timedelta(seconds=max(0.0, deadline - time.monotonic())) if deadline is not None else None
+            return plugin.shutdown(remaining)
+
+        results: Dict[str, ShutdownResult] = {}
+        for plugin_id, (finished, result) in self._run_on_all_plugins_concurrently('shutdown', shutdown_plugin,
+                                                                                   timeout).items():
+            if not finished:
+                results[plugin_id] = ShutdownResult(timed_out=True)
+            else:
+                results[plugin_id] = result if result is not None else ShutdownResult()
+        dropped = sum(result.dropped for result in results.values())
+        spilled = sum(result.spilled for result in results.values())
+        # Events still queued in plugins that didn't finish are unknown and lost as well
+        timed_out = [plugin_id for plugin_id, result in results.items() if result.timed_out]
+        if dropped > 0 or spilled > 0 or len(timed_out) > 0:
+            self._logger.warn(f'shutdown() did not deliver all events: spilled={spilled}, dropped={dropped}, '
+                              f'timed_out={timed_out}')
+        return results
 
     def _validate(self, event: Event) -> List[ValidationResponse]:
         validation_results: List[ValidationResponse] = []
@@ -147,45 +243,132 @@ class Itly:
 
         return validation_results
 
+    def _raise_if_invalid(self, event: Event) -> None:
+        assert self._options is not None
+        if not self._options.validation.error_on_invalid:
+            return
+        with self._span('itly.validate', event):
+            failed_validation_responses = (self._validate(self._context) if self._context is not None else []) + \
+                self._validate(event)
+        if len(failed_validation_responses) > 0:
+            raise ValueError(failed_validation_responses[0].message)
+
     def _validate_and_run_on_all_plugins(self,
                                          event: Event,
                                          include_context: bool,
                                          action: Callable[[Plugin, Event], None],
-                                         post_action: Callable[[Plugin, Event, List[ValidationResponse]], None]
+                                         post_action: Callable[[Plugin, Event, List[ValidationResponse]], None],
+                                         plugins: Optional[List[Plugin]] = None,
                                          ) -> None:
-        context_failed_validation_responses = self._validate(
-            self._context
-        ) if include_context and self._context is not None else []
-        is_context_valid = len(context_failed_validation_responses) == 0
+        with self._span('itly.validate', event):
+            context_failed_validation_responses = self._validate(
+                self._context
+            ) if include_context and self._context is not None else []
+            is_context_valid = len(context_failed_validation_responses) == 0
 
-        event_failed_validation_responses = self._validate(event)
-        is_event_valid = len(event_failed_validation_responses) == 0
+            event_failed_validation_responses = self._validate(event)
+            is_event_valid = len(event_failed_validation_responses) == 0
 
         combined_event: Event = event
         if include_context and self._context is not None:
-            combined_event = Event(
-                name=event.name,
-                properties=Properties.concat([self._context.properties, event.properties]),
-                id_=event.id,
-                version=event.version,
-            )
+            with self._span('itly.merge_context', event):
+                combined_event = Event(
+                    name=event.name,
+                    properties=Properties.concat([self._context.properties, event.properties]),
+                    id_=event.id,
+                    version=event.version,
+                    metadata=event.metadata,
+                    insert_id=event.insert_id,
+                )
 
         assert self._options is not None
         if (is_context_valid and is_event_valid) or self._options.validation.track_invalid:
-            self._run_on_all_plugins(lambda plugin: action(plugin, combined_event))
+            with self._span('itly.run_plugins', event):
+                self._run_on_all_plugins(lambda plugin: action(plugin, combined_event), plugins)
 
         combined_failed_validation_responses = context_failed_validation_responses + event_failed_validation_responses
-        self._run_on_all_plugins(lambda plugin: post_action(plugin,
-                                                            combined_event,
-                                                            combined_failed_validation_responses))
+        with self._span('itly.run_post_plugins', event):
+            self._run_on_all_plugins(lambda plugin: post_action(plugin,
+                                                                combined_event,
+                                                                combined_failed_validation_responses),
+                                     plugins)
 
         if (not is_context_valid or not is_event_valid) and self._options.validation.error_on_invalid:
             raise ValueError(combined_failed_validation_responses[0].message)
 
-    def _run_on_all_plugins(self, action: Callable[[Plugin], None]) -> None:
-        for plugin in self._plugins:
+    def _deduplicate(self, user_id: str, event: Event) -> Optional[Event]:
+        assert self._options is not None and self._options.deduplication is not None
+        assert self._deduplicator is not None
+        if event.insert_id is None and self._options.deduplication.compute_insert_id is not None:
+            insert_id = self._options.deduplication.compute_insert_id(user_id, event)
+            if insert_id is not None:
+                event = Event(
+                    name=event.name,
+                    properties=event.properties,
+                    id_=event.id,
+                    version=event.version,
+                    metadata=event.metadata,
+                    insert_id=insert_id,
+                )
+
+        if event.insert_id is not None and self._deduplicator.is_duplicate(event.insert_id):
+            return None
+        return event
+
+    def _span(self, name: str, event: Event) -> Any:
+        if self._tracer is None:
+            return NONE_SPAN
+        return self._tracer.span(name, {'event': event.name})
+
+    def _routed_plugins(self, call_type: str) -> List[Plugin]:
+        return self._router.plugins(call_type) if self._router is not None else self._plugins
+
+    def _run_on_all_plugins(self, action: Callable[[Plugin], None], plugins: Optional[List[Plugin]] = None) -> None:
+        for plugin in plugins if plugins is not None else self._plugins:
             action(plugin)
 
+    def _flush_all_plugins(self, timeout: Optional[timedelta]) -> Dict[str, bool]:
+        results = self._run_on_all_plugins_concurrently('flush', lambda plugin: plugin.flush(), timeout)
+        return {plugin_id: finished for plugin_id, (finished, _) in results.items()}
+
+    def _run_on_all_plugins_concurrently(self,
+                                         name: str,
+                                         action: Callable[[Plugin], Any],
+                                         timeout: Optional[timedelta]) -> Dict[str, Tuple[bool, Any]]:
+        """Run the action for each plugin in its own thread and return whether it finished and its result."""
+        deadline = time.monotonic() + timeout.total_seconds() if timeout is not None else None
+        results: Dict[str, Any] = {}
+
+        def run(plugin: Plugin) -> None:
+            results[plugin.id()] = action(plugin)
+
+        # Daemon threads, so that a hung plugin can't block program exit
+        threads = [(plugin.id(), Thread(target=run, args=(plugin,), daemon=True)) for plugin in self._plugins]
+        for _, thread in threads:
+            thread.start()
+
+        finished: Dict[str, Tuple[bool, Any]] = {}
+        for plugin_id, thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+            finished[plugin_id] = (not thread.is_alive(), results.get(plugin_id))
+            if thread.is_alive():
+                self._logger.warn(f'{name}() of plugin {plugin_id} did not finish within {timeout}')
+        return finished
+
+    @staticmethod
+    def _run_in_background(action: Callable[[], Dict[str, bool]]) -> "Future[Dict[str, bool]]":
+        future: "Future[Dict[str, bool]]" = Future()
+        future.set_running_or_notify_cancel()
+
+        def run() -> None:
+            try:
+                future.set_result(action())
+            except Exception as e:
+                future.set_exception(e)
+
+        Thread(target=run, daemon=True).start()
+        return future
+
     def _disabled(self) -> bool:
         if self._is_shutdown:
             raise Exception('Itly is shutdown. No more requests are possible.')
@@ -0,0 +1,193 @@
+import socket
+from abc import ABC, abstractmethod
+from collections import deque
+from threading import Lock
+from typing import Optional, Dict, Tuple, FrozenSet, List, Any, Deque
+
+from ._logger import Logger
+
+Tags = Optional[Dict[str, str]]
+
+
+class Metrics(ABC):
+    NONE: "Metrics" = None  # type: ignore
+
+    @abstractmethod
+    def increment(self, name: str, value: float = 1, tags: Tags = None) -> None:
+        pass
+
+    @abstractmethod
+    def gauge(self, name: str, value: float, tags: Tags = None) -> None:
+        pass
+
+    @abstractmethod
+    def observe(self, name: str, value: float, tags: Tags = None) -> None:
+        pass
+
+
+class NoneMetrics(Metrics):
+    def increment(self, name: str, value: float = 1, tags: Tags = None) -> None:
+        pass
+
+    def gauge(self, name: str, value: float, tags: Tags = None) -> None:
+        pass
+
+    def observe(self, name: str, value: float, tags: Tags = None) -> None:
+        pass
+
+
+Metrics.NONE = NoneMetrics()
+
+_SeriesKey = Tuple[str, FrozenSet[Tuple[str, str]]]
+
+
+class InMemoryMetrics(Metrics):
+    def __init__(self, max_samples: int = 1000) -> None:
+        self._max_samples = max_samples
+        self._counters: Dict[_SeriesKey, float] = {}
+        self._gauges: Dict[_SeriesKey, float] = {}
+        self._histograms: Dict[_SeriesKey, Deque[float]] = {}
+        self._lock = Lock()
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None) -> None:
+        key = self._key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, tags: Tags = None) -> None:
+        with self._lock:
+            self._gauges[self._key(name, tags)] = value
+
+    def observe(self, name: str, value: float, tags: Tags = None) -> None:
+        key = self._key(name, tags)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = deque(maxlen=self._max_samples)
+            self._histograms[key].append(value)
+
+    def counter(self, name: str, tags: Tags = None) -> float:
+        """Return the counter value. Without tags, the values of all series with the name are summed up."""
+        with self._lock:
+            return sum(value for key, value in self._counters.items() if self._matches(key, name, tags))
+
+    def gauge_value(self, name: str, tags: Tags = None) -> Optional[float]:
+        with self._lock:
+            values = [value for key, value in self._gauges.items() if self._matches(key, name, tags)]
+        return values[-1] if len(values) > 0 else None
+
+    def histogram(self, name: str, tags: Tags = None) -> List[float]:
+        """Return the most recent samples. Without tags, the samples of all series with the name are returned."""
+        with self._lock:
+            return [value for key, values in self._histograms.items() if self._matches(key, name, tags)
+                    for value in values]
+
+    @staticmethod
+    def _key(name: str, tags: Tags) -> _SeriesKey:
+        return name, frozenset(tags.items()) if tags else frozenset()
+
+    @staticmethod
+    def _matches(key: _SeriesKey, name: str, tags: Tags) -> bool:
+        return key[0] == name and (tags is None or key[1] == frozenset(tags.items()))
+
+
+class StatsdMetrics(Metrics):
+    """
+    Sends metrics to a StatsD agent over UDP
+
+    Tags are sent in the DogStatsD format (`|#key:value`) supported by Datadog, Telegraf and the StatsD exporter.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 8125, prefix: str = '') -> None:
+        self._address = (host, port)
+        self._prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None) -> None:
+        self._send(name, value, 'c', tags)
+
+    def gauge(self, name: str, value: float, tags: Tags = None) -> None:
+        self._send(name, value, 'g', tags)
+
+    def observe(self, name: str, value: float, tags: Tags = None) -> None:
+        self._send(name, value, 'h', tags)
+
+    def _send(self, name: str, value: float, metric_type: str, tags: Tags) -> None:
+        line = f'{self._prefix}{name}:{value}|{metric_type}'
+        if tags:
+            line += '|#' + ','.join(f'{k}:{v}' for k, v in tags.items())
+        try:
+            self._socket.sendto(line.encode('utf-8'), self._address)
+        except OSError:
+            # Metrics are best effort, never block or fail the caller
+            pass
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Records metrics with prometheus_client
+
+    Requires the `prometheus-client` package. Metric names have dots replaced with underscores.
+    The label names of a metric are taken from the tags of its first sample.
+    """
+
+    def __init__(self, registry: Any = None, namespace: str = '') -> None:
+        try:
+            import prometheus_client
+        except ImportError:
+            raise ImportError("PrometheusMetrics requires the 'prometheus-client' package.")
+        self._prometheus_client = prometheus_client
+        self._registry = registry if registry is not None else prometheus_client.REGISTRY
+        self._namespace = namespace
+        self._metrics: Dict[str, Any] = {}
+        self._lock = Lock()
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None) -> None:
+        self._metric(self._prometheus_client.Counter, name, tags).inc(value)
+
+    def gauge(self, name: str, value: float, tags: Tags = None) -> None:
+        self._metric(self._prometheus_client.Gauge, name, tags).set(value)
+
+    def observe(self, name: str, value: float, tags: Tags = None) -> None:
+        self._metric(self._prometheus_client.Histogram, name, tags).observe(value)
+
+    def _metric(self, metric_class: Any, name: str, tags: Tags) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = metric_class(name.replace('.', '_'), name,
+                                          labelnames=sorted(tags.keys()) if tags else (),
+                                          namespace=self._namespace,
+                                          registry=self._registry)
+                    self._metrics[name] = metric
+        return metric.labels(**tags) if tags else metric
+
+
+class MetricsTagsSafeDecorator(Metrics):
+    def __init__(self, metrics: Metrics, tags: Dict[str, str], logger: Logger) -> None:
+        self._metrics = metrics
+        self._tags = tags
+        self._logger = logger
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None) -> None:
+        try:
+            self._metrics.increment(name, value, self._with_tags(tags))
+        except Exception as e:
+            self._logger.error(f'Error in metrics.increment(). {e}')
+
+    def gauge(self, name: str, value: float, tags: Tags = None) -> None:
+        try:
+            self._metrics.gauge(name, value, self._with_tags(tags))
+        except Exception as e:
+            self._logger.error(f'Error in metrics.gauge(). {e}')
+
+    def observe(self, name: str, value: float, tags: Tags = None) -> None:
+        try:
+            self._metrics.observe(name, value, self._with_tags(tags))
+        except Exception as e:
+            self._logger.error(f'Error in metrics.observe(). {e}')
+
+    def _with_tags(self, tags: Tags) -> Dict[str, str]:
+        return {**self._tags, **tags} if tags else self._tags
@@ -1,8 +1,13 @@
 from typing import Optional, List, NamedTuple
 
+from ._deduplication_options import DeduplicationOptions
 from ._environment import Environment
 from ._logger import Logger
+from ._metrics import Metrics
 from ._plugin import Plugin
+from ._plugin_route import PluginRoute
+from ._sampling_rule import SamplingRule
+from ._tracer import Tracer
 from ._validation_options import ValidationOptions
 
 
@@ -12,7 +17,12 @@ class Options:
                  disabled: bool = False,
                  plugins: Optional[List[Plugin]] = None,
                  validation: Optional[ValidationOptions] = None,
-                 logger: Logger = Logger.NONE
+                 logger: Logger = Logger.NONE,
+                 sampling: Optional[List[SamplingRule]] = None,
+                 routing: Optional[List[PluginRoute]] = None,
+                 deduplication: Optional[DeduplicationOptions] = None,
+                 metrics: Metrics = Metrics.NONE,
+                 tracer: Optional[Tracer] = None,
                  ):
         self._environment: Environment = environment
         self._disabled: bool = disabled
@@ -22,6 +32,11 @@ class Options:
             error_on_invalid=environment != Environment.PRODUCTION,
         )
         self._logger: Logger = logger
+        self._sampling: List[SamplingRule] = sampling if sampling is not None else []
+        self._routing: List[PluginRoute] = routing if routing is not None else []
+        self._deduplication: Optional[DeduplicationOptions] = deduplication
+        self._metrics: Metrics = metrics
+        self._tracer: Optional[Tracer] = tracer
 
     @property
     def environment(self) -> Environment:
@@ -43,12 +58,37 @@ class Options:
     def logger(self) -> Logger:
         return self._logger
 
+    @property
+    def sampling(self) -> List[SamplingRule]:
+        return self._sampling
+
+    @property
+    def routing(self) -> List[PluginRoute]:
+        return self._routing
+
+    @property
+    def deduplication(self) -> Optional[DeduplicationOptions]:
+        return self._deduplication
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        return self._tracer
+
     def with_overrides(self,
                        environment: Optional[Environment] = None,
                        disabled: Optional[bool] = None,
                        plugins: Optional[List[Plugin]] = None,
                        validation: Optional[ValidationOptions] = None,
-                       logger: Logger = None
+                       logger: Logger = None,
+                       sampling: Optional[List[SamplingRule]] = None,
+                       routing: Optional[List[PluginRoute]] = None,
+                       deduplication: Optional[DeduplicationOptions] = None,
+                       metrics: Optional[Metrics] = None,
+                       tracer: Optional[Tracer] = None,
                        ) -> "Options":
         return Options(
             environment if environment is not None else self._environment,
@@ -56,4 +96,9 @@ class Options:
             plugins if plugins is not None else self._plugins,
             validation if validation is not None else self._validation,
             logger if logger is not None else self._logger,
+            sampling if sampling is not None else self._sampling,
+            routing if routing is not None else self._routing,
+            deduplication if deduplication is not None else self._deduplication,
+            metrics if metrics is not None else self._metrics,
+            tracer if tracer is not None else self._tracer,
         )
@@ -1,10 +1,14 @@
+import inspect
 from abc import ABC, abstractmethod
+from datetime import timedelta
 from typing import Optional, List
 
 from ._event import Event
 from ._logger import Logger
 from ._plugin_options import PluginLoadOptions
 from ._properties import Properties
+from ._shutdown_result import ShutdownResult
+from ._tracer import Tracer
 from ._validation_response import ValidationResponse
 
 
@@ -74,7 +78,13 @@ class Plugin(ABC):
     def flush(self) -> None:
         pass
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
+        """
+        Upload queued events and release resources.
+
+        :param timeout: Time left until the shutdown deadline, None to wait until all events are uploaded
+        :return:        Counts of delivered and dropped events, if the plugin tracks them
+        """
         pass
 
     # Helper methods
@@ -90,6 +100,8 @@ class PluginSafeDecorator(Plugin):
     def __init__(self, plugin: Plugin, logger: Logger) -> None:
         self._plugin = plugin
         self._logger = logger
+        # Plugins written before shutdown() had a timeout don't accept one
+        self._shutdown_accepts_timeout = 'timeout' in inspect.signature(plugin.shutdown).parameters
 
     # Plugin methods
 
@@ -226,10 +238,101 @@ class PluginSafeDecorator(Plugin):
         except Exception as e:
             self._logger.error(f'Error in flush(). {e}')
 
-    def shutdown(self) -> None:
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
         if self._plugin.__class__.shutdown != Plugin.shutdown:
             self._logger.info('shutdown()')
         try:
-            self._plugin.shutdown()
+            if self._shutdown_accepts_timeout:
+                return self._plugin.shutdown(timeout=timeout)
+            return self._plugin.shutdown()
         except Exception as e:
             self._logger.error(f'Error in shutdown(). {e}')
+            return None
+
+
+class PluginTracingDecorator(Plugin):
+    def __init__(self, plugin: Plugin, tracer: Tracer) -> None:
+        self._plugin = plugin
+        self._tracer = tracer
+        self._prefix = f'itly.plugin.{plugin.id()}.'
+
+    # Plugin methods
+
+    def id(self) -> str:
+        return self._plugin.id()
+
+    def load(self, options: PluginLoadOptions) -> None:
+        with self._tracer.span(self._prefix + 'load'):
+            self._plugin.load(options)
+
+    # Validation methods
+
+    def validate(self, event: Event) -> Optional[ValidationResponse]:
+        with self._tracer.span(self._prefix + 'validate', {'event': event.name}):
+            return self._plugin.validate(event)
+
+    # Tracking methods
+
+    def alias(self, user_id: str, previous_id: str) -> None:
+        with self._tracer.span(self._prefix + 'alias'):
+            self._plugin.alias(user_id, previous_id)
+
+    def post_alias(self, user_id: str, previous_id: str) -> None:
+        with self._tracer.span(self._prefix + 'post_alias'):
+            self._plugin.post_alias(user_id, previous_id)
+
+    def identify(self, user_id: str, properties: Optional[Properties]) -> None:
+        with self._tracer.span(self._prefix + 'identify'):
+            self._plugin.identify(user_id, properties)
+
+    def post_identify(self,
+                      user_id: str,
+                      properties: Optional[Properties],
+                      validation_results: List[ValidationResponse]) -> None:
+        with self._tracer.span(self._prefix + 'post_identify'):
+            self._plugin.post_identify(user_id, properties, validation_results)
+
+    def group(self, user_id: str, group_id: str, properties: Optional[Properties]) -> None:
+        with self._tracer.span(self._prefix + 'group'):
+            self._plugin.group(user_id, group_id, properties)
+
+    def post_group(self,
+                   user_id: str,
+                   group_id: str,
+                   properties: Optional[Properties],
+                   validation_results: List[ValidationResponse]) -> None:
+        with self._tracer.span(self._prefix + 'post_group'):
+            self._plugin.post_group(user_id, group_id, properties, validation_results)
+
+    def page(self,
+             user_id: str,
+             category: Optional[str],
+             name: Optional[str],
+             properties: Optional[Properties]) -> None:
+        with self._tracer.span(self._prefix + 'page'):
+            self._plugin.page(user_id, category, name, properties)
+
+    def post_page(self,
+                  user_id: str,
+                  category: Optional[str],
+                  name: Optional[str],
+                  properties: Optional[Properties],
+                  validation_results: List[ValidationResponse]) -> None:
+        with self._tracer.span(self._prefix + 'post_page'):
+            self._plugin.post_page(user_id, category, name, properties, validation_results)
+
+    def track(self, user_id: str, event: Event) -> None:
+        with self._tracer.span(self._prefix + 'track', {'event': event.name}):
+            self._plugin.track(user_id, event)
+
+    def post_track(self, user_id: str, event: Event, validation_results: List[ValidationResponse]) -> None:
+        with self._tracer.span(self._prefix + 'post_track', {'event': event.name}):
+            self._plugin.post_track(user_id, event, validation_results)
+
+    def flush(self) -> None:
+        with self._tracer.span(self._prefix + 'flush'):
+            self._plugin.flush()
+
+    def shutdown(self, timeout: Optional[timedelta] = None) -> Optional[ShutdownResult]:
+        with self._tracer.span(self._prefix + 'shutdown'):
+            return self._plugin.shutdown(timeout)
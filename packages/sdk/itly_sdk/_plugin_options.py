@@ -2,8 +2,10 @@ from typing import NamedTuple
 
 from ._environment import Environment
 from ._logger import Logger
+from ._metrics import Metrics
 
 
 class PluginLoadOptions(NamedTuple):
     environment: Environment
     logger: Logger
+    metrics: Metrics = Metrics.NONE
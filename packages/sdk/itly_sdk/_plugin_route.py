@@ -0,0 +1,22 @@
+from typing import NamedTuple, Optional, List
+
+
+class PluginRoute(NamedTuple):
+    """
+    Declares which calls are forwarded to a plugin
+
+    Event name lists apply to track() calls only. Call types are 'alias', 'identify', 'group', 'page' and 'track'.
+    Denylists are applied after allowlists. Validation always runs on every plugin.
+
+    :param plugin_id:      Id of the plugin the route applies to
+    :param include_events: Only forward track() calls for these event names. None forwards all events.
+    :param exclude_events: Never forward track() calls for these event names
+    :param include_types:  Only forward these call types. None forwards all call types.
+    :param exclude_types:  Never forward these call types
+    """
+
+    plugin_id: str
+    include_events: Optional[List[str]] = None
+    exclude_events: Optional[List[str]] = None
+    include_types: Optional[List[str]] = None
+    exclude_types: Optional[List[str]] = None
@@ -0,0 +1,52 @@
+from typing import Dict, List
+
+from ._plugin import Plugin
+from ._plugin_route import PluginRoute
+
+CALL_TYPES = ('alias', 'identify', 'group', 'page', 'track')
+
+
+class Router:
+    def __init__(self, routes: List[PluginRoute], plugins: List[Plugin]) -> None:
+        for route in routes:
+            for call_type in (route.include_types or []) + (route.exclude_types or []):
+                if call_type not in CALL_TYPES:
+                    raise ValueError(f"Unknown call type '{call_type}' in route for plugin '{route.plugin_id}'.")
+
+        routes_by_plugin_id = {route.plugin_id: route for route in routes}
+        self._routes: List[PluginRoute] = [
+            routes_by_plugin_id.get(plugin.id(), PluginRoute(plugin_id=plugin.id())) for plugin in plugins
+        ]
+        self._plugins: List[Plugin] = plugins
+        self._plugins_by_type: Dict[str, List[Plugin]] = {
+            call_type: [
+                plugin for plugin, route in zip(plugins, self._routes) if self._accepts_type(route, call_type)
+            ]
+            for call_type in CALL_TYPES
+        }
+        self._plugins_by_event_name: Dict[str, List[Plugin]] = {}
+
+    def plugins(self, call_type: str) -> List[Plugin]:
+        return self._plugins_by_type[call_type]
+
+    def track_plugins(self, event_name: str) -> List[Plugin]:
+        plugins = self._plugins_by_event_name.get(event_name)
+        if plugins is None:
+            plugins = [
+                plugin for plugin, route in zip(self._plugins, self._routes)
+                if self._accepts_type(route, 'track') and self._accepts_event(route, event_name)
+            ]
+            self._plugins_by_event_name[event_name] = plugins
+        return plugins
+
+    @staticmethod
+    def _accepts_type(route: PluginRoute, call_type: str) -> bool:
+        if route.include_types is not None and call_type not in route.include_types:
+            return False
+        return route.exclude_types is None or call_type not in route.exclude_types
+
+    @staticmethod
+    def _accepts_event(route: PluginRoute, event_name: str) -> bool:
+        if route.include_events is not None and event_name not in route.include_events:
+            return False
+        return route.exclude_events is None or event_name not in route.exclude_events
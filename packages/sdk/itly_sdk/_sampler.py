@@ -0,0 +1,81 @@
+import zlib
+from typing import Dict, List, Optional, Tuple, NamedTuple
+
+from ._plugin import Plugin
+from ._sampling_rule import SamplingRule
+from .internal import TokenBucket
+
+_RuleKey = Tuple[Optional[str], Optional[str]]
+
+_HASH_RANGE = float(0xFFFFFFFF)
+
+
+class _PluginPlan(NamedTuple):
+    plugin: Plugin
+    sample_rate: float
+    bucket: Optional[TokenBucket]
+
+
+class _EventPlan(NamedTuple):
+    unrestricted: bool
+    plugins: List[_PluginPlan]
+
+
+class Sampler:
+    def __init__(self, rules: List[SamplingRule]) -> None:
+        self._rules: Dict[_RuleKey, SamplingRule] = {(rule.event_name, rule.plugin_id): rule for rule in rules}
+        self._buckets: Dict[Tuple[_RuleKey, str], TokenBucket] = {}
+        self._plans: Dict[str, _EventPlan] = {}
+
+    def sample(self, user_id: str, event_name: str, plugins: List[Plugin]) -> List[Plugin]:
+        """Return the subset of plugins that should receive the event. Plugins must be the same for an event name."""
+        plan = self._plans.get(event_name)
+        if plan is None:
+            plan = self._create_plan(event_name, plugins)
+            self._plans[event_name] = plan
+
+        if plan.unrestricted:
+            return plugins
+
+        user_position: Optional[float] = None
+        sampled_plugins: List[Plugin] = []
+        for plugin_plan in plan.plugins:
+            if plugin_plan.sample_rate < 1.0:
+                if user_position is None:
+                    user_position = zlib.crc32(user_id.encode('utf-8')) / _HASH_RANGE
+                if user_position >= plugin_plan.sample_rate:
+                    continue
+            if plugin_plan.bucket is not None and not plugin_plan.bucket.try_acquire():
+                continue
+            sampled_plugins.append(plugin_plan.plugin)
+        return sampled_plugins
+
+    def _create_plan(self, event_name: str, plugins: List[Plugin]) -> _EventPlan:
+        plugin_plans: List[_PluginPlan] = []
+        for plugin in plugins:
+            plugin_id = plugin.id()
+            rule_key, rule = self._find_rule(event_name, plugin_id)
+            if rule is None:
+                plugin_plans.append(_PluginPlan(plugin=plugin, sample_rate=1.0, bucket=None))
+                continue
+
+            bucket: Optional[TokenBucket] = None
+            if rule.max_events_per_second is not None:
+                # Buckets are shared by all events matching the same rule
+                # Without a burst, the capacity holds at least one token, an event needs a whole token
+                capacity = rule.burst if rule.burst is not None else max(1.0, rule.max_events_per_second)
+                bucket = self._buckets.setdefault(
+                    (rule_key, plugin_id),
+                    TokenBucket(rate=rule.max_events_per_second, capacity=capacity),
+                )
+            plugin_plans.append(_PluginPlan(plugin=plugin, sample_rate=rule.sample_rate, bucket=bucket))
+
+        unrestricted = all(p.sample_rate >= 1.0 and p.bucket is None for p in plugin_plans)
+        return _EventPlan(unrestricted=unrestricted, plugins=plugin_plans)
+
+    def _find_rule(self, event_name: str, plugin_id: str) -> Tuple[_RuleKey, Optional[SamplingRule]]:
+        for rule_key in ((event_name, plugin_id), (event_name, None), (None, plugin_id), (None, None)):
+            rule = self._rules.get(rule_key)
+            if rule is not None:
+                return rule_key, rule
+        return (None, None), None
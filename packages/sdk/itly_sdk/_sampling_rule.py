@@ -0,0 +1,24 @@
+from typing import NamedTuple, Optional
+
+
+class SamplingRule(NamedTuple):
+    """
+    Sampling and rate limit rule for track() calls
+
+    The most specific rule matching an event and a plugin is applied,
+    rules with both event_name and plugin_id set win over rules with only one of them set.
+
+    :param event_name:            Event name to apply the rule to. None matches any event.
+    :param plugin_id:             Plugin id to apply the rule to. None matches any plugin.
+    :param sample_rate:           Fraction of users (0.0 - 1.0) whose events are forwarded.
+                                  Sampling is deterministic per user_id.
+    :param max_events_per_second: Maximum number of forwarded events per second per plugin. None means unlimited.
+    :param burst:                 Number of events that can be forwarded at once before max_events_per_second applies.
+                                  Defaults to max_events_per_second, and at least 1.
+    """
+
+    event_name: Optional[str] = None
+    plugin_id: Optional[str] = None
+    sample_rate: float = 1.0
+    max_events_per_second: Optional[float] = None
+    burst: Optional[float] = None
@@ -0,0 +1,17 @@
+from typing import NamedTuple
+
+
+class ShutdownResult(NamedTuple):
+    """
+    Outcome of a plugin shutdown
+
+    :param delivered: Number of queued events uploaded while draining
+    :param spilled:   Number of queued events handed to a spill callback instead of being uploaded
+    :param dropped:   Number of queued events discarded because the deadline passed or their upload failed
+    :param timed_out: Whether the shutdown didn't finish before the deadline
+    """
+
+    delivered: int = 0
+    spilled: int = 0
+    dropped: int = 0
+    timed_out: bool = False
@@ -0,0 +1,122 @@
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from threading import Lock
+from typing import Dict, Optional, Any, Deque, List
+
+from ._logger import Logger
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, attributes: Optional[Dict[str, str]]) -> None:
+        self._tracer = tracer
+        self._name = name
+        self._attributes = attributes if attributes is not None else {}
+        self._start_time = 0.0
+        self._start = 0.0
+
+    def __enter__(self) -> "Span":
+        self._start_time = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._tracer.record(self._name, self._start_time, time.perf_counter() - self._start, self._attributes)
+
+
+class _NoneSpan:
+    def __enter__(self) -> "_NoneSpan":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+NONE_SPAN = _NoneSpan()
+
+
+class Tracer(ABC):
+    @abstractmethod
+    def record(self, name: str, start_time: float, duration: float, attributes: Dict[str, str]) -> None:
+        """
+        Record a finished stage.
+
+        :param name:       Stage name, e.g. 'itly.validate' or 'itly.plugin.amplitude.track'
+        :param start_time: Wall clock start time in seconds since the epoch
+        :param duration:   Duration in seconds, measured with a monotonic clock
+        :param attributes: Stage attributes, e.g. the event name
+        """
+        pass
+
+    def span(self, name: str, attributes: Optional[Dict[str, str]] = None) -> Span:
+        return Span(self, name, attributes)
+
+
+class TracerSafeDecorator(Tracer):
+    def __init__(self, tracer: Tracer, logger: Logger) -> None:
+        self._tracer = tracer
+        self._logger = logger
+
+    def record(self, name: str, start_time: float, duration: float, attributes: Dict[str, str]) -> None:
+        try:
+            self._tracer.record(name, start_time, duration, attributes)
+        except Exception as e:
+            self._logger.error(f'Error in tracer.record(). {e}')
+
+
+class StageTimingAggregator(Tracer):
+    def __init__(self, max_samples: int = 10000) -> None:
+        self._max_samples = max_samples
+        self._durations: Dict[str, Deque[float]] = {}
+        self._lock = Lock()
+
+    def record(self, name: str, start_time: float, duration: float, attributes: Dict[str, str]) -> None:
+        durations = self._durations.get(name)
+        if durations is None:
+            with self._lock:
+                durations = self._durations.setdefault(name, deque(maxlen=self._max_samples))
+        durations.append(duration)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return count, p50 and p99 durations in seconds of the most recent samples for each stage."""
+        with self._lock:
+            stages = {name: sorted(durations) for name, durations in self._durations.items()}
+        return {
+            name: {
+                'count': len(durations),
+                'p50': self._percentile(durations, 0.50),
+                'p99': self._percentile(durations, 0.99),
+            }
+            for name, durations in stages.items()
+            if len(durations) > 0
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations = {}
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], fraction: float) -> float:
+        return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Emits stages as OpenTelemetry spans
+
+    Requires the `opentelemetry-api` package. Spans are children of the span active when a stage finishes.
+    """
+
+    def __init__(self, tracer: Any = None) -> None:
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise ImportError("OpenTelemetryTracer requires the 'opentelemetry-api' package.")
+            tracer = trace.get_tracer('itly-sdk')
+        self._tracer = tracer
+
+    def record(self, name: str, start_time: float, duration: float, attributes: Dict[str, str]) -> None:
+        start_time_ns = int(start_time * 1e9)
+        span = self._tracer.start_span(name, attributes=attributes, start_time=start_time_ns)
+        span.end(end_time=start_time_ns + int(duration * 1e9))
@@ -1,2 +1,10 @@
 from ._async_consumer import AsyncConsumer, AsyncConsumerMessage
 from ._backoff import backoff
+from ._token_bucket import TokenBucket, KeyedTokenBucket
+from ._file_token_bucket import FileTokenBucket
+from ._shared_uploader import SharedUploaderClient, SharedUploaderServer, start_shared_uploader_process
+from ._fork_safety import register_after_fork
+from ._columnar_batch import ColumnarBatch
+from ._http import HttpRequest, HttpResponse, HttpTransportError, Delay, UploadSteps, RequestsTransport, \
+    HttpxTransport, run_upload, run_upload_async
+from ._asyncio_consumer import AsyncIOConsumer
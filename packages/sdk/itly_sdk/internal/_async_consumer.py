@@ -1,14 +1,66 @@
+import heapq
+import itertools
 import queue
+import time
 from datetime import datetime, timedelta
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 from typing import Optional, Callable, List, Tuple, NamedTuple, Any
 
+from .._metrics import Metrics
+from .._shutdown_result import ShutdownResult
+
 
 class AsyncConsumerMessage(NamedTuple):
     message_type: str
     data: Any
 
 
+class DeferredMessages:
+    """Messages held back until a point in time, taken in the order they become ready"""
+
+    def __init__(self) -> None:
+        # (ready_at, sequence, message)
+        self._heap: List[Tuple[float, int, AsyncConsumerMessage]] = []
+        self._sequence = itertools.count()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, message: AsyncConsumerMessage, delay: float) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), message))
+
+    def take_ready(self, max_size: int) -> List[AsyncConsumerMessage]:
+        """Take up to `max_size` ready messages of the same type"""
+        now = time.monotonic()
+        batch: List[AsyncConsumerMessage] = []
+        with self._lock:
+            while len(self._heap) > 0 and len(batch) < max_size and self._heap[0][0] <= now \
+                    and (len(batch) == 0 or self._heap[0][2].message_type == batch[0].message_type):
+                batch.append(heapq.heappop(self._heap)[2])
+        return batch
+
+    def take_all(self, max_size: int) -> List[List[AsyncConsumerMessage]]:
+        """Take all messages, ready or not, in batches of up to `max_size` messages of the same type"""
+        with self._lock:
+            messages = [message for _, _, message in sorted(self._heap)]
+            self._heap.clear()
+        batches: List[List[AsyncConsumerMessage]] = []
+        for message in messages:
+            if len(batches) == 0 or len(batches[-1]) >= max_size or batches[-1][0].message_type != message.message_type:
+                batches.append([])
+            batches[-1].append(message)
+        return batches
+
+    def seconds_until_ready(self) -> Optional[float]:
+        """Time until the next message is ready, None without messages"""
+        with self._lock:
+            if len(self._heap) == 0:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+
 class AsyncConsumer(Thread):
     @staticmethod
     def create_queue() -> queue.Queue:
@@ -16,17 +68,28 @@ class AsyncConsumer(Thread):
 
     def __init__(self,
                  message_queue: queue.Queue,
-                 do_upload: Callable[[List[AsyncConsumerMessage], Event], None],
+                 do_upload: Callable[[List[AsyncConsumerMessage], Event], Optional[int]],
                  flush_queue_size: int,
-                 flush_interval: timedelta) -> None:
-        """Create a consumer thread."""
+                 flush_interval: timedelta,
+                 metrics: Metrics = Metrics.NONE) -> None:
+        """
+        Create a consumer thread.
+
+        `do_upload` returns the number of messages of the batch that were delivered, None if all of them were,
+        apart from messages it passed to `defer()`.
+        """
         # Make consumer a daemon thread so that it doesn't block program exit
         Thread.__init__(self, daemon=True)
         self._do_upload = do_upload
         self._upload_size = flush_queue_size
         self._flush_interval = flush_interval
         self._queue = message_queue
+        self._metrics = metrics
         self._pending_message: Optional[AsyncConsumerMessage] = None
+        self._uploaded = 0
+        self._failed = 0
+        self._deferred = DeferredMessages()
+        self._deferred_in_batch = 0
         self._stop_event: Event = Event()
 
     def run(self) -> None:
@@ -37,17 +100,19 @@ class AsyncConsumer(Thread):
         self._stop_event.set()
 
     def upload(self) -> None:
-        batch, event = self.next()
-        if len(batch) == 0:
-            if event is not None:
-                event.set()
-                self._queue.task_done()
+        deferred = self._deferred.take_ready(self._upload_size)
+        if len(deferred) > 0:
+            self._upload_batch(deferred)
             return
 
+        batch, event = self.next()
         try:
-            self._do_upload(batch, self._stop_event)
-        except Exception:
-            pass
+            if len(batch) > 0:
+                self._upload_batch(batch)
+            if event is not None:
+                # A flush also uploads the deferred messages, without waiting until they are ready
+                for deferred in self._deferred.take_all(self._upload_size):
+                    self._upload_batch(deferred)
         finally:
             if event is not None:
                 event.set()
@@ -56,6 +121,34 @@ class AsyncConsumer(Thread):
             for _ in batch:
                 self._queue.task_done()
 
+    def defer(self, message: AsyncConsumerMessage, delay: float) -> None:
+        """
+        Upload a message of the current batch in a later batch, once `delay` seconds passed.
+
+        Called from `do_upload`, e.g. to stay within a rate limit. The message counts as neither delivered nor failed
+        in the current batch.
+        """
+        self._deferred.add(message, delay)
+        self._deferred_in_batch += 1
+
+    def _upload_batch(self, batch: List[AsyncConsumerMessage]) -> None:
+        self._metrics.gauge('itly.consumer.queue_depth', self._queue.qsize())
+        self._metrics.observe('itly.consumer.batch_size', len(batch))
+        self._metrics.observe('itly.consumer.batch_fill_ratio', len(batch) / self._upload_size)
+        start = time.monotonic()
+        self._deferred_in_batch = 0
+        try:
+            delivered = self._do_upload(batch, self._stop_event)
+            deferred = self._deferred_in_batch
+            delivered = len(batch) - deferred if delivered is None else delivered
+            self._uploaded += delivered
+            self._failed += len(batch) - deferred - delivered
+        except Exception:
+            self._failed += len(batch) - self._deferred_in_batch
+            self._metrics.increment('itly.consumer.upload_errors')
+        finally:
+            self._metrics.observe('itly.consumer.upload_duration', time.monotonic() - start)
+
     def next(self) -> Tuple[List[AsyncConsumerMessage], Optional[Event]]:
         start = datetime.now()
         items: List[AsyncConsumerMessage] = [self._pending_message] if self._pending_message is not None else []
@@ -65,6 +158,10 @@ class AsyncConsumer(Thread):
         while len(items) < self._upload_size and now - start < self._flush_interval:
             try:
                 timeout = (self._flush_interval - (now - start)).total_seconds()
+                until_deferred_ready = self._deferred.seconds_until_ready()
+                if len(items) == 0 and until_deferred_ready is not None:
+                    # Return early to upload deferred messages once they are ready
+                    timeout = min(timeout, until_deferred_ready)
                 item = self._queue.get(block=True, timeout=timeout)
                 if isinstance(item.data, Event):
                     return items, item.data
@@ -78,16 +175,72 @@ class AsyncConsumer(Thread):
 
         return items, None
 
-    def flush(self) -> None:
+    def flush(self, timeout: Optional[timedelta] = None) -> bool:
+        """Wait until all queued messages are uploaded. Return False if that didn't happen within the timeout."""
+        seconds = timeout.total_seconds() if timeout is not None else None
+        deadline = time.monotonic() + seconds if seconds is not None else None
         event = Event()
-        self._queue.put(AsyncConsumerMessage(message_type='flush', data=event))
-        event.wait()
+        try:
+            self._queue.put(AsyncConsumerMessage(message_type='flush', data=event), timeout=seconds)
+        except queue.Full:
+            return False
+        return event.wait(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+
+    def shutdown(self,
+                 timeout: Optional[timedelta] = None,
+                 spill: Optional[Callable[[List[AsyncConsumerMessage]], None]] = None) -> ShutdownResult:
+        """
+        Upload queued messages, then stop the consumer thread.
+
+        :param timeout: Maximum time to drain the queue and wait for the thread, None to wait until drained
+        :param spill:   Called with the messages that couldn't be uploaded before the deadline, which are dropped otherwise
+        """
+        deadline = time.monotonic() + timeout.total_seconds() if timeout is not None else None
+        uploaded = self._uploaded
+        failed = self._failed
+        if self.is_alive():
+            self.flush(timedelta(seconds=self._remaining(deadline)) if deadline is not None else None)
 
-    def shutdown(self) -> None:
         self.pause()
-        self._queue.put_nowait(AsyncConsumerMessage(message_type='flush', data=Event()))
         try:
-            self.join()
+            # Wake up the consumer if it waits for messages
+            self._queue.put_nowait(AsyncConsumerMessage(message_type='flush', data=Event()))
+        except queue.Full:
+            pass
+        try:
+            self.join(self._remaining(deadline) if deadline is not None else None)
         except RuntimeError:
             # consumer thread has not started
             pass
+
+        remaining = self._take_remaining_messages()
+        spilled = 0
+        if spill is not None and len(remaining) > 0:
+            spill(remaining)
+            spilled = len(remaining)
+        return ShutdownResult(delivered=self._uploaded - uploaded,
+                              spilled=spilled,
+                              dropped=len(remaining) - spilled + self._failed - failed,
+                              timed_out=self.is_alive())
+
+    def _take_remaining_messages(self) -> List[AsyncConsumerMessage]:
+        messages: List[AsyncConsumerMessage] = []
+        if self._pending_message is not None and not self.is_alive():
+            messages.append(self._pending_message)
+            self._pending_message = None
+        for batch in self._deferred.take_all(self._upload_size):
+            messages.extend(batch)
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                return messages
+            if isinstance(message.data, Event):
+                # Release callers waiting for a flush
+                message.data.set()
+            else:
+                messages.append(message)
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.0, deadline - time.monotonic())
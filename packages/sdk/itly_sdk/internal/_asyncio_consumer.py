@@ -0,0 +1,248 @@
+import asyncio
+import concurrent.futures
+import queue
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Callable, Awaitable, Coroutine, List, Optional, Deque, Set, Any
+
+from .._metrics import Metrics
+from .._shutdown_result import ShutdownResult
+from ._async_consumer import AsyncConsumer, AsyncConsumerMessage, DeferredMessages
+
+try:
+    import contextvars
+    # Messages deferred by the upload running in the current task
+    _deferred_in_upload: "contextvars.ContextVar[int]" = contextvars.ContextVar('_deferred_in_upload', default=0)
+except ImportError:  # pragma: no cover
+    # Python 3.6, the SDK can still be imported, only creating an AsyncIOConsumer fails
+    contextvars = None  # type: ignore
+
+
+class AsyncIOConsumer:
+    """
+    Batches messages like AsyncConsumer, but uploads them as tasks on an asyncio event loop instead of a thread
+
+    `put()` can be called from any thread. Up to `max_concurrent_uploads` batches are uploaded at the same time.
+    `do_upload` returns the number of messages of the batch that were delivered, None if all of them were,
+    apart from messages it passed to `defer()`.
+    Requires Python 3.7 or newer.
+    """
+
+    def __init__(self,
+                 loop: asyncio.AbstractEventLoop,
+                 do_upload: Callable[[List[AsyncConsumerMessage]], Awaitable[Optional[int]]],
+                 flush_queue_size: int,
+                 flush_interval: timedelta,
+                 max_concurrent_uploads: int = 10,
+                 metrics: Metrics = Metrics.NONE) -> None:
+        if contextvars is None:
+            raise ImportError("AsyncIOConsumer requires Python 3.7 or newer.")
+        self._loop = loop
+        self._do_upload = do_upload
+        self._upload_size = flush_queue_size
+        self._flush_interval = flush_interval
+        self._max_concurrent_uploads = max_concurrent_uploads
+        self._max_queue_size = AsyncConsumer.create_queue().maxsize
+        self._metrics = metrics
+        self._messages: Deque[AsyncConsumerMessage] = deque()
+        self._deferred = DeferredMessages()
+        # Created on the event loop, asyncio primitives are bound to the loop they are created on before Python 3.10
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._uploads: Set[Any] = set()
+        self._in_flight = 0
+        self._uploaded = 0
+        self._failed = 0
+        self._stopped = False
+        self._runner: Optional[concurrent.futures.Future] = None
+        self._runner_task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        self._runner = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def put(self, message: AsyncConsumerMessage) -> None:
+        """Queue a message, raises queue.Full like AsyncConsumer's queue"""
+        if len(self._messages) >= self._max_queue_size:
+            raise queue.Full
+        self._messages.append(message)
+        size = len(self._messages)
+        # Wake up the loop once per full batch, and for the first message to start the flush interval
+        if size == 1 or size % self._upload_size == 0:
+            self._loop.call_soon_threadsafe(self._wake_up)
+
+    def defer(self, message: AsyncConsumerMessage, delay: float) -> None:
+        """
+        Upload a message of the current batch in a later batch, once `delay` seconds passed.
+
+        Called from `do_upload`, e.g. to stay within a rate limit. The message counts as neither delivered nor failed
+        in the current batch.
+        """
+        self._deferred.add(message, delay)
+        _deferred_in_upload.set(_deferred_in_upload.get() + 1)
+        self._loop.call_soon_threadsafe(self._wake_up)
+
+    async def flush(self) -> None:
+        """Upload all queued and deferred messages and wait for uploads in progress."""
+        await self._upload_batches(include_partial=True)
+        while len(self._uploads) > 0 or len(self._deferred) > 0:
+            if len(self._uploads) > 0:
+                await asyncio.wait(set(self._uploads))
+            # Uploads in progress may have deferred more messages, a flush doesn't wait until they are ready
+            await self._upload_batches(include_partial=True, include_deferred=True)
+
+    async def shutdown(self) -> ShutdownResult:
+        uploaded = self._uploaded
+        failed = self._failed
+        await self.flush()
+        self._stopped = True
+        self._wake_up()
+        if self._runner_task is not None and self._runner_task is not asyncio.current_task():
+            # Let the runner return, so that no task is left pending on the loop
+            await asyncio.wait({self._runner_task})
+        return ShutdownResult(delivered=self._uploaded - uploaded, dropped=self._failed - failed)
+
+    def flush_threadsafe(self, timeout: Optional[timedelta] = None) -> bool:
+        """Flush from another thread. On the event loop thread the flush is only started, and False is returned."""
+        return self.run_threadsafe(self.flush(), timeout)
+
+    def run_threadsafe(self, coroutine: Coroutine[Any, Any, None], timeout: Optional[timedelta] = None) -> bool:
+        """Run a coroutine on the event loop and wait for it. Return False if it didn't complete within the timeout."""
+        if self._on_loop_thread():
+            self._loop.create_task(coroutine)
+            return False
+        if not self._loop.is_running():
+            # Nothing runs on a stopped or closed loop, e.g. when called from atexit after asyncio.run() returned
+            coroutine.close()
+            return False
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            future.result(timeout.total_seconds() if timeout is not None else None)
+            return True
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return False
+
+    def shutdown_threadsafe(self, timeout: Optional[timedelta] = None) -> ShutdownResult:
+        """Drain and stop from another thread. Messages not uploaded before the deadline are dropped."""
+        if self._on_loop_thread():
+            self._loop.create_task(self.shutdown())
+            return ShutdownResult(timed_out=True)
+
+        uploaded = self._uploaded
+        failed = self._failed
+        finished = self.run_threadsafe(self.shutdown(), timeout)
+        self._stopped = True
+        dropped = len(self._messages) + len(self._deferred) + self._in_flight + self._failed - failed
+        self._messages.clear()
+        self._deferred.take_all(self._upload_size)
+        if not finished and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._cancel_uploads)
+        return ShutdownResult(delivered=self._uploaded - uploaded, dropped=dropped, timed_out=not finished)
+
+    async def _run(self) -> None:
+        self._runner_task = asyncio.current_task()
+        interval = self._flush_interval.total_seconds()
+        deadline = self._loop.time() + interval
+        while not self._stopped:
+            timeout = max(0.0, deadline - self._loop.time())
+            until_deferred_ready = self._deferred.seconds_until_ready()
+            if until_deferred_ready is not None:
+                # Wake up to upload deferred messages once they are ready
+                timeout = min(timeout, until_deferred_ready)
+            try:
+                await asyncio.wait_for(self._get_wakeup().wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._get_wakeup().clear()
+            timed_out = self._loop.time() >= deadline
+            if timed_out:
+                deadline = self._loop.time() + interval
+            if not self._stopped:
+                await self._upload_batches(include_partial=timed_out)
+
+    async def _upload_batches(self, include_partial: bool, include_deferred: bool = False) -> None:
+        while True:
+            await self._get_semaphore().acquire()
+            batch = self._deferred.take_ready(self._upload_size)
+            if len(batch) == 0:
+                self._get_semaphore().release()
+                break
+            self._start_upload(batch)
+        if include_deferred:
+            for batch in self._deferred.take_all(self._upload_size):
+                await self._get_semaphore().acquire()
+                self._start_upload(batch)
+        while len(self._messages) > 0:
+            # Take the batch only once an upload slot is free, so that flush() sees every message queued or uploading
+            await self._get_semaphore().acquire()
+            batch = self._take_batch(include_partial) if len(self._messages) > 0 else None
+            if batch is None:
+                self._get_semaphore().release()
+                return
+            self._start_upload(batch)
+
+    def _start_upload(self, batch: List[AsyncConsumerMessage]) -> None:
+        """Start uploading a batch, once an upload slot was acquired for it"""
+        self._in_flight += len(batch)
+        task = self._loop.create_task(self._upload(batch))
+        self._uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+
+    def _take_batch(self, include_partial: bool) -> Optional[List[AsyncConsumerMessage]]:
+        message_type = self._messages[0].message_type
+        batch: List[AsyncConsumerMessage] = []
+        while len(batch) < self._upload_size and len(self._messages) > 0 \
+                and self._messages[0].message_type == message_type:
+            batch.append(self._messages.popleft())
+        if not include_partial and len(batch) < self._upload_size and len(self._messages) == 0:
+            # Wait for more messages or the flush interval
+            self._messages.extendleft(reversed(batch))
+            return None
+        return batch
+
+    async def _upload(self, batch: List[AsyncConsumerMessage]) -> None:
+        self._metrics.gauge('itly.consumer.queue_depth', len(self._messages))
+        self._metrics.observe('itly.consumer.batch_size', len(batch))
+        self._metrics.observe('itly.consumer.batch_fill_ratio', len(batch) / self._upload_size)
+        start = time.monotonic()
+        # Each upload runs in its own task, with its own copy of the context
+        _deferred_in_upload.set(0)
+        try:
+            delivered = await self._do_upload(batch)
+            deferred = _deferred_in_upload.get()
+            delivered = len(batch) - deferred if delivered is None else delivered
+            self._uploaded += delivered
+            self._failed += len(batch) - deferred - delivered
+        except Exception:
+            self._failed += len(batch) - _deferred_in_upload.get()
+            self._metrics.increment('itly.consumer.upload_errors')
+        finally:
+            self._metrics.observe('itly.consumer.upload_duration', time.monotonic() - start)
+            self._in_flight -= len(batch)
+            self._get_semaphore().release()
+
+    def _cancel_uploads(self) -> None:
+        for task in self._uploads:
+            task.cancel()
+        if self._runner is not None:
+            self._runner.cancel()
+
+    def _wake_up(self) -> None:
+        self._get_wakeup().set()
+
+    def _get_wakeup(self) -> asyncio.Event:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrent_uploads)
+        return self._semaphore
+
+    def _on_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
@@ -0,0 +1,168 @@
+import json
+from array import array
+from json.encoder import c_make_encoder, encode_basestring_ascii  # type: ignore
+from typing import Dict, List, Any, Iterable, Iterator, Union
+
+
+class _Missing:
+    pass
+
+
+_MISSING = _Missing()
+_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+if c_make_encoder is not None:
+    # JSONEncoder.encode() creates a C encoder per call, which costs more than encoding a small value.
+    # Circular references raise RecursionError instead of ValueError.
+    _c_encoder = c_make_encoder(None, _ENCODER.default, encode_basestring_ascii, None, ':', ',', False, False, True)
+
+    def _encode(value: Any) -> str:
+        return ''.join(_c_encoder(value, 0))
+else:  # pragma: no cover
+    # Interpreters without the C accelerated json module, e.g. PyPy
+    _encode = _ENCODER.encode
+
+_Column = Union[List[Any], "array[int]"]
+
+
+class ColumnarBatch:
+    """
+    Batch of events stored as one array per field instead of one dict per event
+
+    Field names are stored once per batch. Values of `dictionary_fields` (e.g. event names) are stored once per
+    distinct value and referenced by index, so their values must be hashable. Events may have different fields.
+    """
+
+    def __init__(self, dictionary_fields: Iterable[str] = ('event_type',)) -> None:
+        self._dictionary_fields = frozenset(dictionary_fields)
+        self._columns: Dict[str, _Column] = {}
+        self._dictionaries: Dict[str, Dict[Any, int]] = {}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, event: Dict[str, Any]) -> None:
+        length = self._length
+        for key, value in event.items():
+            column = self._columns.get(key)
+            if column is None:
+                column = self._add_column(key)
+            dictionary = self._dictionaries.get(key)
+            if dictionary is not None:
+                code = dictionary.get(value)
+                if code is None:
+                    code = dictionary[value] = len(dictionary)
+                column.append(code)
+            else:
+                column.append(value)
+        self._length = length + 1
+
+        if len(event) < len(self._columns):
+            for key, column in self._columns.items():
+                if len(column) == length:
+                    column.append(-1 if key in self._dictionaries else _MISSING)
+
+    def extend(self, events: Iterable[Dict[str, Any]]) -> None:
+        for event in events:
+            self.append(event)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        columns = [(key, self._decoded_column(key)) for key in self._columns]
+        for i in range(self._length):
+            yield {key: column[i] for key, column in columns if column[i] is not _MISSING}
+
+    def to_ndjson(self) -> bytes:
+        """
+        Encode events as newline-delimited JSON.
+
+        Field names and dictionary values are encoded once per batch, and columns of strings or integers with the
+        C functions of the json module, so that only other values are encoded one by one.
+        """
+        if self._length == 0:
+            return b''
+
+        encode = _encode
+        encoded_columns: List[Iterable[str]] = []
+        has_missing = False
+        for key, column in self._columns.items():
+            prefix = encode(key) + ':'
+            dictionary = self._dictionaries.get(key)
+            if dictionary is not None:
+                encoded_values = [prefix + encode(value) for value in dictionary]
+                if -1 in column:
+                    has_missing = True
+                    encoded_values.append('')
+                encoded_columns.append(map(encoded_values.__getitem__, column))
+                continue
+
+            value_types = set(map(type, column))
+            if _Missing in value_types:
+                has_missing = True
+                encoded_columns.append(['' if value is _MISSING else prefix + encode(value) for value in column])
+            elif value_types == {str}:
+                encoded_columns.append(map(prefix.__add__, map(encode_basestring_ascii, column)))
+            elif value_types == {int}:
+                encoded_columns.append(map(prefix.__add__, map(int.__repr__, column)))
+            else:
+                encoded_columns.append(map(prefix.__add__, map(encode, column)))
+
+        rows: Iterable[str]
+        if has_missing:
+            # Missing fields are empty strings, left out with their separators
+            rows = (','.join(filter(None, fields)) for fields in zip(*encoded_columns))
+        else:
+            rows = map(','.join, zip(*encoded_columns))
+        return ('{' + '}\n{'.join(rows) + '}\n').encode('utf-8')
+
+    def to_arrow_ipc(self) -> bytes:
+        """
+        Encode events as an Arrow IPC stream with one record batch.
+
+        Requires the `pyarrow` package. Dictionary fields become dictionary arrays, and dict or list values
+        are stored as JSON strings. Missing fields are null.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("ColumnarBatch.to_arrow_ipc() requires the 'pyarrow' package.")
+
+        arrays = []
+        for key, column in self._columns.items():
+            dictionary = self._dictionaries.get(key)
+            if dictionary is not None:
+                indices = pa.array(column, type=pa.int32(), mask=[code < 0 for code in column])
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(list(dictionary))))
+            else:
+                arrays.append(pa.array([self._arrow_value(value) for value in column]))
+
+        table = pa.Table.from_arrays(arrays, names=list(self._columns))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def _add_column(self, key: str) -> _Column:
+        column: _Column
+        if key in self._dictionary_fields:
+            column = array('i', [-1]) * self._length
+            self._dictionaries[key] = {}
+        else:
+            column = [_MISSING] * self._length
+        self._columns[key] = column
+        return column
+
+    def _decoded_column(self, key: str) -> List[Any]:
+        dictionary = self._dictionaries.get(key)
+        if dictionary is None:
+            return self._columns[key]  # type: ignore
+        values = list(dictionary)
+        return [values[code] if code >= 0 else _MISSING for code in self._columns[key]]
+
+    @staticmethod
+    def _arrow_value(value: Any) -> Any:
+        if value is _MISSING:
+            return None
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, separators=(',', ':'))
+        return value
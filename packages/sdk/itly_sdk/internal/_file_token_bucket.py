@@ -0,0 +1,45 @@
+import os
+import struct
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+# tokens, updated_at
+_STATE = struct.Struct('<dd')
+
+
+class FileTokenBucket:
+    """
+    Token bucket shared by all processes on the host using the same file
+
+    The state is kept in `path` and updated under an exclusive `flock`. Requires a POSIX platform.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float) -> None:
+        if fcntl is None:
+            raise ImportError("FileTokenBucket requires the 'fcntl' module, which is only available on POSIX platforms.")
+        self._path = path
+        self._rate = float(rate)
+        self._capacity = float(capacity)
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens, going into debt if needed. Return the seconds to wait before using them."""
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Wall clock time, monotonic clocks aren't comparable between processes on all platforms
+            now = time.time()
+            data = os.pread(fd, _STATE.size, 0)
+            if len(data) == _STATE.size:
+                available, updated_at = _STATE.unpack(data)
+                available = min(self._capacity, available + max(0.0, now - updated_at) * self._rate)
+            else:
+                available = self._capacity
+            available -= tokens
+            os.pwrite(fd, _STATE.pack(available, now), 0)
+        finally:
+            os.close(fd)
+        return -available / self._rate if available < 0 else 0.0
@@ -0,0 +1,32 @@
+import os
+import traceback
+import weakref
+from typing import Callable, List
+
+_handlers: List["weakref.WeakMethod"] = []
+
+
+def register_after_fork(method: Callable[[], None]) -> None:
+    """
+    Call a bound method in the child process after os.fork().
+
+    Threads don't survive a fork, so objects owning consumer threads use this to restart them in the child.
+    The object is weakly referenced. Does nothing on platforms without `os.register_at_fork` (Windows, Python 3.6).
+    """
+    _handlers[:] = [handler for handler in _handlers if handler() is not None]
+    _handlers.append(weakref.WeakMethod(method))
+
+
+def _after_fork_in_child() -> None:
+    for handler in list(_handlers):
+        method = handler()
+        if method is None:
+            continue
+        try:
+            method()
+        except Exception:
+            traceback.print_exc()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
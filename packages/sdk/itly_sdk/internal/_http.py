@@ -0,0 +1,141 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from threading import Event
+from typing import NamedTuple, Any, Dict, Optional, Generator, Union, TypeVar
+
+from .._metrics import Metrics
+
+
+class HttpRequest(NamedTuple):
+    url: str
+    json: Any = None
+    data: Any = None
+    headers: Optional[Dict[str, str]] = None
+    # Already encoded body, sent as is
+    content: Optional[bytes] = None
+
+
+class HttpResponse(NamedTuple):
+    status_code: int
+    content: bytes = b''
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class HttpTransportError(Exception):
+    """The request couldn't be sent or no response was received, e.g. connection errors and timeouts"""
+    pass
+
+
+class Delay(NamedTuple):
+    seconds: float
+
+
+T = TypeVar('T')
+
+# Upload logic independent of the HTTP library: yields requests to send and delays to wait, receives responses.
+# Transport errors are thrown into the generator.
+UploadSteps = Generator[Union[HttpRequest, Delay], Optional[HttpResponse], T]
+
+
+class RequestsTransport:
+    """Sends requests with a `requests.Session`"""
+
+    def __init__(self, request_timeout: timedelta) -> None:
+        import requests
+        self._requests = requests
+        self._session = requests.Session()
+        self._timeout = request_timeout.total_seconds()
+
+    def send(self, request: HttpRequest) -> HttpResponse:
+        try:
+            response = self._session.post(request.url, json=request.json,
+                                          data=request.content if request.content is not None else request.data,
+                                          headers=request.headers, timeout=self._timeout)
+        except (self._requests.ConnectionError, self._requests.Timeout) as e:
+            raise HttpTransportError(str(e)) from e
+        return HttpResponse(status_code=response.status_code, content=response.content)
+
+
+class HttpxTransport:
+    """
+    Sends requests with an `httpx.AsyncClient` from an event loop
+
+    Requires the `httpx` package. Requests of concurrent uploads share the client's connection pool.
+    """
+
+    def __init__(self, request_timeout: timedelta, max_connections: int = 10) -> None:
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("HttpxTransport requires the 'httpx' package.")
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(timeout=request_timeout.total_seconds(),
+                                         limits=httpx.Limits(max_connections=max_connections))
+
+    async def send(self, request: HttpRequest) -> HttpResponse:
+        try:
+            response = await self._client.post(request.url, json=request.json, data=request.data,
+                                               content=request.content, headers=request.headers)
+        except self._httpx.TransportError as e:
+            raise HttpTransportError(str(e)) from e
+        return HttpResponse(status_code=response.status_code, content=response.content)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def run_upload(steps: "UploadSteps[T]", transport: RequestsTransport, stop_event: Event,
+               metrics: Metrics = Metrics.NONE) -> Optional[T]:
+    """Run upload steps on the current thread. Delays end early, and the upload is abandoned, once `stop_event` is set."""
+    try:
+        step = next(steps)
+        while True:
+            if isinstance(step, Delay):
+                if stop_event.wait(step.seconds):
+                    steps.close()
+                    return None
+                step = steps.send(None)
+                continue
+
+            start = time.monotonic()
+            try:
+                response = transport.send(step)
+            except HttpTransportError as e:
+                step = steps.throw(e)
+                continue
+            _record_response(metrics, response, time.monotonic() - start)
+            step = steps.send(response)
+    except StopIteration as e:
+        return e.value
+
+
+async def run_upload_async(steps: "UploadSteps[T]", transport: HttpxTransport,
+                           metrics: Metrics = Metrics.NONE) -> Optional[T]:
+    """Run upload steps on the event loop. Cancel the task to abandon the upload."""
+    try:
+        step = next(steps)
+        while True:
+            if isinstance(step, Delay):
+                await asyncio.sleep(step.seconds)
+                step = steps.send(None)
+                continue
+
+            start = time.monotonic()
+            try:
+                response = await transport.send(step)
+            except HttpTransportError as e:
+                step = steps.throw(e)
+                continue
+            _record_response(metrics, response, time.monotonic() - start)
+            step = steps.send(response)
+    except StopIteration as e:
+        return e.value
+
+
+def _record_response(metrics: Metrics, response: HttpResponse, duration: float) -> None:
+    metrics.observe('itly.client.request_duration', duration)
+    metrics.increment('itly.client.responses', tags={'status': str(response.status_code)})
@@ -0,0 +1,225 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import timedelta
+from threading import Lock, Thread
+from typing import Callable, Optional, Any, Dict, List
+
+from ._async_consumer import AsyncConsumerMessage
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+
+class SharedUploaderClient:
+    """
+    Queue-like sender of messages to a SharedUploaderServer running in another process
+
+    Used by plugin clients in place of their local queue and consumer thread, so that all processes of a
+    pre-fork server share one batching and upload process. Requires a POSIX platform.
+    """
+
+    def __init__(self,
+                 socket_path: str,
+                 start_server: Callable[[], None],
+                 on_error: Callable[[str], None],
+                 connect_timeout: timedelta = timedelta(seconds=5),
+                 flush_timeout: timedelta = timedelta(seconds=30)) -> None:
+        if fcntl is None:
+            raise ImportError("SharedUploaderClient requires the 'fcntl' module, which is only available on POSIX platforms.")
+        self._socket_path = socket_path
+        self._start_server = start_server
+        self._on_error = on_error
+        self._connect_timeout = connect_timeout
+        self._flush_timeout = flush_timeout
+        self._socket: Optional[socket.socket] = None
+        self._pid = os.getpid()
+        self._lock = Lock()
+
+    def put(self, message: AsyncConsumerMessage) -> None:
+        self._send({"t": message.message_type, "d": message.data})
+
+    def flush(self) -> None:
+        self._send({"flush": True}, wait_for_reply=True)
+
+    def query(self, name: str) -> Any:
+        """Returns the JSON value of the server's `name` query, or None if the server can't be reached"""
+        reply = self._send({"query": name}, wait_for_reply=True)
+        return json.loads(reply) if reply else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _send(self, command: Dict[str, Any], wait_for_reply: bool = False) -> Optional[bytes]:
+        if self._pid != os.getpid():
+            # Forked child: the connection and lock belong to the parent process
+            self._pid = os.getpid()
+            self._socket = None
+            self._lock = Lock()
+
+        line = (json.dumps(command, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._socket = self._connect()
+                    self._socket.sendall(line)
+                    return self._read_reply(self._socket) if wait_for_reply else None
+                except OSError as e:
+                    self._disconnect()
+                    if attempt == 1:
+                        self._on_error(f'Unable to send to shared uploader {self._socket_path}. {e}')
+        return None
+
+    def _connect(self) -> socket.socket:
+        try:
+            return self._open_socket()
+        except OSError:
+            self._start_server()
+
+        deadline = time.monotonic() + self._connect_timeout.total_seconds()
+        while True:
+            try:
+                return self._open_socket()
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _read_reply(self, sock: socket.socket) -> bytes:
+        # Replies are single lines, an empty one acknowledges a flush
+        sock.settimeout(self._flush_timeout.total_seconds())
+        try:
+            reply = b''
+            while not reply.endswith(b'\n'):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError('shared uploader closed the connection')
+                reply += chunk
+            return reply[:-1]
+        finally:
+            sock.settimeout(None)
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+
+class SharedUploaderServer:
+    """
+    Receives messages from SharedUploaderClient connections and hands them to a local queue
+
+    Only one server can run for a socket path; others exit immediately. The server stops once no client
+    has been connected for `idle_timeout`, and calls `flush` before returning. Clients can read the JSON value
+    returned by the callables in `queries`, e.g. of state kept by the server's plugin client.
+    """
+
+    def __init__(self,
+                 socket_path: str,
+                 enqueue: Callable[[AsyncConsumerMessage], None],
+                 flush: Callable[[], None],
+                 idle_timeout: timedelta = timedelta(minutes=1),
+                 queries: Optional[Dict[str, Callable[[], Any]]] = None) -> None:
+        if fcntl is None:
+            raise ImportError("SharedUploaderServer requires the 'fcntl' module, which is only available on POSIX platforms.")
+        self._socket_path = socket_path
+        self._enqueue = enqueue
+        self._flush = flush
+        self._idle_timeout = idle_timeout
+        self._queries = queries or {}
+        self._connections = 0
+        self._connections_lock = Lock()
+        self._stopped = False
+
+    def serve_forever(self) -> None:
+        with open(self._socket_path + '.lock', 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another server owns the socket
+                return
+
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                server.bind(self._socket_path)
+                server.listen(128)
+                server.settimeout(0.5)
+                self._accept_until_idle(server)
+            finally:
+                server.close()
+                os.unlink(self._socket_path)
+                self._flush()
+
+    def stop(self) -> None:
+        self._stopped = True
+
+    def _accept_until_idle(self, server: socket.socket) -> None:
+        idle_since = time.monotonic()
+        while not self._stopped:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                with self._connections_lock:
+                    if self._connections > 0:
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since > self._idle_timeout.total_seconds():
+                        return
+                continue
+
+            with self._connections_lock:
+                self._connections += 1
+            Thread(target=self._handle_connection, args=(connection,), daemon=True).start()
+
+    def _handle_connection(self, connection: socket.socket) -> None:
+        try:
+            with connection, connection.makefile('rb') as lines:
+                for line in lines:
+                    command = json.loads(line)
+                    if command.get("flush"):
+                        self._flush()
+                        connection.sendall(b'\n')
+                    elif "query" in command:
+                        query = self._queries.get(command["query"])
+                        value = query() if query is not None else None
+                        connection.sendall((json.dumps(value, separators=(',', ':')) + '\n').encode('utf-8'))
+                    else:
+                        self._enqueue(AsyncConsumerMessage(message_type=command["t"], data=command["d"]))
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._connections_lock:
+                self._connections -= 1
+
+
+def start_shared_uploader_process(module: str, socket_path: str, config: Dict[str, Any]) -> None:
+    """
+    Start `python -m <module> <socket_path>` detached from the current process, passing `config` as JSON on stdin.
+
+    The module is expected to create a plugin client from the config and run a SharedUploaderServer.
+    """
+    args: List[str] = [sys.executable, '-m', module, socket_path]
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, start_new_session=True)
+    assert process.stdin is not None
+    process.stdin.write(json.dumps(config).encode('utf-8'))
+    process.stdin.close()
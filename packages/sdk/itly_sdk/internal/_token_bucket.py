@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, Tuple
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Create a bucket that refills `rate` tokens per second up to `capacity` tokens."""
+        self._rate = float(rate)
+        self._capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens, going into debt if needed. Return the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+
+class KeyedTokenBucket:
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000) -> None:
+        """
+        Create a bucket per key, e.g. per user, that refills `rate` tokens per second up to `capacity` tokens.
+
+        Only the `max_keys` most recently used keys are tracked. An evicted key starts again with a full bucket.
+        """
+        self._rate = float(rate)
+        self._capacity = float(capacity)
+        self._max_keys = max_keys
+        # key -> (tokens, updated_at)
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def try_acquire(self, key: Hashable, tokens: float = 1.0) -> bool:
+        with self._lock:
+            available, now = self._available(key)
+            acquired = available >= tokens
+            self._buckets[key] = (available - tokens if acquired else available, now)
+            return acquired
+
+    def reserve(self, key: Hashable, tokens: float = 1.0) -> float:
+        """Take tokens from the key's bucket, going into debt if needed. Return the seconds to wait before using them."""
+        with self._lock:
+            available, now = self._available(key)
+            available -= tokens
+            self._buckets[key] = (available, now)
+            return -available / self._rate if available < 0 else 0.0
+
+    def _available(self, key: Hashable) -> Tuple[float, float]:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._max_keys:
+                self._buckets.popitem(last=False)
+            return self._capacity, now
+        self._buckets.move_to_end(key)
+        return min(self._capacity, bucket[0] + (now - bucket[1]) * self._rate), now
@@ -1,6 +1,9 @@
 import time
 from datetime import timedelta
+from threading import Event
+from typing import List
 
+from itly_sdk import InMemoryMetrics, ShutdownResult
 from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage
 
 
@@ -68,3 +71,161 @@ def test_consumer():
 
         time.sleep(0.1)
         assert batches == [["1", "2", "3"], ["4"], ["5", "6"], ["7"], ["8"], ["9", "10"]]
+
+
+def test_consumer_metrics():
+    metrics = InMemoryMetrics()
+
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=lambda batch, event: None,
+        flush_queue_size=4,
+        flush_interval=timedelta(seconds=1),
+        metrics=metrics,
+    )
+    try:
+        consumer.start()
+
+        q.put(AsyncConsumerMessage(message_type='data', data='1'))
+        q.put(AsyncConsumerMessage(message_type='data', data='2'))
+        consumer.flush()
+    finally:
+        consumer.shutdown()
+
+    assert metrics.histogram('itly.consumer.batch_size') == [2]
+    assert metrics.histogram('itly.consumer.batch_fill_ratio') == [0.5]
+    assert len(metrics.histogram('itly.consumer.upload_duration')) == 1
+    assert metrics.gauge_value('itly.consumer.queue_depth') == 0
+
+
+def test_consumer_flush_timeout():
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=lambda batch, event: None,
+        flush_queue_size=3,
+        flush_interval=timedelta(seconds=1)
+    )
+
+    # Consumer is not started, so the flush never completes
+    assert consumer.flush(timeout=timedelta(milliseconds=50)) is False
+
+    consumer.start()
+    try:
+        assert consumer.flush(timeout=timedelta(seconds=1)) is True
+    finally:
+        consumer.shutdown()
+
+
+def test_consumer_shutdown_drains_queue():
+    batches = []
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=lambda batch, event: batches.append([msg.data for msg in batch]),
+        flush_queue_size=2,
+        flush_interval=timedelta(seconds=10)
+    )
+    consumer.start()
+    for i in range(5):
+        q.put(AsyncConsumerMessage(message_type='data', data=str(i)))
+
+    assert consumer.shutdown(timeout=timedelta(seconds=1)) == ShutdownResult(delivered=5)
+    assert batches == [['0', '1'], ['2', '3'], ['4']]
+    assert not consumer.is_alive()
+
+
+def test_consumer_shutdown_counts_failed_uploads():
+    def do_upload(batch: List[AsyncConsumerMessage], event: Event) -> int:
+        # Slow enough to finish after shutdown() started
+        time.sleep(0.1)
+        if batch[0].message_type == 'fail':
+            raise ValueError()
+        # Odd messages are rejected
+        return sum(1 for msg in batch if msg.data % 2 == 0)
+
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=do_upload,
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10)
+    )
+    consumer.start()
+    for i in range(4):
+        q.put(AsyncConsumerMessage(message_type='data', data=i))
+    q.put(AsyncConsumerMessage(message_type='fail', data=4))
+
+    assert consumer.shutdown(timeout=timedelta(seconds=1)) == ShutdownResult(delivered=2, dropped=3)
+
+
+def test_consumer_defer():
+    uploaded = []
+
+    def do_upload(batch: List[AsyncConsumerMessage], event: Event) -> None:
+        for msg in batch:
+            if msg.message_type == 'data' and msg.data % 2 == 1:
+                consumer.defer(AsyncConsumerMessage(message_type='later', data=msg.data), 0.2)
+            else:
+                uploaded.append(msg.data)
+
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=do_upload,
+        flush_queue_size=10,
+        flush_interval=timedelta(milliseconds=50)
+    )
+    consumer.start()
+    for i in range(4):
+        q.put(AsyncConsumerMessage(message_type='data', data=i))
+
+    time.sleep(0.1)
+    assert uploaded == [0, 2]
+    # Deferred messages are uploaded in a later batch once ready
+    time.sleep(0.3)
+    assert uploaded == [0, 2, 1, 3]
+    assert consumer.shutdown() == ShutdownResult()
+
+
+def test_consumer_shutdown_uploads_deferred_messages():
+    def do_upload(batch: List[AsyncConsumerMessage], event: Event) -> None:
+        for msg in batch:
+            if msg.message_type == 'data' and msg.data % 2 == 1:
+                consumer.defer(AsyncConsumerMessage(message_type='later', data=msg.data), 10)
+
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=do_upload,
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10)
+    )
+    consumer.start()
+    for i in range(4):
+        q.put(AsyncConsumerMessage(message_type='data', data=i))
+
+    # Deferred messages are counted once, when they are uploaded
+    assert consumer.shutdown(timeout=timedelta(seconds=1)) == ShutdownResult(delivered=4)
+
+
+def test_consumer_shutdown_deadline():
+    spilled = []
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=lambda batch, event: event.wait(0.3),
+        flush_queue_size=1,
+        flush_interval=timedelta(seconds=10)
+    )
+    consumer.start()
+    for i in range(5):
+        q.put(AsyncConsumerMessage(message_type='data', data=str(i)))
+
+    # Upload of the first message is interrupted once the deadline passes, the others aren't uploaded
+    result = consumer.shutdown(timeout=timedelta(milliseconds=100), spill=spilled.extend)
+    assert (result.spilled, result.dropped) == (4, 0)
+    assert [message.data for message in spilled] == ['1', '2', '3', '4']
+    consumer.join(timeout=1)
+    assert not consumer.is_alive()
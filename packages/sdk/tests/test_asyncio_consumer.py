@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from typing import List, Iterator
+
+import pytest
+
+from itly_sdk import ShutdownResult
+from itly_sdk.internal import AsyncIOConsumer, AsyncConsumerMessage
+
+
+def test_asyncio_consumer():
+    batches: List[List[str]] = []
+
+    async def do_upload(batch: List[AsyncConsumerMessage]) -> None:
+        await asyncio.sleep(0.01)
+        batches.append([msg.data for msg in batch])
+
+    async def main() -> None:
+        consumer = AsyncIOConsumer(loop=asyncio.get_running_loop(),
+                                   do_upload=do_upload,
+                                   flush_queue_size=3,
+                                   flush_interval=timedelta(seconds=0.5))
+        consumer.start()
+
+        for data in ['1', '2', '3', '4']:
+            consumer.put(AsyncConsumerMessage(message_type='data', data=data))
+        await asyncio.sleep(0.1)
+        assert batches == [['1', '2', '3']]
+
+        await asyncio.sleep(0.6)
+        assert batches == [['1', '2', '3'], ['4']]
+
+        consumer.put(AsyncConsumerMessage(message_type='message', data='5'))
+        consumer.put(AsyncConsumerMessage(message_type='data', data='6'))
+        await consumer.flush()
+        assert batches == [['1', '2', '3'], ['4'], ['5'], ['6']]
+
+        result = await consumer.shutdown()
+        assert result.delivered == 0
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def loop() -> Iterator[asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+
+    async def finish_tasks() -> None:
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(finish_tasks(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_asyncio_consumer_from_other_thread(loop: asyncio.AbstractEventLoop):
+    in_flight = 0
+    max_in_flight = 0
+    uploaded: List[str] = []
+
+    async def do_upload(batch: List[AsyncConsumerMessage]) -> None:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        uploaded.extend(msg.data for msg in batch)
+
+    consumer = AsyncIOConsumer(loop=loop,
+                               do_upload=do_upload,
+                               flush_queue_size=2,
+                               flush_interval=timedelta(seconds=10),
+                               max_concurrent_uploads=3)
+    consumer.start()
+    for i in range(20):
+        consumer.put(AsyncConsumerMessage(message_type='data', data=str(i)))
+
+    result = consumer.shutdown_threadsafe(timedelta(seconds=5))
+
+    assert result.delivered == 20
+    assert result.dropped == 0
+    assert not result.timed_out
+    assert sorted(uploaded, key=int) == [str(i) for i in range(20)]
+    assert 1 < max_in_flight <= 3
+
+
+def test_asyncio_consumer_counts_failed_uploads(loop: asyncio.AbstractEventLoop):
+    async def do_upload(batch: List[AsyncConsumerMessage]) -> int:
+        # Slow enough to finish after shutdown started
+        await asyncio.sleep(0.1)
+        if batch[0].message_type == 'fail':
+            raise ValueError()
+        # Odd messages are rejected
+        return sum(1 for msg in batch if msg.data % 2 == 0)
+
+    consumer = AsyncIOConsumer(loop=loop,
+                               do_upload=do_upload,
+                               flush_queue_size=10,
+                               flush_interval=timedelta(seconds=10))
+    consumer.start()
+    for i in range(4):
+        consumer.put(AsyncConsumerMessage(message_type='data', data=i))
+    consumer.put(AsyncConsumerMessage(message_type='fail', data=4))
+
+    result = consumer.shutdown_threadsafe(timedelta(seconds=5))
+
+    assert (result.delivered, result.dropped, result.timed_out) == (2, 3, False)
+
+
+def test_asyncio_consumer_defer(loop: asyncio.AbstractEventLoop):
+    uploaded = []
+
+    async def do_upload(batch: List[AsyncConsumerMessage]) -> None:
+        for msg in batch:
+            if msg.message_type == 'data' and msg.data % 2 == 1:
+                consumer.defer(AsyncConsumerMessage(message_type='later', data=msg.data), 0.2)
+            else:
+                uploaded.append(msg.data)
+
+    consumer = AsyncIOConsumer(loop=loop,
+                               do_upload=do_upload,
+                               flush_queue_size=10,
+                               flush_interval=timedelta(milliseconds=50))
+    consumer.start()
+    for i in range(4):
+        consumer.put(AsyncConsumerMessage(message_type='data', data=i))
+
+    time.sleep(0.1)
+    assert uploaded == [0, 2]
+    # Deferred messages are uploaded in a later batch once ready
+    time.sleep(0.3)
+    assert uploaded == [0, 2, 1, 3]
+    assert consumer.shutdown_threadsafe(timedelta(seconds=5)) == ShutdownResult()
+
+
+def test_asyncio_consumer_shutdown_uploads_deferred_messages(loop: asyncio.AbstractEventLoop):
+    async def do_upload(batch: List[AsyncConsumerMessage]) -> None:
+        for msg in batch:
+            if msg.message_type == 'data' and msg.data % 2 == 1:
+                consumer.defer(AsyncConsumerMessage(message_type='later', data=msg.data), 10)
+
+    consumer = AsyncIOConsumer(loop=loop,
+                               do_upload=do_upload,
+                               flush_queue_size=10,
+                               flush_interval=timedelta(seconds=10))
+    consumer.start()
+    for i in range(4):
+        consumer.put(AsyncConsumerMessage(message_type='data', data=i))
+
+    # Deferred messages are counted once, when they are uploaded
+    assert consumer.shutdown_threadsafe(timedelta(seconds=5)) == ShutdownResult(delivered=4)
+
+
+def test_asyncio_consumer_shutdown_deadline(loop: asyncio.AbstractEventLoop):
+    async def do_upload(batch: List[AsyncConsumerMessage]) -> None:
+        await asyncio.sleep(10)
+
+    consumer = AsyncIOConsumer(loop=loop,
+                               do_upload=do_upload,
+                               flush_queue_size=2,
+                               flush_interval=timedelta(seconds=10),
+                               max_concurrent_uploads=1)
+    consumer.start()
+    for i in range(5):
+        consumer.put(AsyncConsumerMessage(message_type='data', data=str(i)))
+
+    result = consumer.shutdown_threadsafe(timedelta(seconds=0.2))
+
+    assert result.delivered == 0
+    assert result.dropped == 5
+    assert result.timed_out
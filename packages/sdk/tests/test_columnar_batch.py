@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from itly_sdk.internal import ColumnarBatch
+
+EVENTS = [
+    {"user_id": "user-1", "event_type": "Page Viewed", "event_properties": {"page": "home"}, "time": 1},
+    {"user_id": "user-2", "event_type": "Signed Up", "time": 2},
+    {"user_id": "user-1", "event_type": "Page Viewed", "event_properties": {"page": "docs"}, "time": 3,
+     "insert_id": "id-3"},
+]
+
+
+def test_columnar_batch_rows():
+    batch = ColumnarBatch()
+    batch.extend(EVENTS)
+
+    assert len(batch) == 3
+    assert list(batch.rows()) == EVENTS
+
+
+def test_columnar_batch_ndjson():
+    batch = ColumnarBatch()
+    assert batch.to_ndjson() == b''
+
+    batch.extend(EVENTS)
+    lines = batch.to_ndjson().decode('utf-8').splitlines()
+
+    assert [json.loads(line) for line in lines] == EVENTS
+    assert lines[1] == '{"user_id":"user-2","event_type":"Signed Up","time":2}'
+
+
+def test_columnar_batch_ndjson_matches_json_dumps():
+    events = [
+        {"event_type": "A", "time": 1, "flag": True, "ratio": 0.5, "name": "caf\u00e9 \"quoted\"\n"},
+        {"time": 2, "flag": False, "ratio": 1, "name": None, "tags": ["a", {"b": None}]},
+        {"event_type": "B", "time": 3, "flag": None, "ratio": float('inf'), "name": "x", "tags": []},
+    ]
+    batch = ColumnarBatch()
+    batch.extend(events)
+
+    expected = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+    assert batch.to_ndjson().decode('utf-8') == expected
+
+
+def test_columnar_batch_arrow_ipc():
+    pa = pytest.importorskip('pyarrow')
+
+    batch = ColumnarBatch()
+    batch.extend(EVENTS)
+    table = pa.ipc.open_stream(batch.to_arrow_ipc()).read_all()
+
+    assert table.num_rows == 3
+    assert pa.types.is_dictionary(table.schema.field('event_type').type)
+    assert table.column('event_type').to_pylist() == ['Page Viewed', 'Signed Up', 'Page Viewed']
+    assert table.column('event_properties').to_pylist() == ['{"page":"home"}', None, '{"page":"docs"}']
+    assert table.column('insert_id').to_pylist() == [None, None, 'id-3']
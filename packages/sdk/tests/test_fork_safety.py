@@ -0,0 +1,57 @@
+import os
+from datetime import timedelta
+from threading import Thread
+
+import pytest
+
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, register_after_fork
+
+
+class Uploader:
+    def __init__(self) -> None:
+        self.batches = []
+        self.queue = AsyncConsumer.create_queue()
+        self.consumer = self._create_consumer()
+        register_after_fork(self.reset_after_fork)
+        self.consumer.start()
+
+    def _create_consumer(self) -> AsyncConsumer:
+        return AsyncConsumer(message_queue=self.queue,
+                             do_upload=lambda batch, event: self.batches.append([msg.data for msg in batch]),
+                             flush_queue_size=10,
+                             flush_interval=timedelta(seconds=10))
+
+    def reset_after_fork(self) -> None:
+        self.queue = AsyncConsumer.create_queue()
+        self.consumer = self._create_consumer()
+        self.consumer.start()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or not hasattr(os, 'register_at_fork'), reason='requires os.fork')
+def test_consumer_restarted_after_fork():
+    uploader = Uploader()
+    uploader.queue.put(AsyncConsumerMessage(message_type='data', data='parent'))
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            uploader.queue.put(AsyncConsumerMessage(message_type='data', data='child'))
+            flush = Thread(target=uploader.consumer.flush, daemon=True)
+            flush.start()
+            flush.join(timeout=5)
+            os.write(write_fd, repr(uploader.batches).encode('utf-8'))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as child_output:
+        child_batches = child_output.read()
+    os.waitpid(pid, 0)
+
+    # Messages queued before the fork are uploaded by the parent only
+    assert child_batches == repr([['child']])
+    uploader.consumer.flush()
+    assert uploader.batches == [['parent']]
+    uploader.consumer.shutdown()
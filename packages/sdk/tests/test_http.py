@@ -0,0 +1,74 @@
+import asyncio
+from threading import Event
+from typing import List
+
+from itly_sdk import InMemoryMetrics
+from itly_sdk.internal import Delay, HttpRequest, HttpResponse, HttpTransportError, UploadSteps, run_upload, \
+    run_upload_async
+
+
+class FakeTransport:
+    def __init__(self, responses: List[object]) -> None:
+        self.requests: List[HttpRequest] = []
+        self._responses = responses
+
+    def send(self, request: HttpRequest) -> HttpResponse:
+        self.requests.append(request)
+        response = self._responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        assert isinstance(response, HttpResponse)
+        return response
+
+
+class FakeAsyncTransport(FakeTransport):
+    async def send(self, request: HttpRequest) -> HttpResponse:  # type: ignore
+        return FakeTransport.send(self, request)
+
+
+def retrying_steps(attempts: int) -> UploadSteps[int]:
+    for attempt in range(attempts):
+        if attempt > 0:
+            yield Delay(0.01)
+        try:
+            response = yield HttpRequest(url='http://localhost/upload', json={'attempt': attempt})
+        except HttpTransportError:
+            continue
+        assert response is not None
+        if response.status_code < 300:
+            return attempt
+    return -1
+
+
+def test_run_upload():
+    metrics = InMemoryMetrics()
+    transport = FakeTransport([HttpTransportError('refused'), HttpResponse(503), HttpResponse(200, b'{"code": 200}')])
+
+    assert run_upload(retrying_steps(3), transport, Event(), metrics) == 2  # type: ignore
+
+    assert [request.json for request in transport.requests] == [{'attempt': 0}, {'attempt': 1}, {'attempt': 2}]
+    assert metrics.counter('itly.client.responses', tags={'status': '503'}) == 1
+    assert metrics.counter('itly.client.responses', tags={'status': '200'}) == 1
+    assert len(metrics.histogram('itly.client.request_duration')) == 2
+
+
+def test_run_upload_stopped_during_delay():
+    stop_event = Event()
+    stop_event.set()
+    transport = FakeTransport([HttpResponse(503)])
+
+    assert run_upload(retrying_steps(3), transport, stop_event) is None  # type: ignore
+
+    assert len(transport.requests) == 1
+
+
+def test_run_upload_async():
+    transport = FakeAsyncTransport([HttpResponse(500), HttpTransportError('timeout'), HttpResponse(204)])
+
+    assert asyncio.run(run_upload_async(retrying_steps(3), transport)) == 2  # type: ignore
+
+    assert len(transport.requests) == 3
+
+
+def test_http_response_json():
+    assert HttpResponse(200, b'{"code": 200}').json() == {'code': 200}
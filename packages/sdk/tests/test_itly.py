@@ -1,11 +1,15 @@
 # flake8: noqa E501
 import enum
+import threading
+import time
+from datetime import timedelta
 from typing import List, Optional, Tuple
 
 import pytest
 
 from itly_sdk import Itly, Options, Environment, Event, Properties, Logger, \
-    Plugin, PluginLoadOptions, ValidationResponse, ValidationOptions
+    Plugin, PluginLoadOptions, ValidationResponse, ValidationOptions, SamplingRule, PluginRoute, DeduplicationOptions, \
+    ShutdownResult
 
 
 class CustomLogger(Logger):
@@ -90,6 +94,39 @@ class CustomPlugin(Plugin):
         return None
 
 
+class RecordingPlugin(Plugin):
+    def __init__(self, plugin_id: str) -> None:
+        self._plugin_id = plugin_id
+        self.tracked: List[Tuple[str, str]] = []
+        self.insert_ids: List[Optional[str]] = []
+
+    def id(self) -> str:
+        return self._plugin_id
+
+    def identify(self, user_id: str, properties: Optional[Properties]) -> None:
+        self.tracked.append((user_id, 'identify'))
+
+    def track(self, user_id: str, event: Event) -> None:
+        self.tracked.append((user_id, event.name))
+        self.insert_ids.append(event.insert_id)
+
+
+class BlockingPlugin(Plugin):
+    def __init__(self, plugin_id: str) -> None:
+        self._plugin_id = plugin_id
+        self.release = threading.Event()
+
+    def id(self) -> str:
+        return self._plugin_id
+
+    def flush(self) -> None:
+        self.release.wait()
+
+    # Plugin written before shutdown() had a timeout
+    def shutdown(self) -> None:  # type: ignore
+        self.release.wait()
+
+
 class RequiredEnum(enum.Enum):
     Enum1 = "Enum1"
     Enum2 = "Enum2"
@@ -496,3 +533,216 @@ def _check_validation_results(environment: Environment,
             itly.track('user-id', Event("event", Properties(invalid=True)))
         log_text = '\n'.join(logger.log_lines)
         assert expected_log == log_text
+
+
+def test_track_sampling_per_event_and_plugin() -> None:
+    warehouse = RecordingPlugin('warehouse')
+    expensive = RecordingPlugin('expensive')
+    itly = Itly()
+    itly.load(options=Options(
+        plugins=[warehouse, expensive],
+        sampling=[
+            SamplingRule(event_name='heartbeat', plugin_id='expensive', sample_rate=0.5),
+        ],
+    ))
+
+    user_ids = [f'user-{i}' for i in range(1000)]
+    for user_id in user_ids:
+        itly.track(user_id, Event('heartbeat'))
+        itly.track(user_id, Event('heartbeat'))
+        itly.track(user_id, Event('purchase'))
+
+    assert len(warehouse.tracked) == 3000
+    sampled_heartbeats = [user_id for user_id, name in expensive.tracked if name == 'heartbeat']
+    assert 800 < len(sampled_heartbeats) < 1200
+    # Sampling is deterministic per user
+    assert all(sampled_heartbeats.count(user_id) == 2 for user_id in sampled_heartbeats)
+    assert len([name for _, name in expensive.tracked if name == 'purchase']) == 1000
+
+
+def test_track_rate_limit() -> None:
+    warehouse = RecordingPlugin('warehouse')
+    expensive = RecordingPlugin('expensive')
+    itly = Itly()
+    itly.load(options=Options(
+        plugins=[warehouse, expensive],
+        sampling=[
+            SamplingRule(plugin_id='expensive', max_events_per_second=0.001, burst=2),
+            SamplingRule(event_name='debug', sample_rate=0.0),
+        ],
+    ))
+
+    for i in range(5):
+        itly.track('user-id', Event('impression'))
+        itly.track('user-id', Event('click'))
+    itly.track('user-id', Event('debug'))
+
+    assert len(warehouse.tracked) == 10
+    assert expensive.tracked == [('user-id', 'impression'), ('user-id', 'click')]
+
+
+def test_track_rate_limit_below_one_event_per_second() -> None:
+    expensive = RecordingPlugin('expensive')
+    itly = Itly()
+    itly.load(options=Options(
+        plugins=[expensive],
+        sampling=[SamplingRule(plugin_id='expensive', max_events_per_second=0.5)],
+    ))
+
+    for i in range(5):
+        itly.track('user-id', Event(f'event-{i}'))
+
+    # The bucket holds one token without a burst
+    assert expensive.tracked == [('user-id', 'event-0')]
+
+
+def test_routing() -> None:
+    warehouse = RecordingPlugin('warehouse')
+    braze = RecordingPlugin('braze')
+    debug = RecordingPlugin('debug')
+    itly = Itly()
+    itly.load(options=Options(
+        plugins=[warehouse, braze, debug],
+        routing=[
+            PluginRoute(plugin_id='braze', include_events=['Signed Up', 'Purchased']),
+            PluginRoute(plugin_id='debug', exclude_events=['heartbeat'], exclude_types=['identify']),
+        ],
+    ))
+
+    itly.identify('user-id')
+    itly.track('user-id', Event('Signed Up'))
+    itly.track('user-id', Event('heartbeat'))
+    itly.track('user-id', Event('Purchased'))
+
+    assert warehouse.tracked == [
+        ('user-id', 'identify'), ('user-id', 'Signed Up'), ('user-id', 'heartbeat'), ('user-id', 'Purchased'),
+    ]
+    assert braze.tracked == [('user-id', 'identify'), ('user-id', 'Signed Up'), ('user-id', 'Purchased')]
+    assert debug.tracked == [('user-id', 'Signed Up'), ('user-id', 'Purchased')]
+
+
+def test_invalid_event_routed_or_sampled_to_no_plugin_throws_error() -> None:
+    braze = RecordingPlugin('braze')
+    itly = Itly()
+    itly.load(options=Options(
+        plugins=[CustomPlugin(), braze],
+        validation=ValidationOptions(error_on_invalid=True),
+        routing=[
+            PluginRoute(plugin_id='custom', include_types=['identify']),
+            PluginRoute(plugin_id='braze', include_events=['Purchased']),
+        ],
+        sampling=[SamplingRule(event_name='Purchased', sample_rate=0.0)],
+    ))
+
+    # Routed to no plugin
+    with pytest.raises(ValueError) as ctx:
+        itly.track('user-id', Event('Signed Up', Properties(invalid=True)))
+    assert str(ctx.value) == 'invalid event!!!'
+
+    # Sampled out of all plugins
+    with pytest.raises(ValueError) as ctx:
+        itly.track('user-id', Event('Purchased', Properties(invalid=True)))
+    assert str(ctx.value) == 'invalid event!!!'
+
+    assert braze.tracked == []
+
+
+def test_track_sampled_to_no_plugin_skips_context_merge(monkeypatch) -> None:
+    braze = RecordingPlugin('braze')
+    itly = Itly()
+    itly.load(context=Properties(app='test'), options=Options(
+        plugins=[braze],
+        sampling=[SamplingRule(event_name='heartbeat', sample_rate=0.0)],
+    ))
+
+    def concat(properties: List[Optional[Properties]]) -> Optional[Properties]:
+        raise AssertionError('context merged')
+
+    monkeypatch.setattr(Properties, 'concat', concat)
+    itly.track('user-id', Event('heartbeat', Properties(count=1)))
+
+    assert braze.tracked == []
+
+
+def test_routing_unknown_call_type_throws_error() -> None:
+    itly = Itly()
+    with pytest.raises(ValueError) as ctx:
+        itly.load(options=Options(
+            plugins=[RecordingPlugin('braze')],
+            routing=[PluginRoute(plugin_id='braze', include_types=['screen'])],
+        ))
+
+    assert str(ctx.value) == "Unknown call type 'screen' in route for plugin 'braze'."
+
+
+def test_track_deduplication() -> None:
+    plugin = RecordingPlugin('recording')
+    itly = Itly()
+    itly.load(options=Options(
+        plugins=[plugin],
+        deduplication=DeduplicationOptions(
+            window=timedelta(minutes=1),
+            max_size=2,
+            compute_insert_id=lambda user_id, event: event.properties.to_json().get('job_id')
+            if event.properties is not None else None,
+        ),
+    ))
+
+    itly.track('user-1', Event('event-1', insert_id='id-1'))
+    itly.track('user-1', Event('event-1', insert_id='id-1'))
+    itly.track('user-1', Event('event-2', Properties(job_id='job-1')))
+    itly.track('user-1', Event('event-2', Properties(job_id='job-1')))
+    itly.track('user-1', Event('event-3'))
+    itly.track('user-1', Event('event-3'))
+    # Exceeds max_size, 'id-1' is forgotten
+    itly.track('user-1', Event('event-4', insert_id='id-2'))
+    itly.track('user-1', Event('event-1', insert_id='id-1'))
+
+    assert plugin.tracked == [
+        ('user-1', 'event-1'), ('user-1', 'event-2'), ('user-1', 'event-3'), ('user-1', 'event-3'),
+        ('user-1', 'event-4'), ('user-1', 'event-1'),
+    ]
+    assert plugin.insert_ids == ['id-1', 'job-1', None, None, 'id-2', 'id-1']
+
+
+def test_flush_timeout() -> None:
+    blocking = BlockingPlugin('blocking')
+    itly = Itly()
+    itly.load(options=Options(plugins=[RecordingPlugin('recording'), blocking]))
+
+    start = time.monotonic()
+    assert itly.flush(timeout=timedelta(milliseconds=100)) == {'recording': True, 'blocking': False}
+    assert time.monotonic() - start < 1
+
+    blocking.release.set()
+    assert itly.flush() == {'recording': True, 'blocking': True}
+
+
+def test_flush_async() -> None:
+    blocking = BlockingPlugin('blocking')
+    itly = Itly()
+    itly.load(options=Options(plugins=[RecordingPlugin('recording'), blocking]))
+
+    future = itly.flush_async()
+    time.sleep(0.1)
+    assert not future.done()
+
+    blocking.release.set()
+    assert future.result(timeout=1) == {'recording': True, 'blocking': True}
+
+
+def test_shutdown_timeout() -> None:
+    blocking = BlockingPlugin('blocking')
+    logger = CustomLogger()
+    itly = Itly()
+    itly.load(options=Options(plugins=[RecordingPlugin('recording'), blocking], logger=logger))
+
+    start = time.monotonic()
+    assert itly.shutdown(timeout=timedelta(milliseconds=100)) == {
+        'recording': ShutdownResult(),
+        'blocking': ShutdownResult(timed_out=True),
+    }
+    assert time.monotonic() - start < 1
+    assert logger.log_lines[-1] == \
+        "[itly-core] shutdown() did not deliver all events: spilled=0, dropped=0, timed_out=['blocking']"
+    blocking.release.set()
@@ -0,0 +1,82 @@
+import socket
+from typing import Optional, List
+
+from itly_sdk import Itly, Options, Plugin, PluginLoadOptions, Event, Metrics, InMemoryMetrics, StatsdMetrics
+
+
+class MetricsPlugin(Plugin):
+    def __init__(self) -> None:
+        self._metrics: Metrics = Metrics.NONE
+
+    def id(self) -> str:
+        return 'metrics'
+
+    def load(self, options: PluginLoadOptions) -> None:
+        self._metrics = options.metrics
+
+    def track(self, user_id: str, event: Event) -> None:
+        self._metrics.increment('tracked', tags={'event': event.name})
+        self._metrics.observe('size', 3)
+
+
+class FailingMetrics(InMemoryMetrics):
+    def increment(self, name: str, value: float = 1, tags: Optional[dict] = None) -> None:
+        raise ValueError('metrics sink is down')
+
+
+def test_in_memory_metrics():
+    metrics = InMemoryMetrics(max_samples=2)
+    metrics.increment('counter')
+    metrics.increment('counter', 2, tags={'status': '200'})
+    metrics.gauge('gauge', 5)
+    metrics.gauge('gauge', 7)
+    metrics.observe('histogram', 1)
+    metrics.observe('histogram', 2)
+    metrics.observe('histogram', 3)
+
+    assert metrics.counter('counter') == 3
+    assert metrics.counter('counter', tags={'status': '200'}) == 2
+    assert metrics.counter('unknown') == 0
+    assert metrics.gauge_value('gauge') == 7
+    assert metrics.gauge_value('unknown') is None
+    assert metrics.histogram('histogram') == [2, 3]
+
+
+def test_statsd_metrics():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(1)
+    try:
+        metrics = StatsdMetrics(host='127.0.0.1', port=server.getsockname()[1], prefix='app.')
+        metrics.increment('itly.client.responses', tags={'plugin': 'amplitude', 'status': '200'})
+        metrics.gauge('itly.consumer.queue_depth', 5)
+        metrics.observe('itly.consumer.batch_size', 10)
+
+        lines: List[bytes] = [server.recv(1024) for _ in range(3)]
+    finally:
+        server.close()
+
+    assert lines == [
+        b'app.itly.client.responses:1|c|#plugin:amplitude,status:200',
+        b'app.itly.consumer.queue_depth:5|g',
+        b'app.itly.consumer.batch_size:10|h',
+    ]
+
+
+def test_plugin_metrics_are_tagged():
+    metrics = InMemoryMetrics()
+    itly = Itly()
+    itly.load(options=Options(plugins=[MetricsPlugin()], metrics=metrics))
+    itly.track('user-id', Event('event-1'))
+
+    assert metrics.counter('tracked', tags={'plugin': 'metrics', 'event': 'event-1'}) == 1
+    assert metrics.histogram('size', tags={'plugin': 'metrics'}) == [3]
+
+
+def test_failing_metrics_do_not_break_tracking():
+    metrics = FailingMetrics()
+    itly = Itly()
+    itly.load(options=Options(plugins=[MetricsPlugin()], metrics=metrics))
+    itly.track('user-id', Event('event-1'))
+
+    assert metrics.histogram('size') == [3]
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+from datetime import timedelta
+from threading import Thread
+
+from itly_sdk.internal import AsyncConsumer, AsyncConsumerMessage, SharedUploaderClient, SharedUploaderServer
+
+
+def test_shared_uploader(tmp_path):
+    socket_path = str(tmp_path / 'uploader.sock')
+    batches = []
+    errors = []
+
+    q = AsyncConsumer.create_queue()
+    consumer = AsyncConsumer(
+        message_queue=q,
+        do_upload=lambda batch, event: batches.append([(msg.message_type, msg.data) for msg in batch]),
+        flush_queue_size=10,
+        flush_interval=timedelta(seconds=10)
+    )
+    consumer.start()
+    server = SharedUploaderServer(socket_path, enqueue=q.put, flush=consumer.flush,
+                                  idle_timeout=timedelta(milliseconds=100))
+    server_thread = Thread(target=server.serve_forever, daemon=True)
+
+    # The server is started on the first message
+    first = SharedUploaderClient(socket_path, start_server=server_thread.start, on_error=errors.append)
+    second = SharedUploaderClient(socket_path, start_server=server_thread.start, on_error=errors.append)
+    try:
+        first.put(AsyncConsumerMessage(message_type='events', data={'event': 1}))
+        second.put(AsyncConsumerMessage(message_type='events', data={'event': 2}))
+        first.put(AsyncConsumerMessage(message_type='events', data={'event': 3}))
+        second.flush()
+
+        assert len(batches) == 1
+        assert sorted(batches[0], key=lambda m: m[1]['event']) == [
+            ('events', {'event': 1}),
+            ('events', {'event': 2}),
+            ('events', {'event': 3}),
+        ]
+        assert errors == []
+    finally:
+        first.close()
+        second.close()
+        server_thread.join(timeout=5)
+        consumer.shutdown()
+
+    # Server stops once all clients disconnected and removes the socket
+    assert not server_thread.is_alive()
+    assert not os.path.exists(socket_path)
+
+
+def test_shared_uploader_single_server(tmp_path):
+    socket_path = str(tmp_path / 'uploader.sock')
+    received = []
+
+    server = SharedUploaderServer(socket_path, enqueue=received.append, flush=lambda: None,
+                                  idle_timeout=timedelta(milliseconds=100))
+    server_thread = Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    client = SharedUploaderClient(socket_path, start_server=lambda: None, on_error=lambda err: None)
+    try:
+        client.flush()
+
+        # A second server for the same socket exits immediately
+        SharedUploaderServer(socket_path, enqueue=received.append, flush=lambda: None).serve_forever()
+
+        client.put(AsyncConsumerMessage(message_type='events', data='1'))
+        client.flush()
+        assert received == [AsyncConsumerMessage(message_type='events', data='1')]
+    finally:
+        client.close()
+        server_thread.join(timeout=5)
+
+
+def test_shared_uploader_query(tmp_path):
+    socket_path = str(tmp_path / 'uploader.sock')
+
+    server = SharedUploaderServer(socket_path, enqueue=lambda message: None, flush=lambda: None,
+                                  idle_timeout=timedelta(milliseconds=100),
+                                  queries={'state': lambda: {'events': ['a\nb', 'ü']}})
+    server_thread = Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    errors = []
+    client = SharedUploaderClient(socket_path, start_server=lambda: None, on_error=errors.append)
+    try:
+        assert client.query('state') == {'events': ['a\nb', 'ü']}
+        assert client.query('unknown') is None
+        assert errors == []
+    finally:
+        client.close()
+        server_thread.join(timeout=5)
+
+
+def test_shared_uploader_without_fcntl():
+    # Platforms without fcntl (Windows) can import the SDK, only creating a shared uploader fails
+    code = "\n".join([
+        "import sys",
+        "sys.modules['fcntl'] = None",
+        "import itly_sdk",
+        "from itly_sdk.internal import SharedUploaderClient",
+        "try:",
+        "    SharedUploaderClient('uploader.sock', start_server=lambda: None, on_error=print)",
+        "except ImportError:",
+        "    sys.exit(0)",
+        "sys.exit(1)",
+    ])
+    result = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    assert result.returncode == 0
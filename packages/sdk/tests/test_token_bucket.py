@@ -0,0 +1,64 @@
+import time
+
+from itly_sdk.internal import FileTokenBucket, KeyedTokenBucket, TokenBucket
+
+
+def test_keyed_token_bucket():
+    bucket = KeyedTokenBucket(rate=10, capacity=2)
+
+    assert bucket.try_acquire('user-1')
+    assert bucket.try_acquire('user-1')
+    assert not bucket.try_acquire('user-1')
+    # Other keys are not affected
+    assert bucket.try_acquire('user-2')
+
+    time.sleep(0.15)
+    assert bucket.try_acquire('user-1')
+    assert not bucket.try_acquire('user-1')
+
+
+def test_keyed_token_bucket_evicts_least_recently_used():
+    bucket = KeyedTokenBucket(rate=0.001, capacity=1, max_keys=2)
+
+    assert bucket.try_acquire('user-1')
+    assert bucket.try_acquire('user-2')
+    assert not bucket.try_acquire('user-1')
+    # Evicts user-2, used less recently than user-1
+    assert bucket.try_acquire('user-3')
+
+    assert not bucket.try_acquire('user-1')
+    assert bucket.try_acquire('user-2')
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.reserve() <= 0.2
+
+
+def test_keyed_token_bucket_reserve():
+    bucket = KeyedTokenBucket(rate=10, capacity=1)
+
+    assert bucket.reserve('user-1') == 0
+    assert 0.09 < bucket.reserve('user-1') <= 0.1
+    assert 0.19 < bucket.reserve('user-1') <= 0.2
+    # Other keys are not affected
+    assert bucket.reserve('user-2') == 0
+    assert not bucket.try_acquire('user-1')
+
+
+def test_file_token_bucket_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'bucket')
+    first = FileTokenBucket(path, rate=10, capacity=2)
+    second = FileTokenBucket(path, rate=10, capacity=2)
+
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert 0.09 < first.reserve() <= 0.1
+    assert 0.19 < second.reserve() <= 0.2
+
+    time.sleep(0.3)
+    assert first.reserve() == 0
@@ -0,0 +1,77 @@
+from typing import Any, Dict, List
+
+from itly_sdk import Itly, Options, Plugin, Event, Properties, StageTimingAggregator, OpenTelemetryTracer, Tracer
+
+
+class NoopPlugin(Plugin):
+    def id(self) -> str:
+        return 'noop'
+
+    def track(self, user_id: str, event: Event) -> None:
+        pass
+
+
+class FakeSpan:
+    def __init__(self, spans: List[Dict[str, Any]], name: str, attributes: Dict[str, str], start_time: int) -> None:
+        self._span = {'name': name, 'attributes': attributes, 'start_time': start_time}
+        spans.append(self._span)
+
+    def end(self, end_time: int) -> None:
+        self._span['end_time'] = end_time
+
+
+class FakeOpenTelemetryTracer:
+    def __init__(self) -> None:
+        self.spans: List[Dict[str, Any]] = []
+
+    def start_span(self, name: str, attributes: Dict[str, str], start_time: int) -> FakeSpan:
+        return FakeSpan(self.spans, name, attributes, start_time)
+
+
+class FailingTracer(Tracer):
+    def record(self, name: str, start_time: float, duration: float, attributes: Dict[str, str]) -> None:
+        raise ValueError('tracer is broken')
+
+
+def test_stage_timing_aggregator():
+    aggregator = StageTimingAggregator()
+    itly = Itly()
+    itly.load(context=Properties(app='test'), options=Options(plugins=[NoopPlugin()], tracer=aggregator))
+    for i in range(10):
+        itly.track('user-id', Event('event-1'))
+
+    summary = aggregator.summary()
+    assert sorted(summary.keys()) == [
+        'itly.merge_context',
+        'itly.plugin.noop.load',
+        'itly.plugin.noop.post_track',
+        'itly.plugin.noop.track',
+        'itly.plugin.noop.validate',
+        'itly.run_plugins',
+        'itly.run_post_plugins',
+        'itly.validate',
+    ]
+    assert summary['itly.plugin.noop.track']['count'] == 10
+    assert summary['itly.plugin.noop.validate']['count'] == 20
+    assert 0 <= summary['itly.validate']['p50'] <= summary['itly.validate']['p99']
+
+    aggregator.reset()
+    assert aggregator.summary() == {}
+
+
+def test_open_telemetry_tracer():
+    otel_tracer = FakeOpenTelemetryTracer()
+    itly = Itly()
+    itly.load(options=Options(plugins=[NoopPlugin()], tracer=OpenTelemetryTracer(otel_tracer)))
+    itly.track('user-id', Event('event-1'))
+
+    spans = [span for span in otel_tracer.spans if span['name'] == 'itly.plugin.noop.track']
+    assert len(spans) == 1
+    assert spans[0]['attributes'] == {'event': 'event-1'}
+    assert spans[0]['start_time'] <= spans[0]['end_time']
+
+
+def test_failing_tracer_does_not_break_tracking():
+    itly = Itly()
+    itly.load(options=Options(plugins=[NoopPlugin()], tracer=FailingTracer()))
+    itly.track('user-id', Event('event-1'))